@@ -1,36 +1,122 @@
-import pandas as pd
-from dbfread import DBF
+"""
+Importación del DBF de Lotus a public.mi_tabla con un campo id_unico autoincremental.
+El DBF se lee por bloques (tamano_bloque) y se carga con to_sql o con COPY (PostgreSQL)
+en una sola transacción: si la importación falla, mi_tabla queda como estaba.
+actualizar_registros reemplaza solo algunos registros (la carga incremental del vigilante)
+"""
+
+import hashlib
+import logging
+from itertools import islice
+from importacion_diferida import importar_diferido
 from database_connection import DatabaseConnection
 
-# Crear instancia de conexión a la base de datos
-db = DatabaseConnection()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+pd = importar_diferido('pandas')
+sqlalchemy = importar_diferido('sqlalchemy')
+
+RUTA_DBF = 'BaseDatosDBF/avaluos2.dbf'
+CARGADORES_DBF = ('to_sql', 'copy')
+
+
+def abrir_dbf(ruta=RUTA_DBF):
+    """Registros del DBF como diccionarios, en el orden del archivo (el id_unico es la posición)"""
+    from dbfread import DBF
+    return iter(DBF(ruta, encoding='latin-1'))
+
+
+def huella_registro(registro):
+    """Hash corto del contenido de un registro del DBF, para detectar registros modificados"""
+    return hashlib.blake2b(repr(list(registro.values())).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def leer_dbf_por_bloques(ruta=RUTA_DBF, tamano_bloque=None, limite=None):
+    """DataFrames de hasta `tamano_bloque` registros del DBF (todo en uno si es None), con id_unico"""
+    registros = abrir_dbf(ruta)
+    if limite is not None:
+        registros = islice(registros, limite)
+    # Usar un contador corrido para generar IDs únicos desde 1 hasta el número de filas
+    siguiente_id = 1
+    while True:
+        df = pd.DataFrame(list(islice(registros, tamano_bloque)))
+        if df.empty:
+            return
+        df['id_unico'] = range(siguiente_id, siguiente_id + len(df))
+        siguiente_id += len(df)
+        yield df
+
 
-# Leer el archivo DBF
-tabla = DBF('BaseDatosDBF/avaluos2.dbf', encoding='latin-1')
-df = pd.DataFrame(iter(tabla))
+def _crear_mi_tabla(conexion, df):
+    """
+    Reemplazar mi_tabla con los tipos que to_sql deduce del primer bloque, para que
+    COPY deje las mismas columnas numéricas y de fecha que la carga con to_sql
+    """
+    conexion.execute(sqlalchemy.text("DROP TABLE IF EXISTS public.mi_tabla"))
+    conexion.exec_driver_sql(pd.io.sql.get_schema(df, 'mi_tabla', con=conexion, schema='public'))
 
-# Agregar campo id_unico autoincremental y único
-# Usar range para generar IDs únicos desde 1 hasta el número de filas
-df['id_unico'] = range(1, len(df) + 1)
 
-print(f"✅ Agregado campo id_unico con {len(df)} registros únicos")
-print(f"📊 Rango de IDs: {df['id_unico'].min()} - {df['id_unico'].max()}")
+def importar_dbf(ruta=RUTA_DBF, db_connection=None, cargador='to_sql', tamano_bloque=None, limite=None,
+                 simulacion=False):
+    """Reemplazar public.mi_tabla por el contenido del DBF; devuelve los registros importados"""
+    if cargador not in CARGADORES_DBF:
+        raise ValueError(f"cargador debe ser uno de {CARGADORES_DBF}, no '{cargador}'")
+    bloques = leer_dbf_por_bloques(ruta, tamano_bloque, limite)
+    if simulacion:
+        total = sum(len(df) for df in bloques)
+        logger.info(f"🧪 Simulación: {total} registros leídos de {ruta}, mi_tabla no se modificó")
+        return total
 
-# Verificar que no hay duplicados
-if df['id_unico'].duplicated().any():
-    print("⚠️ ADVERTENCIA: Se encontraron IDs duplicados")
-else:
-    print("✅ Verificación: No hay IDs duplicados")
+    # Crear instancia de conexión a la base de datos si no se recibió una
+    propia = db_connection is None
+    db = db_connection or DatabaseConnection()
+    try:
+        if cargador == 'copy' and not db.es_postgresql:
+            raise ValueError("cargador='copy' requiere PostgreSQL")
+        total = 0
+        with db.get_engine('bulk_load').begin() as conexion:
+            for numero, df in enumerate(bloques, start=1):
+                if cargador == 'copy':
+                    from etl_avaluos import copiar_dataframe
+                    if numero == 1:
+                        _crear_mi_tabla(conexion, df)
+                    copiar_dataframe(conexion, df, 'public.mi_tabla', list(df.columns))
+                else:
+                    # El primer bloque reemplaza la tabla y define sus tipos; los siguientes se agregan
+                    df.to_sql('mi_tabla', conexion, schema='public', if_exists='replace' if numero == 1 else 'append',
+                              index=False)
+                total += len(df)
+                logger.info(f"📦 Bloque {numero} importado: {total} registros acumulados")
+            if cargador == 'copy' and total:
+                conexion.execute(sqlalchemy.text(
+                    'CREATE INDEX IF NOT EXISTS idx_mi_tabla_id_unico ON public.mi_tabla ("id_unico")'))
+        logger.info(f"✅ Conversión completada con éxito: {total} registros en mi_tabla (id_unico 1 - {total})")
+        return total
+    finally:
+        # Cerrar la conexión solo si se abrió aquí
+        if propia:
+            db.close_connection()
 
-# Convertir tipos de datos si es necesario
-# Por ejemplo, convertir fechas:
-# df['fecha'] = pd.to_datetime(df['fecha'])
 
-# Guardar en PostgreSQL usando la conexión de la clase
-df.to_sql('mi_tabla', db.get_engine(), if_exists='replace', index=False)
+def actualizar_registros(df, db_connection, eliminar_desde=None):
+    """
+    Reemplazar en mi_tabla los registros del DataFrame (por id_unico) en una sola transacción.
+    Con eliminar_desde también se borran los id_unico desde ese valor (registros que ya no están en el DBF)
+    """
+    from etl_avaluos import condicion_rangos, rangos_consecutivos
+    with db_connection.get_engine('bulk_load').begin() as conexion:
+        if len(df):
+            condicion = condicion_rangos('id_unico', rangos_consecutivos(df['id_unico'].tolist()))
+            conexion.execute(sqlalchemy.text(f"DELETE FROM public.mi_tabla WHERE {condicion}"))
+        if eliminar_desde is not None:
+            conexion.execute(sqlalchemy.text('DELETE FROM public.mi_tabla WHERE "id_unico" >= :desde'),
+                             {'desde': int(eliminar_desde)})
+        if len(df):
+            df.to_sql('mi_tabla', conexion, schema='public', if_exists='append', index=False)
+    logger.info(f"✅ mi_tabla actualizada: {len(df)} registros reemplazados")
+    return len(df)
 
-print("✅ Conversión completada con éxito")
-print(f"📊 Total de registros insertados: {len(df)}")
 
-# Cerrar la conexión
-db.close_connection()
\ No newline at end of file
+if __name__ == "__main__":
+    importar_dbf()
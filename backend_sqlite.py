@@ -0,0 +1,86 @@
+"""
+Backend embebido (SQLite) para correr el ETL completo sin red: la base local se adjunta
+como esquema `public`, así las consultas `public.mi_tabla`, `public.vehicle_appraisal`
+y `public.appraisal_deductions` funcionan igual que en PostgreSQL
+"""
+
+import hashlib
+import sqlite3
+
+RUTA_POR_DEFECTO = 'etl_local.sqlite'
+
+# Columnas de mi_tabla que lee la extracción (campos del DBF de Lotus, como texto)
+COLUMNAS_MI_TABLA = [
+    'CILINDRADA', 'COMBUSTIBL', 'NUMERO_CER', 'SOLICITANT', 'PROPIETARI', 'MARCA', 'MODELO',
+    'A_O', 'KMS', 'ORIGEN', 'COLOR', 'PLACAS', 'NOTA', 'ACCESORIOS', 'VIN_CHASIS',
+    '__VIN_DE_C', '__VIN_DE_M', 'VIN_DE_MOT', 'TOTAL_DE_R', 'MODIF_KM', 'VALOR_EXTR',
+    'DESCUENTOS', 'AV_BANC_NU', 'AVALUO_BAN', '_FECHAS_1', 'AVALUO_DIS', 'VALOR_GIBS',
+    'AV_DIST_NU', 'MOTOR1', 'MOTOR2', 'TRANSMISIO', 'TRANSMICIO', 'SUSPENSION', 'SUSPENSIO2',
+    'DIRECCION', 'DIRECCION2', 'FRENOS', 'FRENOS2', 'LLANTAS', 'RUEDAS', 'SIST_ELECT',
+    'SISTELEC2', 'INTYACC2', 'INTERIOR_Y', 'CARROCERI2', 'MOTOR_',
+]
+
+# Equivalente local de las tablas de PostgreSQL (tipos por afinidad de SQLite)
+ESQUEMA = [
+    'CREATE TABLE IF NOT EXISTS public.mi_tabla ("id_unico" INTEGER, '
+    + ', '.join(f'"{columna}" TEXT' for columna in COLUMNAS_MI_TABLA) + ')',
+    'CREATE INDEX IF NOT EXISTS public.idx_mi_tabla_id_unico ON mi_tabla ("id_unico")',
+    """
+    CREATE TABLE IF NOT EXISTS public.vehicle_appraisal (
+        vehicle_appraisal_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        appraisal_date DATE, vehicle_description TEXT, brand TEXT, model_year INTEGER,
+        color TEXT, mileage INTEGER, fuel_type TEXT, engine_size NUMERIC, plate_number TEXT,
+        applicant TEXT, owner TEXT, appraisal_value_usd REAL, appraisal_value_trochez REAL,
+        vin TEXT, engine_number TEXT, notes TEXT, validity_days INTEGER, validity_kms INTEGER,
+        apprasail_value_lower_cost REAL, apprasail_value_bank REAL, apprasail_value_lower_bank REAL,
+        extras TEXT, vin_card TEXT, engine_number_card TEXT, total_deductions REAL,
+        modified_km INTEGER, extra_value REAL, discounts REAL, bank_value_in_dollars REAL,
+        referencia_original INTEGER, cert REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.appraisal_deductions (
+        appraisal_deduction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vehicle_appraisal_id INTEGER NOT NULL REFERENCES vehicle_appraisal (vehicle_appraisal_id),
+        amount REAL,
+        description TEXT
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS public.idx_appraisal_deductions_vehicle_appraisal_id '
+    'ON appraisal_deductions (vehicle_appraisal_id)',
+]
+
+# Hora actual con milisegundos: CURRENT_TIMESTAMP de SQLite solo tiene segundos y empata
+# ejecuciones o checkpoints registrados en el mismo segundo
+MARCA_TIEMPO = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Límite de parámetros por sentencia (SQLITE_MAX_VARIABLE_NUMBER; 999 antes de la 3.32)
+MAX_PARAMETROS = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+
+
+def hash_texto(texto):
+    """Hash de 32 bits con signo de un texto, estable entre procesos (como hashtext de PostgreSQL)"""
+    if texto is None:
+        return None
+    digest = hashlib.blake2b(str(texto).encode('utf-8'), digest_size=4).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def conectar(ruta, timeout=30):
+    """Abrir una conexión con la base local adjunta como esquema public"""
+    conexion = sqlite3.connect(':memory:', timeout=timeout, check_same_thread=False)
+    conexion.execute("ATTACH DATABASE ? AS public", (ruta,))
+    # WAL permite leer mientras otra conexión del pool escribe
+    conexion.execute("PRAGMA public.journal_mode=WAL")
+    conexion.execute("PRAGMA public.synchronous=NORMAL")
+    conexion.execute("PRAGMA foreign_keys=ON")
+    # Para la huella de mi_tabla de la caché de etapas
+    conexion.create_function('hash_texto', 1, hash_texto, deterministic=True)
+    return conexion
+
+
+def crear_esquema(conexion):
+    """Crear mi_tabla, vehicle_appraisal y appraisal_deductions si no existen"""
+    for sentencia in ESQUEMA:
+        conexion.execute(sentencia)
+    conexion.commit()
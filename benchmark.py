@@ -0,0 +1,236 @@
+"""
+Benchmarks del ETL sobre mi_tabla sintética (datos_sinteticos.py): mide transformar_datos,
+procesar_deducciones y la ejecución completa con cada modo de carga, en filas por segundo
+y pico de memoria RSS, y agrega cada resultado con el commit medido a un historial JSONL
+para seguir el rendimiento entre commits
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from importacion_diferida import importar_diferido
+from datos_sinteticos import TAMANO_BLOQUE, cargar_mi_tabla, generar_por_bloques, interpretar_filas
+from instrumentacion import pico_rss_mb, reiniciar_pico_rss
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+sqlalchemy = importar_diferido('sqlalchemy')
+
+ARCHIVO_RESULTADOS = 'bench_resultados.jsonl'
+ETAPAS = ('transformar_datos', 'procesar_deducciones', 'carga')
+
+# Opciones de ETLAvaluos por modo de carga; los bloques se fijan con --tamano-bloque
+CARGADORES = {
+    'append': {},
+    'pipeline': {'tamano_bloque': True},
+    'workers': {'tamano_bloque': True, 'workers': 4},
+    'preasignar_ids': {'preasignar_ids': True},
+    'upsert': {'modo_carga': 'upsert'},
+    'cte': {'modo_carga': 'cte', 'tamano_bloque': True},
+    'asincrona': {'carga_asincrona': True, 'tamano_bloque': True},
+    'copy': {'cargador': 'copy', 'tamano_bloque': True},
+}
+SOLO_POSTGRESQL = ('preasignar_ids', 'upsert', 'cte', 'asincrona', 'copy')
+
+
+def commit_actual():
+    """Commit medido (abreviado) y si el árbol tiene cambios sin confirmar"""
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=raiz,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        cambios = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=raiz,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(cambios)
+
+
+class Benchmark:
+    """
+    Ejecuta las etapas sobre `filas` registros sintéticos y acumula un resultado por etapa
+    """
+
+    def __init__(self, filas, semilla=42, tamano_bloque=TAMANO_BLOQUE, workers=4,
+                 archivo_resultados=ARCHIVO_RESULTADOS):
+        self.filas = interpretar_filas(filas)
+        self.semilla = semilla
+        self.tamano_bloque = tamano_bloque
+        self.workers = workers
+        self.archivo_resultados = archivo_resultados
+        self.commit, self.cambios_sin_confirmar = commit_actual()
+        self.resultados = []
+
+    def _registrar(self, etapa, segundos, pico_mb, **extra):
+        resultado = {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': self.commit,
+            'cambios_sin_confirmar': self.cambios_sin_confirmar,
+            'etapa': etapa,
+            'filas': self.filas,
+            'semilla': self.semilla,
+            'segundos': round(segundos, 3),
+            'filas_por_segundo': round(self.filas / segundos, 1) if segundos > 0 else None,
+            'pico_rss_mb': pico_mb,
+            'python': platform.python_version(),
+        }
+        resultado.update(extra)
+        self.resultados.append(resultado)
+        logger.info(f"⏱️ {etapa}: {resultado['segundos']} s, {resultado['filas_por_segundo']} filas/s, "
+                    f"pico RSS {pico_mb} MB")
+        return resultado
+
+    def medir_transformacion(self, etapas=('transformar_datos', 'procesar_deducciones')):
+        """Tiempo de transformar_datos y de procesar_deducciones, bloque a bloque"""
+        from etl_avaluos import ETLAvaluos
+        etl = ETLAvaluos()
+        segundos = dict.fromkeys(etapas, 0.0)
+        picos = dict.fromkeys(etapas, 0.0)
+        deducciones = 0
+        for df in generar_por_bloques(self.filas, self.semilla, self.tamano_bloque):
+            # Los IDs de vehicle_appraisal se simulan con el propio id_unico
+            ids = dict(zip(df['id_unico'], df['id_unico']))
+            funciones = {'transformar_datos': lambda: etl.transformar_datos(df),
+                         'procesar_deducciones': lambda: etl.procesar_deducciones(df, ids)}
+            for etapa in etapas:
+                funcion = funciones[etapa]
+                reiniciar_pico_rss()
+                inicio = time.perf_counter()
+                resultado = funcion()
+                segundos[etapa] += time.perf_counter() - inicio
+                picos[etapa] = max(picos[etapa], pico_rss_mb() or 0.0)
+                if resultado is None:
+                    raise RuntimeError(f"{etapa} falló sobre los datos sintéticos")
+                if etapa == 'procesar_deducciones':
+                    deducciones += len(resultado)
+        for etapa in etapas:
+            extra = {'deducciones': deducciones} if etapa == 'procesar_deducciones' else {}
+            self._registrar(etapa, segundos[etapa], picos[etapa], **extra)
+
+    def _vaciar_destino(self, db_connection):
+        with db_connection.get_engine().begin() as conexion:
+            for tabla in ('appraisal_deductions', 'vehicle_appraisal', 'etl_checkpoints', 'etl_runs'):
+                if sqlalchemy.inspect(conexion).has_table(tabla, schema='public'):
+                    conexion.execute(sqlalchemy.text(f"DELETE FROM public.{tabla}"))
+
+    def medir_cargas(self, db_connection, cargadores):
+        """ETL completo (extracción, transformación y carga) con cada modo de carga"""
+        from etl_avaluos import ETLAvaluos
+        backend = db_connection.backend
+        cargar_mi_tabla(db_connection, self.filas, self.semilla, self.tamano_bloque)
+        for nombre in cargadores:
+            if nombre in SOLO_POSTGRESQL and not db_connection.es_postgresql:
+                logger.info(f"⏭️ Carga '{nombre}' omitida: requiere PostgreSQL")
+                continue
+            opciones = dict(CARGADORES[nombre])
+            if opciones.get('tamano_bloque'):
+                opciones['tamano_bloque'] = self.tamano_bloque
+            if 'workers' in opciones:
+                opciones['workers'] = self.workers
+            self._vaciar_destino(db_connection)
+            etl = ETLAvaluos(directorio_reportes=None, **opciones)
+            inicio = time.perf_counter()
+            exito = etl.ejecutar_etl()
+            segundos = time.perf_counter() - inicio
+            # Los spans del ETL reinician el pico de RSS: el de la ejecución completa está en su reporte
+            etapas = etl.instrumentacion.etapas()
+            if not exito:
+                logger.error(f"❌ La carga '{nombre}' falló; no se registra su tiempo")
+                continue
+            with db_connection.get_engine().connect() as conexion:
+                cargados = conexion.execute(sqlalchemy.text("SELECT COUNT(*) FROM public.vehicle_appraisal")).scalar()
+            self._registrar(f"carga:{nombre}", segundos, etapas['ejecucion']['pico_rss_mb'], backend=backend,
+                            filas_cargadas=cargados,
+                            etapas={etapa: valores['segundos'] for etapa, valores in etapas.items()})
+        self._vaciar_destino(db_connection)
+
+    def guardar(self):
+        """Agregar los resultados al historial JSONL"""
+        with open(self.archivo_resultados, 'a', encoding='utf-8') as archivo:
+            for resultado in self.resultados:
+                archivo.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+        return self.archivo_resultados
+
+
+def comparar_con_anterior(resultados, archivo=ARCHIVO_RESULTADOS):
+    """Variación de filas/s y pico de RSS respecto de la última medición de otro commit"""
+    try:
+        with open(archivo, encoding='utf-8') as historial:
+            anteriores = [json.loads(linea) for linea in historial if linea.strip()]
+    except FileNotFoundError:
+        return []
+    comparaciones = []
+    for actual in resultados:
+        previos = [r for r in anteriores if r['etapa'] == actual['etapa'] and r['filas'] == actual['filas']
+                   and r.get('backend') == actual.get('backend') and r['commit'] != actual['commit']]
+        if not previos or not previos[-1].get('filas_por_segundo') or not actual.get('filas_por_segundo'):
+            continue
+        previo = previos[-1]
+        comparaciones.append({
+            'etapa': actual['etapa'],
+            'commit_anterior': previo['commit'],
+            'variacion_filas_por_segundo_pct': round(100 * (actual['filas_por_segundo'] / previo['filas_por_segundo'] - 1), 1),
+            'variacion_pico_rss_mb': round((actual['pico_rss_mb'] or 0) - (previo['pico_rss_mb'] or 0), 1),
+        })
+    return comparaciones
+
+
+def main(argv=None):
+    """Medir las etapas del ETL sobre datos sintéticos y guardar los resultados"""
+    parser = argparse.ArgumentParser(description="Benchmarks del ETL sobre datos sintéticos")
+    parser.add_argument('--filas', default='10k', help="cantidad de filas: 10k, 1M, 10M o un número")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--etapas', nargs='+', choices=ETAPAS, default=list(ETAPAS))
+    parser.add_argument('--cargadores', nargs='+', choices=list(CARGADORES), default=list(CARGADORES))
+    parser.add_argument('--tamano-bloque', '--chunk-size', type=int, default=TAMANO_BLOQUE)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--backend', choices=('sqlite', 'postgresql'), default='sqlite',
+                        help="sqlite usa una base temporal; postgresql usa la base configurada por variables de entorno")
+    parser.add_argument('--permitir-borrado', action='store_true',
+                        help="obligatorio con --backend postgresql: reemplaza mi_tabla y vacía las tablas de destino")
+    parser.add_argument('--resultados', default=ARCHIVO_RESULTADOS, help="historial JSONL de resultados")
+    parser.add_argument('--verbose', action='store_true', help="mantener los logs INFO del ETL")
+    parser.add_argument('--dry-run', action='store_true', help="medir solo las etapas de transformación, sin base de datos")
+    args = parser.parse_args(argv)
+    if args.dry_run:
+        args.etapas = [etapa for etapa in args.etapas if etapa != 'carga']
+    if args.backend == 'postgresql' and 'carga' in args.etapas and not args.permitir_borrado:
+        parser.error("--backend postgresql reemplaza mi_tabla y vacía vehicle_appraisal: agregar --permitir-borrado")
+    if not args.verbose:
+        # Los logs por registro del ETL (incluidas las advertencias por fecha inválida) dominarían los tiempos
+        for nombre in ('etl_avaluos', 'datos_sinteticos', 'database_connection'):
+            logging.getLogger(nombre).setLevel(logging.ERROR)
+
+    benchmark = Benchmark(args.filas, args.semilla, args.tamano_bloque, args.workers, args.resultados)
+    logger.info(f"🏁 Benchmark de {benchmark.filas} filas sintéticas (commit {benchmark.commit})")
+    etapas_transformacion = [etapa for etapa in args.etapas if etapa != 'carga']
+    if etapas_transformacion:
+        benchmark.medir_transformacion(etapas_transformacion)
+    if 'carga' in args.etapas:
+        from database_connection import DatabaseConnection
+        with tempfile.TemporaryDirectory() as directorio:
+            if args.backend == 'sqlite':
+                os.environ['DB_BACKEND'] = 'sqlite'
+                os.environ['DB_SQLITE_PATH'] = os.path.join(directorio, 'benchmark.sqlite')
+            else:
+                os.environ['DB_BACKEND'] = 'postgresql'
+            db = DatabaseConnection()
+            try:
+                benchmark.medir_cargas(db, args.cargadores)
+            finally:
+                db.close_connection()
+
+    for comparacion in comparar_con_anterior(benchmark.resultados, args.resultados):
+        logger.info(f"📈 {comparacion['etapa']}: {comparacion['variacion_filas_por_segundo_pct']:+} % filas/s, "
+                    f"{comparacion['variacion_pico_rss_mb']:+} MB de pico RSS respecto de {comparacion['commit_anterior']}")
+    logger.info(f"💾 Resultados agregados a {benchmark.guardar()}")
+
+if __name__ == "__main__":
+    main()
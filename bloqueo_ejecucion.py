@@ -0,0 +1,73 @@
+"""
+Bloqueo entre procesos para que dos ejecuciones que escriben en la base (import-dbf, run
+o el vigilante del DBF) nunca se solapen. Es un archivo bloqueado con flock (msvcrt en
+Windows): el sistema operativo libera el bloqueo aunque el proceso muera
+"""
+
+import os
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+ARCHIVO_BLOQUEO = 'etl_ejecucion.lock'
+
+
+class EjecucionEnCurso(RuntimeError):
+    """Otro proceso tiene el bloqueo de ejecución"""
+
+
+class BloqueoEjecucion:
+    """Bloqueo exclusivo y no bloqueante; se usa como context manager"""
+
+    def __init__(self, ruta=ARCHIVO_BLOQUEO):
+        self.ruta = ruta
+        self._archivo = None
+
+    def adquirir(self):
+        """Tomar el bloqueo o lanzar EjecucionEnCurso si lo tiene otra ejecución"""
+        archivo = open(self.ruta, 'a+', encoding='utf-8')
+        try:
+            if fcntl:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                archivo.seek(0)
+                msvcrt.locking(archivo.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            try:
+                archivo.seek(0)
+                titular = archivo.read().strip()
+            except OSError:
+                titular = ''
+            archivo.close()
+            raise EjecucionEnCurso(f"Otra ejecución tiene el bloqueo {self.ruta} ({titular or 'titular desconocido'})")
+        # El contenido solo informa quién tiene el bloqueo
+        archivo.seek(0)
+        archivo.truncate()
+        archivo.write(f"pid {os.getpid()} desde {datetime.now():%Y-%m-%d %H:%M:%S}\n")
+        archivo.flush()
+        self._archivo = archivo
+        return self
+
+    def liberar(self):
+        if self._archivo is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+            else:
+                self._archivo.seek(0)
+                msvcrt.locking(self._archivo.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._archivo.close()
+            self._archivo = None
+
+    def __enter__(self):
+        return self.adquirir()
+
+    def __exit__(self, *excepcion):
+        self.liberar()
+        return False
@@ -0,0 +1,147 @@
+"""
+Artefactos intermedios del ETL direccionados por contenido: la salida de la extracción,
+de la transformación y de las deducciones se guarda en Parquet. La extracción se indexa
+por la huella de mi_tabla y la consulta; la transformación y las deducciones, por el
+contenido del bloque de origen y la versión del código de su etapa. Una nueva ejecución
+con las mismas entradas reutiliza los archivos y empieza en la primera etapa que cambió.
+Requiere pyarrow o fastparquet; los archivos se escriben de forma atómica
+"""
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+from collections import Counter
+from importlib.util import find_spec
+from importacion_diferida import importar_diferido
+
+logger = logging.getLogger(__name__)
+
+pd = importar_diferido('pandas')
+
+DIRECTORIO_CACHE = '.etl_cache'
+MOTORES_PARQUET = ('pyarrow', 'fastparquet')
+
+
+def motor_parquet():
+    """Primer motor de Parquet instalado, o None"""
+    for motor in MOTORES_PARQUET:
+        if find_spec(motor) is not None:
+            return motor
+    return None
+
+
+def clave(*partes):
+    """Resumen estable (hex) de las partes, que deben poder serializarse a JSON"""
+    contenido = json.dumps(partes, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+
+def version_codigo(*funciones):
+    """Versión del código de transformación: fuente de las funciones y versión de pandas"""
+    fuentes = []
+    for funcion in funciones:
+        try:
+            fuentes.append(inspect.getsource(funcion))
+        except (OSError, TypeError):
+            # Sin fuente disponible (p. ej. definida en el intérprete) se usa su nombre calificado
+            fuentes.append(getattr(funcion, '__qualname__', repr(funcion)))
+    return clave(pd.__version__, *fuentes)
+
+
+def huella_dataframe(df):
+    """Resumen del contenido de un DataFrame (columnas, tipos, índice y valores)"""
+    resumen = hashlib.sha256()
+    resumen.update(json.dumps([list(map(str, df.columns)), list(map(str, df.dtypes))]).encode('utf-8'))
+    resumen.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return resumen.hexdigest()[:32]
+
+
+class CacheEtapas:
+    """Lectura y escritura de artefactos Parquet por etapa, con contadores de aciertos"""
+
+    def __init__(self, directorio=DIRECTORIO_CACHE):
+        self.motor = motor_parquet()
+        if self.motor is None:
+            raise ImportError("La caché de etapas requiere pyarrow o fastparquet (pip install pyarrow)")
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._aciertos = Counter()
+        self._fallos = Counter()
+        self._escrituras = Counter()
+        self._errores = Counter()
+
+    def ruta(self, etapa, nombre):
+        return os.path.join(self.directorio, etapa, f"{nombre}.parquet")
+
+    def _contar(self, contador, etapa):
+        with self._lock:
+            contador[etapa] += 1
+
+    def leer(self, etapa, nombre):
+        """DataFrame guardado, o None si no existe o no se puede leer"""
+        ruta = self.ruta(etapa, nombre)
+        if not os.path.exists(ruta):
+            self._contar(self._fallos, etapa)
+            return None
+        try:
+            df = pd.read_parquet(ruta, engine=self.motor)
+        except Exception as e:
+            logger.warning(f"⚠️ Artefacto ilegible en la caché, se recalcula: {ruta} ({e})")
+            self._contar(self._errores, etapa)
+            return None
+        self._contar(self._aciertos, etapa)
+        return df
+
+    def guardar(self, etapa, nombre, df):
+        """Escribir el DataFrame (archivo temporal + os.replace); devuelve si se guardó"""
+        ruta = self.ruta(etapa, nombre)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            df.to_parquet(temporal, engine=self.motor)
+            os.replace(temporal, ruta)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar en la caché {ruta}: {e}")
+            self._contar(self._errores, etapa)
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return False
+        self._contar(self._escrituras, etapa)
+        return True
+
+    def _ruta_marca(self, etapa, nombre):
+        return os.path.join(self.directorio, etapa, nombre, 'completo.json')
+
+    def marcar_completo(self, etapa, nombre, **datos):
+        """Marcar como completo un artefacto de varios archivos (p. ej. los bloques de una extracción)"""
+        ruta = self._ruta_marca(etapa, nombre)
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(f"{ruta}.tmp", 'w', encoding='utf-8') as archivo:
+                json.dump(datos, archivo)
+            os.replace(f"{ruta}.tmp", ruta)
+            return True
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo marcar como completo {ruta}: {e}")
+            return False
+
+    def marca(self, etapa, nombre):
+        """Datos de la marca de completo, o None si el artefacto está incompleto"""
+        try:
+            with open(self._ruta_marca(etapa, nombre), encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError):
+            return None
+
+    def resumen(self):
+        """Aciertos, fallos, escrituras y errores por etapa"""
+        with self._lock:
+            return {
+                'directorio': self.directorio, 'motor': self.motor,
+                'aciertos': dict(self._aciertos), 'fallos': dict(self._fallos),
+                'escrituras': dict(self._escrituras), 'errores': dict(self._errores),
+            }
+
@@ -0,0 +1,221 @@
+"""
+Carga asíncrona con asyncpg: COPY concurrente de bloques de vehicle_appraisal y
+appraisal_deductions sobre un pool pequeño, con el event loop en un hilo propio
+para que el hilo principal siga transformando mientras los bloques viajan
+"""
+
+import logging
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+from importacion_diferida import importar_diferido
+from reintentos import es_error_transitorio, es_codigo_transitorio
+
+asyncio = importar_diferido('asyncio')
+pd = importar_diferido('pandas')
+
+try:
+    asyncpg = importar_diferido('asyncpg')
+except ImportError:  # dependencia opcional, solo necesaria para la carga asíncrona
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+SQL_CHECKPOINT = """
+    INSERT INTO public.etl_checkpoints
+        (run_id, bloque, id_desde, id_hasta, filas_avaluos, filas_deducciones, etapa)
+    VALUES ($1, $2, $3, $4, $5, $6, 'completo')
+    ON CONFLICT (run_id, bloque) DO UPDATE SET
+        filas_avaluos = EXCLUDED.filas_avaluos,
+        filas_deducciones = EXCLUDED.filas_deducciones,
+        etapa = EXCLUDED.etapa,
+        actualizado = now()
+"""
+
+# Avance de la ejecución en etl_runs: se suma en la misma transacción que el bloque confirmado.
+# {ahora} es la marca de tiempo del motor (DatabaseConnection.marca_tiempo)
+SQL_AVANCE_EJECUCION = """
+    UPDATE public.etl_runs SET
+        filas_cargadas = filas_cargadas + COALESCE($2, 0),
+        deducciones_cargadas = deducciones_cargadas + COALESCE($3, 0),
+        id_desde = CASE WHEN id_desde IS NULL OR id_desde > $4 THEN $4 ELSE id_desde END,
+        id_hasta = CASE WHEN id_hasta IS NULL OR id_hasta < $5 THEN $5 ELSE id_hasta END,
+        actualizado = {ahora}
+    WHERE run_id = $1
+"""
+
+
+def _convertidor(tipo):
+    """Función que adapta un valor de pandas al tipo que espera asyncpg para la columna"""
+    if tipo in ('integer', 'bigint', 'smallint'):
+        return lambda v: int(v)
+    if tipo in ('double precision', 'real'):
+        return lambda v: float(v)
+    if tipo.startswith('numeric'):
+        return lambda v: Decimal(str(v))
+    if tipo == 'date':
+        return lambda v: v.date() if isinstance(v, datetime) else v
+    if tipo.startswith(('character', 'text')):
+        return lambda v: str(v)
+    return lambda v: v
+
+
+def _es_transitorio(error):
+    """Errores transitorios de asyncpg además de los que reconoce reintentos"""
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return True
+    if asyncpg is not None and isinstance(error, (asyncpg.exceptions.ConnectionDoesNotExistError,
+                                                  asyncpg.exceptions.PostgresConnectionError)):
+        return True
+    codigo = getattr(error, 'sqlstate', None)
+    if codigo:
+        return es_codigo_transitorio(codigo)
+    return es_error_transitorio(error)
+
+
+class CargadorAsincrono:
+    """
+    Cargador de bloques por COPY sobre un pool de asyncpg. Cada bloque (avalúos con IDs
+    preasignados + sus deducciones) se escribe en una transacción propia; varios bloques
+    están en vuelo a la vez, lo que oculta la latencia de enlaces WAN
+    """
+
+    def __init__(self, dsn, tamano_pool=4, max_en_vuelo=8, ssl='require', reintentador=None, server_settings=None):
+        if asyncpg is None:
+            raise ImportError("La carga asíncrona requiere asyncpg (pip install asyncpg)")
+        self.dsn = dsn
+        self.tamano_pool = tamano_pool
+        self.ssl = ssl
+        self.reintentador = reintentador
+        # Parámetros de sesión de cada conexión del pool (perfil bulk_load de DatabaseConnection)
+        self.server_settings = server_settings
+        self._en_vuelo = threading.BoundedSemaphore(max_en_vuelo)
+        self._loop = None
+        self._hilo = None
+        self._pool = None
+        self._futuros = []
+        self._tipos = {}
+
+    def iniciar(self):
+        """Arrancar el event loop en su hilo y crear el pool de conexiones"""
+        self._loop = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self._loop.run_forever, name='etl-carga-asincrona', daemon=True)
+        self._hilo.start()
+        asyncio.run_coroutine_threadsafe(self._iniciar_pool(), self._loop).result()
+        logger.info(f"✅ Carga asíncrona iniciada (pool de {self.tamano_pool} conexiones)")
+
+    async def _iniciar_pool(self):
+        self._pool = await asyncpg.create_pool(self.dsn, ssl=self.ssl, min_size=1, max_size=self.tamano_pool,
+                                                server_settings=self.server_settings)
+        async with self._pool.acquire() as conexion:
+            filas = await conexion.fetch("""
+                SELECT c.relname AS tabla, a.attname AS columna, format_type(a.atttypid, a.atttypmod) AS tipo
+                FROM pg_attribute a
+                JOIN pg_class c ON c.oid = a.attrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public'
+                  AND c.relname IN ('vehicle_appraisal', 'appraisal_deductions')
+                  AND a.attnum > 0 AND NOT a.attisdropped
+            """)
+        for fila in filas:
+            self._tipos.setdefault(fila['tabla'], {})[fila['columna']] = fila['tipo']
+
+    def _a_registros(self, tabla, df):
+        """Convertir un DataFrame en tuplas con los tipos de las columnas de destino"""
+        tipos = self._tipos.get(tabla, {})
+        columnas = []
+        for columna in df.columns:
+            convertir = _convertidor(tipos.get(columna, ''))
+            columnas.append([None if pd.isna(v) else convertir(v) for v in df[columna].tolist()])
+        return list(zip(*columnas)) if columnas else []
+
+    def _error_confirmado(self):
+        """Primer error de los bloques ya terminados (None si todos se confirmaron)"""
+        for futuro in self._futuros:
+            if futuro.done() and futuro.exception() is not None:
+                return futuro.exception()
+        return None
+
+    def enviar_bloque(self, df_avaluos, df_deducciones, checkpoint=None):
+        """
+        Encolar la carga de un bloque; bloquea si ya hay max_en_vuelo bloques pendientes.
+        Si un bloque anterior falló no se envía nada más y se propaga su error
+        """
+        registros_avaluos = self._a_registros('vehicle_appraisal', df_avaluos)
+        registros_deducciones = self._a_registros('appraisal_deductions', df_deducciones)
+        self._en_vuelo.acquire()
+        # Se revisa después de esperar lugar: el fallo pudo ocurrir mientras tanto
+        error = self._error_confirmado()
+        if error is not None:
+            self._en_vuelo.release()
+            raise error
+        futuro = asyncio.run_coroutine_threadsafe(
+            self._cargar_bloque(list(df_avaluos.columns), registros_avaluos,
+                                list(df_deducciones.columns), registros_deducciones, checkpoint),
+            self._loop,
+        )
+        futuro.add_done_callback(lambda _: self._en_vuelo.release())
+        self._futuros.append(futuro)
+        return futuro
+
+    async def _cargar_bloque(self, columnas_avaluos, registros_avaluos, columnas_deducciones,
+                             registros_deducciones, checkpoint):
+        descripcion = f"carga asíncrona del bloque {checkpoint['bloque']}" if checkpoint else "carga asíncrona"
+        max_intentos = self.reintentador.max_intentos if self.reintentador else 1
+        for intento in range(1, max_intentos + 1):
+            try:
+                async with self._pool.acquire() as conexion:
+                    async with conexion.transaction():
+                        await conexion.copy_records_to_table(
+                            'vehicle_appraisal', schema_name='public',
+                            columns=columnas_avaluos, records=registros_avaluos)
+                        # Las deducciones van después de sus avalúos dentro de la misma transacción
+                        if registros_deducciones:
+                            await conexion.copy_records_to_table(
+                                'appraisal_deductions', schema_name='public',
+                                columns=columnas_deducciones, records=registros_deducciones)
+                        if checkpoint:
+                            await conexion.execute(
+                                SQL_CHECKPOINT, checkpoint['run_id'], checkpoint['bloque'],
+                                checkpoint['id_desde'], checkpoint['id_hasta'],
+                                len(registros_avaluos), len(registros_deducciones))
+                            await conexion.execute(
+                                SQL_AVANCE_EJECUCION.format(ahora='now()'), checkpoint['run_id'], len(registros_avaluos),
+                                len(registros_deducciones), checkpoint['id_desde'], checkpoint['id_hasta'])
+                logger.info(f"📦 {descripcion}: {len(registros_avaluos)} avalúos y {len(registros_deducciones)} deducciones confirmados")
+                return len(registros_avaluos), len(registros_deducciones)
+            except Exception as e:
+                if intento == max_intentos or not _es_transitorio(e):
+                    raise
+                await asyncio.sleep(self.reintentador.registrar(descripcion, intento, e))
+
+    def esperar(self):
+        """Esperar a que terminen todos los bloques enviados; propaga el primer error"""
+        total_avaluos = 0
+        total_deducciones = 0
+        errores = []
+        for futuro in self._futuros:
+            try:
+                avaluos, deducciones = futuro.result()
+                total_avaluos += avaluos
+                total_deducciones += deducciones
+            except Exception as e:
+                errores.append(e)
+        self._futuros = []
+        if errores:
+            raise errores[0]
+        return total_avaluos, total_deducciones
+
+    def cerrar(self):
+        """Cerrar el pool y detener el event loop"""
+        if self._loop is None:
+            return
+        try:
+            if self._pool is not None:
+                asyncio.run_coroutine_threadsafe(self._pool.close(), self._loop).result(timeout=30)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._hilo.join()
+            self._loop.close()
+            self._loop = None
@@ -1,17 +1,199 @@
 import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
+import threading
+import time
+from importacion_diferida import importar_diferido
+from sentencias_preparadas import RegistroSentencias
+import backend_sqlite
+
+# SQLAlchemy y dotenv se cargan al crear la primera conexión, no al importar este módulo
+sqlalchemy = importar_diferido('sqlalchemy')
+dotenv = importar_diferido('dotenv')
+
+# Configuración del pool: variable de entorno y valor por defecto
+CONFIGURACION_POOL = {
+    'pool_size': ('DB_POOL_SIZE', 5),              # Tamaño del pool de conexiones
+    'max_overflow': ('DB_MAX_OVERFLOW', 10),       # Conexiones adicionales permitidas
+    'pool_recycle': ('DB_POOL_RECYCLE', 1800),     # Reciclar conexiones cada 30 minutos
+    'pool_timeout': ('DB_POOL_TIMEOUT', 30),       # Espera máxima por una conexión libre
+    'connect_timeout': ('DB_CONNECT_TIMEOUT', 30), # Timeout de conexión al servidor
+}
+
+# Motores soportados: PostgreSQL remoto o SQLite embebido (DB_BACKEND)
+BACKENDS = ('postgresql', 'sqlite')
+
+# Perfiles de sesión: parámetros (GUC) que se aplican a la conexión al tomarla del pool
+PERFILES_CONEXION = {
+    # Cargas masivas: commit sin esperar el flush del WAL y memoria para reconstruir índices
+    'bulk_load': {
+        'synchronous_commit': 'off',
+        'maintenance_work_mem': '512MB',
+        'work_mem': '64MB',
+        'statement_timeout': '0',
+    },
+    # Extracción: ordenamientos grandes en memoria, consultas largas de solo lectura
+    'extract': {
+        'work_mem': '256MB',
+        'statement_timeout': '0',
+        'default_transaction_read_only': 'on',
+    },
+    # Verificación: consultas cortas, cortadas si se cuelgan
+    'verify': {
+        'work_mem': '64MB',
+        'statement_timeout': '300s',
+        'default_transaction_read_only': 'on',
+    },
+}
+
+
+def configuracion_pool(**valores):
+    """
+    Configuración del pool: los valores explícitos tienen prioridad sobre las variables de entorno
+    """
+    configuracion = {}
+    for clave, (variable, defecto) in CONFIGURACION_POOL.items():
+        valor = valores.get(clave)
+        if valor is None:
+            valor = os.getenv(variable) or defecto
+        try:
+            configuracion[clave] = int(valor)
+        except (TypeError, ValueError):
+            raise ValueError(f"{variable} debe ser un entero, no '{valor}'")
+    return configuracion
+
+
+class EstadisticasPool:
+    """
+    Contadores del pool de conexiones: espera en el checkout, conexiones en uso,
+    uso del overflow y fallos del pre-ping
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.timeouts = 0
+        self.en_uso_maximo = 0
+        self.checkouts_con_overflow = 0
+        self.overflow_maximo = 0
+        self.conexiones_creadas = 0
+        self.preping_fallidos = 0
+        self.invalidaciones = 0
+    
+    def registrar_checkout(self, espera, en_uso, overflow, uso_overflow):
+        with self._lock:
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+            self.en_uso_maximo = max(self.en_uso_maximo, en_uso)
+            self.overflow_maximo = max(self.overflow_maximo, overflow)
+            if uso_overflow:
+                self.checkouts_con_overflow += 1
+    
+    def registrar_timeout(self, espera):
+        with self._lock:
+            self.timeouts += 1
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+    
+    def registrar_conexion(self):
+        with self._lock:
+            self.conexiones_creadas += 1
+    
+    def registrar_invalidacion(self, error):
+        with self._lock:
+            # El pre-ping que falla invalida la conexión con un DisconnectionError
+            if isinstance(error, sqlalchemy.exc.DisconnectionError):
+                self.preping_fallidos += 1
+            else:
+                self.invalidaciones += 1
+    
+    def resumen(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'espera_promedio_ms': round(1000 * self.espera_total / self.checkouts, 2) if self.checkouts else 0.0,
+                'espera_maxima_ms': round(1000 * self.espera_maxima, 2),
+                'timeouts': self.timeouts,
+                'en_uso_maximo': self.en_uso_maximo,
+                'checkouts_con_overflow': self.checkouts_con_overflow,
+                'overflow_maximo': self.overflow_maximo,
+                'conexiones_creadas': self.conexiones_creadas,
+                'preping_fallidos': self.preping_fallidos,
+                'invalidaciones': self.invalidaciones,
+            }
+
+
+_pool_instrumentado = None
+
+
+def _clase_pool_instrumentado():
+    """Definir PoolInstrumentado en el primer uso, para no importar SQLAlchemy al cargar el módulo"""
+    global _pool_instrumentado
+    if _pool_instrumentado is not None:
+        return _pool_instrumentado
+    
+    class PoolInstrumentado(sqlalchemy.pool.QueuePool):
+        """
+        QueuePool que mide cuánto espera cada checkout por una conexión libre
+        """
+        
+        estadisticas = None
+        
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # Marca de checkout en curso por hilo, propia de cada pool
+            self._local = threading.local()
+        
+        def _do_get(self):
+            # QueuePool._do_get se llama a sí mismo al competir por el overflow: se mide solo la llamada externa
+            if self.estadisticas is None or getattr(self._local, 'activo', False):
+                return super()._do_get()
+            self._local.activo = True
+            overflow_previo = self.overflow()
+            inicio = time.perf_counter()
+            try:
+                registro = super()._do_get()
+            except sqlalchemy.exc.TimeoutError:
+                self.estadisticas.registrar_timeout(time.perf_counter() - inicio)
+                raise
+            finally:
+                self._local.activo = False
+            overflow = self.overflow()
+            self.estadisticas.registrar_checkout(time.perf_counter() - inicio, self.checkedout(),
+                                                 max(overflow, 0), overflow > max(overflow_previo, 0))
+            return registro
+        
+        def recreate(self):
+            pool = super().recreate()
+            pool.estadisticas = self.estadisticas
+            return pool
+    
+    _pool_instrumentado = PoolInstrumentado
+    return _pool_instrumentado
+
+
+def __getattr__(nombre):
+    # `from database_connection import PoolInstrumentado` sigue funcionando
+    if nombre == 'PoolInstrumentado':
+        return _clase_pool_instrumentado()
+    raise AttributeError(f"module '{__name__}' has no attribute '{nombre}'")
+
 
 class DatabaseConnection:
     """
     Clase para manejar la conexión a la base de datos PostgreSQL
     """
     
-    def __init__(self):
+    def __init__(self, backend=None, ruta_sqlite=None, **opciones_pool):
         # Cargar variables de entorno desde el archivo .env
-        load_dotenv()
+        dotenv.load_dotenv()
+        
+        # PostgreSQL por defecto; DB_BACKEND=sqlite usa una base local en DB_SQLITE_PATH
+        self.backend = (backend or os.getenv('DB_BACKEND') or 'postgresql').lower()
+        if self.backend not in BACKENDS:
+            raise ValueError(f"DB_BACKEND debe ser uno de {BACKENDS}, no '{self.backend}'")
+        self.ruta_sqlite = ruta_sqlite or os.getenv('DB_SQLITE_PATH') or backend_sqlite.RUTA_POR_DEFECTO
         
         # Obtener credenciales desde variables de entorno
         self.db_user = os.getenv('DB_USER')
@@ -20,64 +202,201 @@ class DatabaseConnection:
         self.db_port = os.getenv('DB_PORT')
         self.db_name = os.getenv('DB_NAME')
         
-        # Crear el engine de conexión
+        # Pool configurable por variables de entorno (DB_POOL_SIZE, ...) o por argumentos
+        self.configuracion_pool = configuracion_pool(**opciones_pool)
+        self.estadisticas = EstadisticasPool()
+        # Sentencias preparadas por conexión (DB_MAX_SENTENCIAS_PREPARADAS=0 las desactiva;
+        # SQLite no tiene PREPARE del lado de SQL)
+        max_sentencias = int(os.getenv('DB_MAX_SENTENCIAS_PREPARADAS') or 32) if self.es_postgresql else 0
+        self.sentencias = RegistroSentencias(max_sentencias)
+        
+        # El engine y la sesión se crean al usarse por primera vez
         self.engine = None
         self.session = None
-        self._create_engine()
+        self._engines_perfil = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def es_postgresql(self):
+        """
+        Indicar si el motor es PostgreSQL (COPY, secuencias, parámetros de sesión, asyncpg)
+        """
+        return self.backend == 'postgresql'
+    
+    @property
+    def max_parametros(self):
+        """
+        Máximo de parámetros por sentencia; None si el motor no impone límite
+        """
+        return None if self.es_postgresql else backend_sqlite.MAX_PARAMETROS
+    
+    @property
+    def marca_tiempo(self):
+        """
+        Expresión SQL de la hora actual con fracciones de segundo
+        """
+        return 'CURRENT_TIMESTAMP' if self.es_postgresql else backend_sqlite.MARCA_TIEMPO
     
     def _create_engine(self):
         """
         Crear el engine de SQLAlchemy con configuración SSL
         """
         try:
-            connection_string = f'postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}'
-            
-            self.engine = create_engine(
-                connection_string,
-                connect_args={
-                    "sslmode": "require",
-                    "connect_timeout": 30,  # Timeout de conexión de 30 segundos
-                    "application_name": "ETL_Avaluos"  # Identificar la aplicación
-                },
-                pool_pre_ping=True,  # Verificar conexión antes de usar
-                pool_recycle=1800,   # Reciclar conexiones cada 30 minutos
-                pool_size=5,         # Tamaño del pool de conexiones
-                max_overflow=10,     # Conexiones adicionales permitidas
-                echo=False           # No mostrar SQL en logs
-            )
-            
-            # Crear session factory
-            Session = sessionmaker(bind=self.engine)
-            self.session = Session()
+            configuracion = self.configuracion_pool
+            if self.es_postgresql:
+                engine = self._create_engine_postgresql(configuracion)
+            else:
+                engine = self._create_engine_sqlite(configuracion)
+            engine.pool.estadisticas = self.estadisticas
+            sqlalchemy.event.listen(engine, 'connect', lambda conexion, registro: self.estadisticas.registrar_conexion())
+            sqlalchemy.event.listen(engine, 'invalidate',
+                                    lambda conexion, registro, error: self.estadisticas.registrar_invalidacion(error))
+            # create_engine no conecta: el éxito se informa después de una consulta real
+            try:
+                with engine.connect() as conexion:
+                    conexion.execute(sqlalchemy.text("SELECT 1"))
+            except sqlalchemy.exc.SQLAlchemyError:
+                engine.dispose()
+                raise
+            self.engine = engine
             
             print("✅ Conexión a la base de datos establecida correctamente")
             
-        except SQLAlchemyError as e:
+        except sqlalchemy.exc.SQLAlchemyError as e:
             print(f"❌ Error al conectar a la base de datos: {e}")
             raise
     
-    def get_engine(self):
+    def _create_engine_postgresql(self, configuracion):
         """
-        Obtener el engine de SQLAlchemy
+        Engine de PostgreSQL con SSL y perfiles de sesión
         """
-        return self.engine
+        connection_string = self.obtener_dsn()
+        
+        engine = sqlalchemy.create_engine(
+            connection_string,
+            connect_args={
+                "sslmode": "require",
+                "connect_timeout": configuracion['connect_timeout'],
+                "application_name": "ETL_Avaluos"  # Identificar la aplicación
+            },
+            poolclass=_clase_pool_instrumentado(),
+            pool_pre_ping=True,  # Verificar conexión antes de usar
+            pool_recycle=configuracion['pool_recycle'],
+            pool_size=configuracion['pool_size'],
+            max_overflow=configuracion['max_overflow'],
+            pool_timeout=configuracion['pool_timeout'],
+            echo=False           # No mostrar SQL en logs
+        )
+        sqlalchemy.event.listen(engine, 'engine_connect', self._aplicar_perfil)
+        return engine
+    
+    def _create_engine_sqlite(self, configuracion):
+        """
+        Engine de SQLite sobre un archivo local, con el mismo pool instrumentado
+        """
+        engine = sqlalchemy.create_engine(
+            'sqlite://',
+            creator=lambda: backend_sqlite.conectar(self.ruta_sqlite, timeout=configuracion['connect_timeout']),
+            poolclass=_clase_pool_instrumentado(),
+            pool_size=configuracion['pool_size'],
+            max_overflow=configuracion['max_overflow'],
+            pool_timeout=configuracion['pool_timeout'],
+        )
+        with engine.connect() as conexion:
+            backend_sqlite.crear_esquema(conexion.connection.dbapi_connection)
+        return engine
+    
+    def obtener_dsn(self):
+        """
+        Obtener la cadena de conexión PostgreSQL (también usada por drivers asíncronos)
+        """
+        return f'postgresql://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}'
+    
+    def get_engine(self, perfil=None):
+        """
+        Obtener el engine de SQLAlchemy, creándolo en el primer uso. Con un perfil
+        (ver PERFILES_CONEXION) las conexiones del engine aplican sus parámetros de sesión
+        """
+        if self.engine is None:
+            with self._lock:
+                if self.engine is None:
+                    self._create_engine()
+        if perfil is None:
+            return self.engine
+        if perfil not in PERFILES_CONEXION:
+            raise ValueError(f"Perfil de conexión desconocido: '{perfil}' (disponibles: {', '.join(PERFILES_CONEXION)})")
+        if perfil not in self._engines_perfil:
+            # Comparte el pool con el engine base; el perfil viaja en las opciones de ejecución
+            self._engines_perfil[perfil] = self.engine.execution_options(perfil_conexion=perfil)
+        return self._engines_perfil[perfil]
+    
+    @staticmethod
+    def _aplicar_perfil(connection):
+        """
+        Ajustar los parámetros de sesión de una conexión recién tomada del pool a su perfil.
+        El perfil vigente se guarda en la información de la conexión del pool, así que solo se
+        ejecuta SQL cuando la conexión cambia de perfil
+        """
+        perfil = connection.get_execution_options().get('perfil_conexion')
+        info = connection.connection.info
+        if info.get('perfil_conexion') == perfil:
+            return
+        # Directo sobre la conexión DBAPI para no abrir una transacción de SQLAlchemy;
+        # se confirma para que un rollback posterior no deshaga los SET
+        dbapi_connection = connection.connection.dbapi_connection
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("RESET ALL")
+            for parametro, valor in PERFILES_CONEXION.get(perfil, {}).items():
+                cursor.execute("SELECT set_config(%s, %s, false)", (parametro, valor))
+        finally:
+            cursor.close()
+        dbapi_connection.commit()
+        info['perfil_conexion'] = perfil
     
     def get_session(self):
         """
-        Obtener la sesión de SQLAlchemy
+        Obtener la sesión de SQLAlchemy, creándola en el primer uso
         """
+        if self.session is None:
+            from sqlalchemy.orm import sessionmaker
+            Session = sessionmaker(bind=self.get_engine())
+            self.session = Session()
         return self.session
     
+    def ejecutar_preparada(self, conexion, nombre, sql, parametros=()):
+        """
+        Ejecutar una sentencia frecuente (parámetros $1, $2, ...) preparada una vez por conexión
+        """
+        return self.sentencias.ejecutar(conexion, nombre, sql, parametros)
+    
+    def estadisticas_sentencias(self):
+        """
+        Ejecuciones, aciertos y tiempos de cada sentencia preparada
+        """
+        return self.sentencias.resumen()
+    
+    def estadisticas_pool(self):
+        """
+        Instantánea del pool: configuración, conexiones en uso y contadores acumulados
+        """
+        instantanea = dict(self.configuracion_pool)
+        instantanea.update(self.estadisticas.resumen())
+        if self.engine is not None:
+            instantanea['en_uso'] = self.engine.pool.checkedout()
+            instantanea['disponibles'] = self.engine.pool.checkedin()
+        return instantanea
+    
     def test_connection(self):
         """
         Probar la conexión a la base de datos
         """
         try:
-            with self.engine.connect() as connection:
-                result = connection.execute(text("SELECT 1"))
+            with self.get_engine().connect() as connection:
+                result = connection.execute(sqlalchemy.text("SELECT 1"))
                 print("✅ Conexión a la base de datos exitosa")
                 return True
-        except SQLAlchemyError as e:
+        except sqlalchemy.exc.SQLAlchemyError as e:
             print(f"❌ Error al probar la conexión: {e}")
             return False
     
@@ -87,8 +406,11 @@ class DatabaseConnection:
         """
         if self.session:
             self.session.close()
+            self.session = None
         if self.engine:
             self.engine.dispose()
+            self.engine = None
+            self._engines_perfil = {}
         print("🔒 Conexión a la base de datos cerrada")
     
     def __enter__(self):
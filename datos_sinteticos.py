@@ -0,0 +1,332 @@
+"""
+Generador de datos sintéticos con la forma de mi_tabla (campos del DBF de Lotus) para
+pruebas de volumen: reproduce la mezcla de valores sucios de los datos reales (decimales
+con coma, 'N/A', cilindrada en cc o en litros, fechas en varios formatos, pares de
+deducción vacíos) y puede escribir el resultado como DBF o cargarlo en public.mi_tabla
+"""
+
+import argparse
+import logging
+import struct
+from datetime import date
+from importacion_diferida import importar_diferido
+from backend_sqlite import COLUMNAS_MI_TABLA, ESQUEMA
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+pd = importar_diferido('pandas')
+np = importar_diferido('numpy')
+sqlalchemy = importar_diferido('sqlalchemy')
+
+# Tamaños de referencia para las mediciones
+TAMANOS = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+TAMANO_BLOQUE = 100_000
+
+MARCAS_MODELOS = {
+    'TOYOTA': ['HILUX', 'COROLLA', 'RAV4', 'LAND CRUISER', 'YARIS', 'TACOMA'],
+    'NISSAN': ['FRONTIER', 'SENTRA', 'X-TRAIL', 'PATHFINDER', 'VERSA'],
+    'HONDA': ['CIVIC', 'CR-V', 'ACCORD', 'FIT'],
+    'MITSUBISHI': ['L200', 'MONTERO', 'LANCER', 'OUTLANDER'],
+    'HYUNDAI': ['TUCSON', 'SANTA FE', 'ELANTRA', 'ACCENT'],
+    'KIA': ['SPORTAGE', 'SORENTO', 'RIO', 'PICANTO'],
+    'FORD': ['RANGER', 'EXPLORER', 'F-150', 'ESCAPE'],
+    'CHEVROLET': ['COLORADO', 'SILVERADO', 'SPARK', 'TRAILBLAZER'],
+    'ISUZU': ['D-MAX', 'TROOPER'],
+    'MAZDA': ['BT-50', 'CX-5', 'MAZDA 3'],
+}
+COLORES = ['BLANCO', 'NEGRO', 'GRIS', 'PLATEADO', 'ROJO', 'AZUL', 'BEIGE', 'VERDE', 'Gris Oscuro', 'CAFÉ']
+COMBUSTIBLES = ['GASOLINA', 'DIESEL', 'GASOLINA', 'DIESEL', 'Gasolina', 'DIESEL ', 'HIBRIDO', 'GAS LPG']
+ORIGENES = ['AGENCIA', 'IMPORTADO', 'USA', 'JAPON', 'COREA', '']
+NOMBRES = ['JUAN', 'MARÍA', 'JOSÉ', 'CARLOS', 'ANA', 'LUIS', 'ROSA', 'PEDRO', 'SOFÍA', 'MIGUEL', 'BANCO']
+APELLIDOS = ['LÓPEZ', 'MARTÍNEZ', 'HERNÁNDEZ', 'RODRÍGUEZ', 'ZELAYA', 'MEJÍA', 'CASTILLO',
+             'FLORES', 'REYES', 'ATLÁNTIDA S.A.', 'FICOHSA']
+NOTAS = ['', '', '', 'VEHÍCULO EN BUEN ESTADO', 'PINTURA CON DETALLES', 'Revisar frenos',
+         'A/C, RADIO & CD', 'N/A', 'NULL', 'LLANTAS NUEVAS; TAPICERÍA GASTADA']
+ACCESORIOS = ['', '', 'A/C', 'A/C, ALARMA', 'RADIO AM/FM', 'ARO DE LUJO', 'CÁMARA DE RETROCESO', 'N/A']
+CILINDRADAS_LITROS = [1.0, 1.2, 1.3, 1.5, 1.6, 1.8, 2.0, 2.4, 2.5, 2.8, 3.0, 3.5, 4.0, 5.7]
+
+# Pares (monto, descripción) de deducciones, en el mismo orden que procesar_deducciones
+PARES_DEDUCCION = [
+    ('MOTOR1', 'MOTOR_'), ('TRANSMISIO', 'TRANSMICIO'), ('SUSPENSION', 'CARROCERI2'),
+    ('DIRECCION', 'DIRECCION2'), ('FRENOS', 'FRENOS2'), ('LLANTAS', 'RUEDAS'),
+    ('SIST_ELECT', 'SISTELEC2'), ('INTERIOR_Y', 'INTYACC2'),
+]
+DESCRIPCIONES_DEDUCCION = ['Golpe en cárter', 'Fuga de aceite', 'Cambio de pastillas', 'Desgaste',
+                           'Ruido al girar', 'Reparación mayor', 'LLANTAS LISAS', 'Tapicería rota',
+                           'Batería débil', 'Amortiguadores']
+
+# Anchos de los campos carácter del DBF (máximo 254 en dBase III)
+ANCHOS_DBF = dict.fromkeys(COLUMNAS_MI_TABLA, 40)
+ANCHOS_DBF.update({'NOTA': 120, 'ACCESORIOS': 80, 'A_O': 4, '_FECHAS_1': 10, 'PLACAS': 10})
+ANCHOS_DBF.update(dict.fromkeys(['NUMERO_CER', 'KMS', 'CILINDRADA', 'MODIF_KM', 'TOTAL_DE_R', 'VALOR_EXTR',
+                                 'DESCUENTOS', 'AV_BANC_NU', 'AVALUO_BAN', 'AVALUO_DIS', 'VALOR_GIBS',
+                                 'AV_DIST_NU'] + [monto for monto, _ in PARES_DEDUCCION], 16))
+
+
+def interpretar_filas(valor):
+    """Convertir '10k', '1M', '10M' o un número a cantidad de filas"""
+    if isinstance(valor, int):
+        return valor
+    texto = str(valor).strip()
+    if texto in TAMANOS:
+        return TAMANOS[texto]
+    multiplicadores = {'k': 1_000, 'K': 1_000, 'm': 1_000_000, 'M': 1_000_000}
+    if texto[-1:] in multiplicadores:
+        return int(float(texto[:-1]) * multiplicadores[texto[-1]])
+    return int(texto.replace('_', ''))
+
+
+def _mezclar(rng, n, variantes):
+    """
+    Elegir por fila entre variantes (probabilidad, valores). Los valores son un escalar, un
+    arreglo de n valores o una función que recibe la máscara de filas elegidas y devuelve
+    solo esos valores (así cada formato se calcula únicamente para sus filas)
+    """
+    probabilidades = np.array([p for p, _ in variantes], dtype=float)
+    indices = rng.choice(len(variantes), size=n, p=probabilidades / probabilidades.sum())
+    resultado = np.empty(n, dtype=object)
+    for i, (_, valores) in enumerate(variantes):
+        mascara = indices == i
+        if callable(valores):
+            resultado[mascara] = valores(mascara) if mascara.any() else []
+        elif isinstance(valores, np.ndarray):
+            resultado[mascara] = valores[mascara]
+        else:
+            resultado[mascara] = valores
+    return resultado
+
+
+def _texto(valores):
+    return np.asarray(valores).astype(str).astype(object)
+
+
+def _con_miles(enteros, separador):
+    """Enteros con separador de miles ('154,321'); los menores de mil quedan sin separador"""
+    enteros = np.asarray(enteros, dtype=np.int64)
+    agrupados = _texto(enteros // 1000) + separador + _texto(np.char.zfill((enteros % 1000).astype(str), 3))
+    return np.where(enteros >= 1000, agrupados, _texto(enteros))
+
+
+def _montos(rng, n, minimo=500, maximo=60000, vacio=0.1):
+    """Montos con punto o coma decimal, enteros, separador de miles, 'N/A' y vacíos"""
+    centavos = rng.integers(minimo * 100, maximo * 100, size=n)
+
+    def decimal(separador):
+        return lambda m: _texto(centavos[m] // 100) + separador + _texto(np.char.zfill((centavos[m] % 100).astype(str), 2))
+
+    lleno = 1 - vacio
+    return _mezclar(rng, n, [
+        (0.5 * lleno, decimal('.')),
+        (0.2 * lleno, decimal(',')),
+        (0.2 * lleno, lambda m: _texto(centavos[m] // 100)),
+        # '12,500.00' no es interpretable por limpiar_numero: queda en None, como en el DBF real
+        (0.1 * lleno, lambda m: _con_miles(centavos[m] // 100, ',') + '.00'),
+        (vacio / 4, 'N/A'), (vacio / 4, ''), (vacio / 4, None), (vacio / 4, 'NULL'),
+    ])
+
+
+def _fechas(rng, n):
+    """Fechas de avalúo en los cuatro formatos que acepta limpiar_fecha, más vacías e inválidas"""
+    fechas = np.datetime64('2015-01-01') + rng.integers(0, 3850, size=n).astype('timedelta64[D]')
+    meses = fechas.astype('datetime64[M]')
+    anio = _texto(fechas.astype('datetime64[Y]').astype(np.int64) + 1970)
+    mes = _texto(np.char.zfill((meses.astype(np.int64) % 12 + 1).astype(str), 2))
+    dia = _texto(np.char.zfill(((fechas - meses).astype(np.int64) + 1).astype(str), 2))
+
+    def con_formato(primera, segunda, tercera):
+        return lambda m: primera[m] + '/' + segunda[m] + '/' + tercera[m]
+
+    return _mezclar(rng, n, [
+        (0.4, lambda m: anio[m] + '-' + mes[m] + '-' + dia[m]),
+        (0.3, con_formato(dia, mes, anio)),
+        (0.1, con_formato(mes, dia, anio)),
+        (0.1, con_formato(anio, mes, dia)),
+        (0.04, ''), (0.04, None), (0.02, '31/02/2020'),
+    ])
+
+
+def _personas(rng, n):
+    nombres = rng.choice(np.array(NOMBRES, dtype=object), size=n)
+    apellidos = rng.choice(np.array(APELLIDOS, dtype=object), size=n)
+    completos = nombres + ' ' + apellidos
+    return _mezclar(rng, n, [
+        (0.8, completos), (0.08, '  ' + nombres + '   ' + apellidos + ' '),
+        (0.04, 'N/A'), (0.04, ''), (0.04, None),
+    ])
+
+
+def _identificadores(rng, n, largo, alfabeto='ABCDEFGHJKLMNPRSTUVWXYZ0123456789'):
+    caracteres = rng.choice(np.array(list(alfabeto)), size=(n, largo))
+    return np.ascontiguousarray(caracteres).view(f'<U{largo}').ravel().astype(object)
+
+
+def _deducciones(rng, n):
+    """Columnas de los pares de deducción: la mayoría vacíos, con monto, descripción o ambos"""
+    columnas = {}
+    for monto, descripcion in PARES_DEDUCCION:
+        montos = _montos(rng, n, minimo=50, maximo=5000, vacio=0)
+        descripciones = rng.choice(np.array(DESCRIPCIONES_DEDUCCION, dtype=object), size=n)
+        montos_vacios = _mezclar(rng, n, [(0.5, None), (0.3, ''), (0.15, '0'), (0.05, 'N/A')])
+        descripciones_vacias = _mezclar(rng, n, [(0.5, None), (0.4, ''), (0.1, ' ')])
+        # 0: par vacío, 1: solo monto, 2: solo descripción, 3: ambos
+        escenario = rng.choice(4, size=n, p=[0.6, 0.15, 0.1, 0.15])
+        columnas[monto] = np.where(np.isin(escenario, (1, 3)), montos, montos_vacios)
+        columnas[descripcion] = np.where(np.isin(escenario, (2, 3)), descripciones, descripciones_vacias)
+    return columnas
+
+
+def _generar_bloque(rng, desde_id, n):
+    """Un bloque de n filas de mi_tabla con id_unico consecutivo desde desde_id"""
+    ids = np.arange(desde_id, desde_id + n, dtype=np.int64)
+    pares = [(marca, modelo) for marca, modelos in MARCAS_MODELOS.items() for modelo in modelos]
+    elegidos = rng.integers(0, len(pares), size=n)
+    marcas = np.array([marca for marca, _ in pares], dtype=object)[elegidos]
+    modelos = np.array([modelo for _, modelo in pares], dtype=object)[elegidos]
+    litros = rng.choice(np.array(CILINDRADAS_LITROS), size=n)
+    anios = rng.integers(1975, 2026, size=n)
+    kms = rng.integers(0, 400_000, size=n)
+    kms_texto = _texto(kms)
+
+    columnas = {
+        'CILINDRADA': _mezclar(rng, n, [
+            (0.45, _texto(np.char.mod('%.1f', litros))),
+            (0.1, _texto(np.char.replace(np.char.mod('%.1f', litros), '.', ','))),
+            (0.25, _texto((litros * 1000).astype(np.int64))),
+            (0.05, _texto(np.char.add(((litros * 1000).astype(np.int64)).astype(str), ' CC'))),
+            (0.05, 'N/A'), (0.05, ''), (0.05, None),
+        ]),
+        'COMBUSTIBL': _mezclar(rng, n, [(0.9, rng.choice(np.array(COMBUSTIBLES, dtype=object), size=n)),
+                                        (0.05, 'N/A'), (0.05, '')]),
+        'NUMERO_CER': _mezclar(rng, n, [(0.9, _texto(ids + 100_000)), (0.05, _texto(ids + 100_000) + '.0'),
+                                        (0.03, 'N/A'), (0.02, '')]),
+        'SOLICITANT': _personas(rng, n),
+        'PROPIETARI': _personas(rng, n),
+        'MARCA': _mezclar(rng, n, [(0.9, marcas), (0.05, np.char.lower(marcas.astype(str)).astype(object)),
+                                   (0.03, ' ' + marcas + ' '), (0.02, '')]),
+        'MODELO': _mezclar(rng, n, [(0.95, modelos), (0.05, '')]),
+        'A_O': _mezclar(rng, n, [(0.8, _texto(anios)), (0.05, _texto(anios % 100)),
+                                 (0.05, ''), (0.05, 'N/A'), (0.05, None)]),
+        'KMS': _mezclar(rng, n, [
+            (0.4, kms_texto),
+            (0.2, _con_miles(kms, ',')),
+            (0.1, _con_miles(kms, '.')),
+            (0.05, kms_texto + ' KM'), (0.1, 'N/A'), (0.1, ''), (0.05, None),
+        ]),
+        'ORIGEN': rng.choice(np.array(ORIGENES, dtype=object), size=n),
+        'COLOR': _mezclar(rng, n, [(0.9, rng.choice(np.array(COLORES, dtype=object), size=n)),
+                                   (0.05, 'N/A'), (0.05, '')]),
+        'PLACAS': _mezclar(rng, n, [(0.9, 'P' + _identificadores(rng, n, 2, 'ABCDEFGHJKLMNPRSTUVWXYZ')
+                                     + _texto(np.char.zfill(rng.integers(0, 10_000, size=n).astype(str), 4))),
+                                    (0.05, 'EN TRAMITE'), (0.05, '')]),
+        'NOTA': rng.choice(np.array(NOTAS, dtype=object), size=n),
+        'ACCESORIOS': rng.choice(np.array(ACCESORIOS, dtype=object), size=n),
+        'VIN_CHASIS': _mezclar(rng, n, [(0.85, _identificadores(rng, n, 17)), (0.1, ''), (0.05, 'N/A')]),
+        '__VIN_DE_C': _mezclar(rng, n, [(0.6, _identificadores(rng, n, 17)), (0.4, '')]),
+        '__VIN_DE_M': _mezclar(rng, n, [(0.7, _identificadores(rng, n, 12)), (0.3, '')]),
+        'VIN_DE_MOT': _mezclar(rng, n, [(0.5, _identificadores(rng, n, 12)), (0.5, '')]),
+        'TOTAL_DE_R': _montos(rng, n, minimo=0, maximo=20000, vacio=0.3),
+        'MODIF_KM': _mezclar(rng, n, [(0.1, _texto(rng.integers(0, 200_000, size=n))), (0.6, ''), (0.3, None)]),
+        'VALOR_EXTR': _montos(rng, n, minimo=0, maximo=5000, vacio=0.5),
+        'DESCUENTOS': _montos(rng, n, minimo=0, maximo=5000, vacio=0.5),
+        'AV_BANC_NU': _montos(rng, n, minimo=2000, maximo=80000),
+        'AVALUO_BAN': _montos(rng, n, minimo=50000, maximo=2000000),
+        '_FECHAS_1': _fechas(rng, n),
+        'AVALUO_DIS': _montos(rng, n, minimo=40000, maximo=1800000),
+        'VALOR_GIBS': _montos(rng, n, minimo=50000, maximo=2000000),
+        'AV_DIST_NU': _montos(rng, n, minimo=2000, maximo=80000),
+        'MOTOR2': _mezclar(rng, n, [(0.9, ''), (0.1, None)]),
+        'SUSPENSIO2': _mezclar(rng, n, [(0.9, ''), (0.1, None)]),
+    }
+    columnas.update(_deducciones(rng, n))
+    df = pd.DataFrame({'id_unico': ids})
+    for columna in COLUMNAS_MI_TABLA:
+        df[columna] = columnas[columna]
+    return df
+
+
+def generar_por_bloques(filas, semilla=42, tamano_bloque=TAMANO_BLOQUE):
+    """Generar mi_tabla en bloques de tamano_bloque filas (memoria acotada para 1M y 10M)"""
+    filas = interpretar_filas(filas)
+    for numero, desde in enumerate(range(0, filas, tamano_bloque)):
+        # Cada bloque tiene su propia semilla: el resultado no depende del tamaño del bloque anterior
+        rng = np.random.default_rng([semilla, numero])
+        yield _generar_bloque(rng, desde + 1, min(tamano_bloque, filas - desde))
+
+
+def generar_mi_tabla(filas, semilla=42, tamano_bloque=TAMANO_BLOQUE):
+    """Generar un DataFrame de mi_tabla con `filas` registros reproducibles según la semilla"""
+    return pd.concat(list(generar_por_bloques(filas, semilla, tamano_bloque)), ignore_index=True)
+
+
+def escribir_dbf(ruta, filas, semilla=42, tamano_bloque=TAMANO_BLOQUE):
+    """Escribir mi_tabla sintética como DBF (dBase III, campos carácter) legible con dbfread"""
+    filas = interpretar_filas(filas)
+    campos = [(columna, ANCHOS_DBF[columna]) for columna in COLUMNAS_MI_TABLA]
+    largo_encabezado = 32 + 32 * len(campos) + 1
+    largo_registro = 1 + sum(ancho for _, ancho in campos)
+    hoy = date.today()
+    with open(ruta, 'wb') as archivo:
+        archivo.write(struct.pack('<BBBBIHH20x', 0x03, hoy.year - 1900, hoy.month, hoy.day,
+                                  filas, largo_encabezado, largo_registro))
+        for nombre, ancho in campos:
+            archivo.write(struct.pack('<11sc4xBB14x', nombre.encode('ascii'), b'C', ancho, 0))
+        archivo.write(b'\r')
+        for df in generar_por_bloques(filas, semilla, tamano_bloque):
+            # Registros de ancho fijo armados por columna: marca de borrado + campos rellenos con espacios
+            registros = pd.Series(' ', index=df.index)
+            for nombre, ancho in campos:
+                registros = registros + df[nombre].fillna('').astype(str).str.slice(0, ancho).str.ljust(ancho)
+            archivo.write(''.join(registros.tolist()).encode('latin-1', errors='replace'))
+        archivo.write(b'\x1a')
+    logger.info(f"✅ DBF sintético escrito en {ruta}: {filas} registros")
+    return ruta
+
+
+def cargar_mi_tabla(db_connection, filas, semilla=42, tamano_bloque=TAMANO_BLOQUE):
+    """Reemplazar public.mi_tabla por `filas` registros sintéticos (SQLite o PostgreSQL)"""
+    filas = interpretar_filas(filas)
+    engine = db_connection.get_engine('bulk_load')
+    total = 0
+    with engine.begin() as conexion:
+        if db_connection.es_postgresql:
+            # Misma definición que el backend local: todas las columnas del DBF como texto
+            from etl_avaluos import copiar_dataframe
+            conexion.execute(sqlalchemy.text("DROP TABLE IF EXISTS public.mi_tabla"))
+            conexion.execute(sqlalchemy.text(ESQUEMA[0]))
+            for df in generar_por_bloques(filas, semilla, tamano_bloque):
+                total += copiar_dataframe(conexion, df, 'public.mi_tabla', list(df.columns))
+            conexion.execute(sqlalchemy.text(
+                'CREATE INDEX IF NOT EXISTS idx_mi_tabla_id_unico ON public.mi_tabla ("id_unico")'))
+        else:
+            conexion.execute(sqlalchemy.text("DELETE FROM public.mi_tabla"))
+            for df in generar_por_bloques(filas, semilla, tamano_bloque):
+                df.to_sql('mi_tabla', conexion, schema='public', if_exists='append', index=False)
+                total += len(df)
+    logger.info(f"✅ mi_tabla sintética cargada: {total} registros")
+    return total
+
+
+def main():
+    """Generar un DBF sintético o cargar mi_tabla sintética en la base configurada"""
+    parser = argparse.ArgumentParser(description="Datos sintéticos con la forma de mi_tabla")
+    parser.add_argument('--filas', default='10k', help="cantidad de filas: 10k, 1M, 10M o un número")
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--dbf', metavar='RUTA', help="escribir un archivo DBF")
+    parser.add_argument('--cargar', action='store_true',
+                        help="reemplazar public.mi_tabla en la base configurada por variables de entorno")
+    args = parser.parse_args()
+    if not args.dbf and not args.cargar:
+        parser.error("indicar --dbf RUTA y/o --cargar")
+    if args.dbf:
+        escribir_dbf(args.dbf, args.filas, args.semilla)
+    if args.cargar:
+        from database_connection import DatabaseConnection
+        db = DatabaseConnection()
+        try:
+            cargar_mi_tabla(db, args.filas, args.semilla)
+        finally:
+            db.close_connection()
+
+if __name__ == "__main__":
+    main()
@@ -1,101 +1,406 @@
-import pandas as pd
-import numpy as np
 from datetime import datetime
 import re
-from database_connection import DatabaseConnection
-from sqlalchemy import text
+from importacion_diferida import importar_diferido
+from database_connection import DatabaseConnection, PERFILES_CONEXION
 import logging
-import psycopg2
-from psycopg2.errors import InFailedSqlTransaction, DataError, IntegrityError, OperationalError
 import time
+from concurrent.futures import ThreadPoolExecutor
+from reintentos import Reintentador
+from carga_asincrona import CargadorAsincrono, SQL_AVANCE_EJECUCION
+from lotes_adaptativos import RegistroLotes
+from instrumentacion import Instrumentacion, DIRECTORIO_REPORTES
+from perfilado import crear_perfilador, DIRECTORIO_PERFILES, PERFILADORES
+from cache_etapas import CacheEtapas, DIRECTORIO_CACHE, clave, huella_dataframe, motor_parquet, version_codigo
+from bloqueo_ejecucion import BloqueoEjecucion, EjecucionEnCurso
+import backend_sqlite
+import io
+import json
+import os
+import argparse
+import contextlib
+import sys
+import uuid
+import queue
+import threading
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Dependencias pesadas: se cargan al usarse, no al importar (--help y chequeos arrancan rápido)
+pd = importar_diferido('pandas')
+np = importar_diferido('numpy')
+sqlalchemy = importar_diferido('sqlalchemy')
+
+# Columnas de destino en vehicle_appraisal y appraisal_deductions
+COLUMNAS_VEHICLE_APPRAISAL = [
+    'appraisal_date', 'vehicle_description', 'brand', 'model_year', 'color',
+    'mileage', 'fuel_type', 'engine_size', 'plate_number', 'applicant',
+    'owner', 'appraisal_value_usd', 'appraisal_value_trochez', 'vin',
+    'engine_number', 'notes', 'validity_days', 'validity_kms',
+    'apprasail_value_lower_cost', 'apprasail_value_bank',
+    'apprasail_value_lower_bank', 'extras', 'vin_card', 'engine_number_card',
+    'total_deductions', 'modified_km', 'extra_value', 'discounts', 'bank_value_in_dollars',
+    'referencia_original', 'cert'
+]
+COLUMNAS_DEDUCCIONES = ['vehicle_appraisal_id', 'amount', 'description']
+
+MODOS_CARGA = ('append', 'upsert', 'cte')
+
+# Inserción de las cargas append: INSERT multi-fila con to_sql o COPY FROM STDIN (PostgreSQL)
+CARGADORES = ('to_sql', 'copy')
+
+# Salida de la simulación: un directorio por ejecución con un Parquet por bloque y tabla
+DIRECTORIO_SIMULACION = 'etl_simulacion'
+
+# Definiciones de índices y restricciones retiradas por el modo masivo que aún no se restauran
+ARCHIVO_MODO_MASIVO = 'etl_modo_masivo_pendiente.json'
+
+# Métodos cuyo código define la versión de cada etapa en la caché (si cambian, se recalcula la etapa)
+FUNCIONES_POR_ETAPA = {
+    'transformacion': ('transformar_datos', '_limpiar_valores_unicos', 'limpiar_texto', 'limpiar_texto_serie',
+                       'limpiar_numero', 'limpiar_numero_serie', 'limpiar_fecha', 'procesar_cilindrada',
+                       'procesar_cilindrada_serie', 'limpiar_model_year', 'limpiar_mileage'),
+    'deducciones': ('procesar_deducciones', 'limpiar_numero', 'limpiar_texto'),
+}
+
+# Marca de fin de datos entre etapas del pipeline
+_FIN_BLOQUES = object()
+
+
+def copiar_dataframe(conexion, df, tabla, columnas):
+    """Copiar un DataFrame a una tabla con COPY FROM STDIN dentro de la conexión indicada"""
+    df_copia = df[columnas].copy()
+    # Las columnas flotantes con valores enteros se escriben como enteros para que
+    # COPY las acepte también en columnas integer
+    for columna in df_copia.columns:
+        serie = df_copia[columna]
+        if pd.api.types.is_float_dtype(serie) and serie.dropna().apply(float.is_integer).all():
+            df_copia[columna] = serie.astype('Int64')
+    buffer = io.StringIO()
+    df_copia.to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    lista_columnas = ', '.join(f'"{columna}"' for columna in columnas)
+    cursor = conexion.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {tabla} ({lista_columnas}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+    finally:
+        cursor.close()
+    return len(df_copia)
+
+
+def rangos_consecutivos(ids):
+    """Rangos (desde, hasta) de enteros consecutivos que cubren los IDs recibidos"""
+    rangos = []
+    for valor in sorted({int(i) for i in ids}):
+        if rangos and valor == rangos[-1][1] + 1:
+            rangos[-1][1] = valor
+        else:
+            rangos.append([valor, valor])
+    return [tuple(rango) for rango in rangos]
+
+
+def condicion_rangos(columna, rangos):
+    """Condición SQL que selecciona los valores de la columna dentro de los rangos"""
+    if not rangos:
+        return '1 = 0'
+    return '(' + ' OR '.join(f'"{columna}" = {desde}' if desde == hasta else f'"{columna}" BETWEEN {desde} AND {hasta}'
+                             for desde, hasta in rangos) + ')'
+
+
+class ReferenciasDuplicadas(RuntimeError):
+    """vehicle_appraisal tiene referencia_original repetidas y no admite el índice único del upsert"""
+
+
 class ETLAvaluos:
     """
     Clase para realizar ETL desde mi_tabla hacia vehicle_appraisal
     """
     
-    def __init__(self):
+    def __init__(self, preasignar_ids=False, modo_carga='append', tamano_bloque=None, tamano_cola=2,
+                 workers=1, modo_masivo=False, reanudar=False, max_intentos=4,
+                 carga_asincrona=False, tamano_pool_asincrono=4, latencia_objetivo_lote=2.0,
+                 memoria_maxima_lote_mb=256, directorio_reportes=DIRECTORIO_REPORTES,
+                 medir_memoria_python=False, perfil=None, directorio_perfiles=DIRECTORIO_PERFILES,
+                 limite=None, fraccion_muestra=None, cargador='to_sql', simulacion=False,
+                 usar_cache=False, directorio_cache=DIRECTORIO_CACHE, directorio_simulacion=DIRECTORIO_SIMULACION,
+                 ids_origen=None):
+        if modo_carga not in MODOS_CARGA:
+            raise ValueError(f"modo_carga debe ser uno de {MODOS_CARGA}, no '{modo_carga}'")
+        if cargador not in CARGADORES:
+            raise ValueError(f"cargador debe ser uno de {CARGADORES}, no '{cargador}'")
+        if limite is not None and int(limite) < 1:
+            raise ValueError(f"limite debe ser un entero positivo, no '{limite}'")
+        if fraccion_muestra is not None and not 0 < fraccion_muestra <= 1:
+            raise ValueError(f"fraccion_muestra debe estar entre 0 (excluido) y 1, no '{fraccion_muestra}'")
+        if reanudar and fraccion_muestra is not None:
+            raise ValueError("Una muestra con TABLESAMPLE cambia en cada ejecución: no se puede reanudar")
+        if usar_cache and fraccion_muestra is not None:
+            raise ValueError("Una muestra con TABLESAMPLE cambia en cada ejecución: no se puede guardar en la caché")
+        if simulacion and (reanudar or modo_masivo or carga_asincrona):
+            raise ValueError("La simulación no escribe en la base: no admite reanudar, modo_masivo ni carga_asincrona")
+        if perfil is not None and perfil not in PERFILADORES:
+            raise ValueError(f"perfil debe ser uno de {tuple(PERFILADORES)}, no '{perfil}'")
+        if preasignar_ids and modo_carga != 'append':
+            raise ValueError(f"preasignar_ids solo aplica al modo append: modo_carga='{modo_carga}' "
+                             f"{'conserva los IDs existentes' if modo_carga == 'upsert' else 'obtiene los IDs con RETURNING'}")
+        if carga_asincrona and modo_carga != 'append':
+            raise ValueError(f"La carga asíncrona usa COPY directo y no es compatible con modo_carga='{modo_carga}'")
+        if reanudar and int(workers) > 1 and modo_carga == 'append' and not carga_asincrona:
+            raise ValueError("Con workers > 1 cada partición confirma por separado, sin checkpoint propio: "
+                             "reanudar en modo append podría volver a insertarlas. Use workers=1 o modo_carga='upsert'")
         self.db_connection = None
+        self.preasignar_ids = preasignar_ids
+        self.modo_carga = modo_carga
+        # Con tamano_bloque se usa el pipeline por bloques; sin él, una sola pasada
+        self.tamano_bloque = tamano_bloque
+        self.tamano_cola = tamano_cola
+        # Número de conexiones concurrentes para la carga (cada partición confirma por separado)
+        self.workers = max(1, int(workers))
+        # Modo masivo: retirar índices secundarios y llaves foráneas durante la carga
+        self.modo_masivo = modo_masivo
+        self._definiciones_masivas = None
+        # Checkpoints por bloque y reanudación de la última ejecución
+        self.reanudar = reanudar
+        self.run_id = None
+        self._checkpoints_activos = False
+        # Filas, columnas y suma de un hash por fila de lo extraído: la huella de origen de etl_runs
+        self._huella_extraida = None
+        self._watermark_reanudacion = None
+        # Rangos de id_unico de bloques confirmados después del primer bloque que falta
+        self._rangos_confirmados = []
+        self._siguiente_bloque = 1
+        # Los errores transitorios se reintentan por bloque/partición con espera exponencial
+        self.reintentador = Reintentador(max_intentos=max_intentos)
+        # Carga asíncrona (asyncpg): los bloques se envían y el hilo principal sigue transformando
+        self.carga_asincrona = carga_asincrona
+        self.tamano_pool_asincrono = tamano_pool_asincrono
+        self._cargador_asincrono = None
+        # Tamaño de lote adaptativo para las inserciones con to_sql
+        self.latencia_objetivo_lote = latencia_objetivo_lote
+        self.memoria_maxima_lote_mb = memoria_maxima_lote_mb
+        self._registro_lotes = None
+        self._indice_referencia_verificado = False
+        # Spans por etapa y reporte JSON de cada ejecución (directorio_reportes=None no lo escribe)
+        self.directorio_reportes = directorio_reportes
+        self.medir_memoria_python = medir_memoria_python
+        self.instrumentacion = Instrumentacion()
+        self._resumen_conexiones = None
+        # Perfilado opcional por etapa (cpu, memory o sampling) con un directorio por ejecución
+        self.perfil = perfil
+        self.directorio_perfiles = directorio_perfiles
+        self._directorio_perfil = None
+        self._etapas_sin_perfil = None
+        # Ejecuciones de prueba: primeros `limite` registros o muestra del servidor (TABLESAMPLE)
+        self.limite = int(limite) if limite is not None else None
+        self.fraccion_muestra = fraccion_muestra
+        self.cargador = cargador
+        # Ejecución incremental: solo los id_unico indicados (p. ej. los registros del DBF que cambiaron)
+        self.rangos_origen = rangos_consecutivos(ids_origen) if ids_origen is not None else None
+        # Simulación: transformar y construir deducciones sin escribir en la base; el resultado,
+        # con IDs sintéticos, va a Parquet en directorio_simulacion/<run_id>/ (si hay pyarrow o fastparquet)
+        self.simulacion = simulacion
+        self.directorio_simulacion = directorio_simulacion
+        self._salida_simulacion = None
+        self._ids_simulados = {'vehicle_appraisal': 0, 'appraisal_deductions': 0}
+        # Caché de etapas en Parquet (extracción, transformación y deducciones)
+        self.usar_cache = usar_cache
+        self.directorio_cache = directorio_cache
+        self.cache = None
+        self._clave_extraccion = None
+        self._versiones_cache = {}
         
     def conectar_base_datos(self):
         """Establecer conexión con la base de datos"""
         try:
             self.db_connection = DatabaseConnection()
+            if not self.db_connection.es_postgresql:
+                # COPY, secuencias, staging UNLOGGED, CTE con RETURNING, asyncpg y pg_catalog son de PostgreSQL
+                solo_postgresql = [nombre for nombre, activa in (
+                    ("preasignar_ids", self.preasignar_ids), (f"modo_carga='{self.modo_carga}'", self.modo_carga != 'append'),
+                    ("modo_masivo", self.modo_masivo), ("carga_asincrona", self.carga_asincrona),
+                    ("cargador='copy'", self.cargador == 'copy'),
+                    ("fraccion_muestra (TABLESAMPLE)", self.fraccion_muestra is not None)) if activa]
+                if solo_postgresql:
+                    logger.error(f"❌ Opciones disponibles solo con PostgreSQL: {', '.join(solo_postgresql)}")
+                    return False
+                logger.info(f"🗄️ Backend local SQLite: {self.db_connection.ruta_sqlite}")
+            # El engine se crea con un SELECT 1: sin servidor accesible la conexión falla aquí
+            self.db_connection.get_engine()
+            configuracion = self.db_connection.configuracion_pool
+            capacidad = configuracion['pool_size'] + configuracion['max_overflow']
+            if self.workers > capacidad:
+                logger.warning(f"⚠️ {self.workers} workers para un pool de {capacidad} conexiones "
+                               f"(DB_POOL_SIZE + DB_MAX_OVERFLOW): las particiones esperarán conexión")
             logger.info("✅ Conexión establecida correctamente")
             return True
         except Exception as e:
             logger.error(f"❌ Error al conectar: {e}")
             return False
     
+    def _consulta_extraccion(self, ordenar=False, desde_id=None, hasta_id=None):
+        """Construir la consulta de extracción de mi_tabla"""
+        query = """
+        SELECT 
+            "id_unico",
+            "CILINDRADA",
+            "COMBUSTIBL", 
+            "NUMERO_CER",
+            "SOLICITANT",
+            "PROPIETARI",
+            "MARCA",
+            "MODELO", 
+            "A_O",
+            "KMS",
+            "ORIGEN",
+            "COLOR",
+            "PLACAS",
+            "NOTA",
+            "ACCESORIOS",
+            "VIN_CHASIS",
+            "__VIN_DE_C",
+            "__VIN_DE_M", 
+            "VIN_DE_MOT",
+            "TOTAL_DE_R",
+            "MODIF_KM",
+            "VALOR_EXTR",
+            "DESCUENTOS",
+            "AV_BANC_NU",
+            "AVALUO_BAN",
+            "_FECHAS_1",
+            "AVALUO_DIS",
+            "VALOR_GIBS",
+            "AV_DIST_NU",
+            "MOTOR1",
+            "MOTOR2",
+            "TRANSMISIO",
+            "TRANSMICIO",
+            "SUSPENSION",
+            "SUSPENSIO2",
+            "DIRECCION",
+            "DIRECCION2",
+            "FRENOS",
+            "FRENOS2",
+            "LLANTAS",
+            "RUEDAS",
+            "SIST_ELECT",
+            "SISTELEC2",
+            "INTYACC2", 
+            "INTERIOR_Y",
+            "CARROCERI2",
+            "MOTOR_"
+        FROM public.mi_tabla"""
+        if self.fraccion_muestra is not None:
+            # Muestra por páginas del lado del servidor: solo se leen las páginas elegidas
+            query += f" TABLESAMPLE SYSTEM ({float(self.fraccion_muestra) * 100:g})"
+        query += '\n        WHERE "id_unico" IS NOT NULL'
+        if desde_id is not None:
+            query += f' AND "id_unico" > {int(desde_id)}'
+        if hasta_id is not None:
+            query += f' AND "id_unico" <= {int(hasta_id)}'
+        if self.rangos_origen is not None:
+            query += f" AND {condicion_rangos('id_unico', self.rangos_origen)}"
+        if self._rangos_confirmados:
+            query += f" AND NOT {condicion_rangos('id_unico', self._rangos_confirmados)}"
+        # Con límite se ordena para que una ejecución de prueba tome siempre los mismos registros
+        if ordenar or self.limite:
+            query += ' ORDER BY "id_unico"'
+        if self.limite:
+            query += f' LIMIT {self.limite}'
+        return query
+    
+    def _huella_origen(self, consulta):
+        """Cantidad de filas y suma de un hash por fila del resultado de la consulta, calculadas en el servidor"""
+        if self.db_connection.es_postgresql:
+            suma = "hashtext(t::text)::bigint"
+        else:
+            # hash_texto se registra en cada conexión de backend_sqlite
+            fila = " || ',' || ".join(f'quote("{columna}")' for columna in ['id_unico'] + backend_sqlite.COLUMNAS_MI_TABLA)
+            suma = f"hash_texto({fila})"
+        with self.db_connection.get_engine('extract').connect() as conexion:
+            filas, total = conexion.execute(sqlalchemy.text(
+                f"SELECT count(*), coalesce(sum({suma}), 0) FROM ({consulta}) t")).one()
+        return {'filas': int(filas), 'suma': int(total)}
+    
+    def _preparar_cache(self):
+        """Abrir la caché de etapas y calcular la clave de la extracción de esta ejecución"""
+        try:
+            cache = CacheEtapas(self.directorio_cache)
+        except ImportError as e:
+            logger.warning(f"⚠️ {e}: se continúa sin caché")
+            return False
+        consulta = self._consulta_extraccion(ordenar=bool(self.tamano_bloque), desde_id=self._watermark_reanudacion)
+        try:
+            huella = self.reintentador.ejecutar("huella de mi_tabla", self._huella_origen, consulta)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo calcular la huella de mi_tabla, se continúa sin caché: {e}")
+            return False
+        self.cache = cache
+        self._clave_extraccion = clave(huella, consulta, self.tamano_bloque)
+        self._versiones_cache = {etapa: version_codigo(*(getattr(self, nombre) for nombre in nombres))
+                                 for etapa, nombres in FUNCIONES_POR_ETAPA.items()}
+        logger.info(f"🗂️ Caché de etapas en {self.directorio_cache}: mi_tabla con {huella['filas']} registros "
+                    f"(extracción {self._clave_extraccion[:12]})")
+        return True
+    
+    def _bloques_en_cache(self):
+        """Cantidad de bloques de la extracción guardados en la caché, o None si no hay una extracción completa"""
+        if not self.cache:
+            return None
+        marca = self.cache.marca('extraccion', self._clave_extraccion)
+        return marca['bloques'] if marca else None
+    
+    def _nombre_bloque_extraido(self, numero):
+        return f"{self._clave_extraccion}/{numero:05d}"
+    
+    def _leer_bloque_extraido(self, numero):
+        """Bloque de la extracción guardado en la caché"""
+        df = self.cache.leer('extraccion', self._nombre_bloque_extraido(numero))
+        if df is None:
+            ruta = self.cache.ruta('extraccion', self._nombre_bloque_extraido(numero))
+            raise RuntimeError(f"falta o está dañado el bloque {ruta} de la caché; borre {self.directorio_cache}")
+        return df
+    
     def extraer_datos(self):
         """Extraer datos de mi_tabla"""
         try:
-            query = """
-            SELECT 
-                "id_unico",
-                "CILINDRADA",
-                "COMBUSTIBL", 
-                "NUMERO_CER",
-                "SOLICITANT",
-                "PROPIETARI",
-                "MARCA",
-                "MODELO", 
-                "A_O",
-                "KMS",
-                "ORIGEN",
-                "COLOR",
-                "PLACAS",
-                "NOTA",
-                "ACCESORIOS",
-                "VIN_CHASIS",
-                "__VIN_DE_C",
-                "__VIN_DE_M", 
-                "VIN_DE_MOT",
-                "TOTAL_DE_R",
-                "MODIF_KM",
-                "VALOR_EXTR",
-                "DESCUENTOS",
-                "AV_BANC_NU",
-                "AVALUO_BAN",
-                "_FECHAS_1",
-                "AVALUO_DIS",
-                "VALOR_GIBS",
-                "AV_DIST_NU",
-                "MOTOR1",
-                "MOTOR2",
-                "TRANSMISIO",
-                "TRANSMICIO",
-                "SUSPENSION",
-                "SUSPENSIO2",
-                "DIRECCION",
-                "DIRECCION2",
-                "FRENOS",
-                "FRENOS2",
-                "LLANTAS",
-                "RUEDAS",
-                "SIST_ELECT",
-                "SISTELEC2",
-                "INTYACC2", 
-                "INTERIOR_Y",
-                "MOTOR2",
-                "CARROCERI2",
-                "MOTOR_"
-            FROM public.mi_tabla
-            WHERE "id_unico" IS NOT NULL
-            """
-            
-            df = pd.read_sql_query(query, self.db_connection.get_engine())
+            if self._bloques_en_cache():
+                df = self._leer_bloque_extraido(1)
+                logger.info(f"♻️ Extraídos {len(df)} registros de la caché (mi_tabla sin cambios)")
+                return df
+            query = self._consulta_extraccion(desde_id=self._watermark_reanudacion)
+            df = self.reintentador.ejecutar("extracción", pd.read_sql_query, query, self.db_connection.get_engine('extract'))
             logger.info(f"✅ Extraídos {len(df)} registros de mi_tabla")
+            if self.cache and len(df) and self.cache.guardar('extraccion', self._nombre_bloque_extraido(1), df):
+                self.cache.marcar_completo('extraccion', self._clave_extraccion, bloques=1, filas=len(df))
             return df
             
         except Exception as e:
             logger.error(f"❌ Error al extraer datos: {e}")
             return None
     
+    def extraer_datos_por_bloques(self, tamano_bloque):
+        """Extraer mi_tabla en bloques ordenados por id_unico usando un cursor del lado del servidor"""
+        bloques_en_cache = self._bloques_en_cache()
+        if bloques_en_cache:
+            for numero in range(1, bloques_en_cache + 1):
+                df = self._leer_bloque_extraido(numero)
+                logger.info(f"♻️ Bloque {numero} extraído de la caché: {len(df)} registros")
+                yield df
+            return
+        query = self._consulta_extraccion(ordenar=True, desde_id=self._watermark_reanudacion)
+        numero = guardados = filas = 0
+        with self.db_connection.get_engine('extract').connect().execution_options(stream_results=True) as conexion:
+            for numero, df in enumerate(pd.read_sql_query(query, conexion, chunksize=tamano_bloque), start=1):
+                logger.info(f"📦 Bloque {numero} extraído: {len(df)} registros")
+                if self.cache and self.cache.guardar('extraccion', self._nombre_bloque_extraido(numero), df):
+                    guardados += 1
+                    filas += len(df)
+                yield df
+        # La extracción solo se reutiliza si se guardaron todos sus bloques
+        if self.cache and numero and guardados == numero:
+            self.cache.marcar_completo('extraccion', self._clave_extraccion, bloques=numero, filas=filas)
+    
     def limpiar_texto(self, texto):
         """Limpiar y normalizar texto"""
         if pd.isna(texto) or texto is None:
@@ -111,6 +416,23 @@ class ETLAvaluos:
         
         return texto[:100] if len(texto) > 100 else texto
     
+    def _limpiar_valores_unicos(self, serie, limpiar):
+        """
+        Aplicar `limpiar` una vez por valor distinto de la columna y repartir el resultado.
+        Solo para limpiezas que dependen de str(valor), con nulos equivalentes a ''
+        """
+        if serie.empty:
+            return serie.apply(limpiar)
+        codigos, unicos = pd.factorize(serie.where(serie.notna(), '').astype(str))
+        limpios = np.empty(len(unicos), dtype=object)
+        limpios[:] = [limpiar(valor) for valor in unicos]
+        # La construcción desde lista infiere el tipo igual que apply(): int64, float64 con NaN u object
+        return pd.Series(limpios[codigos].tolist(), index=serie.index)
+    
+    def limpiar_texto_serie(self, serie):
+        """limpiar_texto sobre una columna completa, limpiando cada valor distinto una sola vez"""
+        return self._limpiar_valores_unicos(serie, self.limpiar_texto)
+    
     def limpiar_numero(self, numero, tipo='float'):
         """Limpiar y convertir números"""
         if pd.isna(numero) or numero is None:
@@ -138,6 +460,10 @@ class ETLAvaluos:
         except (ValueError, TypeError):
             return None
     
+    def limpiar_numero_serie(self, serie, tipo='float'):
+        """limpiar_numero sobre una columna completa, limpiando cada valor distinto una sola vez"""
+        return self._limpiar_valores_unicos(serie, lambda numero: self.limpiar_numero(numero, tipo))
+    
     def limpiar_fecha(self, fecha):
         """Limpiar y convertir fechas"""
         if pd.isna(fecha) or fecha is None:
@@ -241,6 +567,43 @@ class ETLAvaluos:
             logger.warning(f"⚠️ Error procesando cilindrada {cilindrada}: {e}")
             return None
     
+    def limpiar_model_year(self, x):
+        """Año del modelo como entero entre 1900 y 2030"""
+        if isinstance(x, int):
+            val = x
+        elif isinstance(x, str) and x.isdigit():
+            val = int(x)
+        else:
+            return None
+        if val < 1900 or val > 2030:
+            return None
+        return val
+    
+    def limpiar_mileage(self, x):
+        """Kilometraje como entero no negativo (admite separadores de miles)"""
+        original = x
+        # Limpiar espacios y caracteres comunes
+        if isinstance(x, str):
+            x = x.strip().replace(',', '').replace('.', '')
+        # Permitir enteros puros
+        if isinstance(x, int) and x >= 0:
+            logger.info(f"[mileage] Entrada: {original} -> Salida: {x}")
+            return x
+        elif isinstance(x, float) and x.is_integer() and x >= 0:
+            logger.info(f"[mileage] Entrada: {original} -> Salida: {int(x)}")
+            return int(x)
+        elif isinstance(x, str) and x.isdigit():
+            val = int(x)
+            logger.info(f"[mileage] Entrada: {original} -> Salida: {val}")
+            return val if val >= 0 else None
+        else:
+            logger.info(f"[mileage] Entrada: {original} -> Salida: None")
+            return None
+    
+    def procesar_cilindrada_serie(self, serie):
+        """procesar_cilindrada sobre una columna completa, procesando cada valor distinto una sola vez"""
+        return self._limpiar_valores_unicos(serie, self.procesar_cilindrada)
+    
     def procesar_deducciones(self, df_origen, vehicle_appraisal_ids):
         """Procesar deducciones y crear filas para appraisal_deductions según el mapeo especificado"""
         try:
@@ -350,26 +713,22 @@ class ETLAvaluos:
         try:
             df_transformado = pd.DataFrame()
             
-            # Mapeo completo de campos según la especificación
-            df_transformado['engine_size'] = df_origen['CILINDRADA'].apply(
-                lambda x: self.procesar_cilindrada(x)
-            )
+            # Mapeo completo de campos según la especificación. Los métodos *_serie limpian cada valor
+            # distinto una vez y solo convienen en columnas con pocos valores distintos (catálogos);
+            # identificadores, VIN, placas, notas y montos son casi únicos y van con apply
+            df_transformado['engine_size'] = self.procesar_cilindrada_serie(df_origen['CILINDRADA'])
             
-            df_transformado['fuel_type'] = df_origen['COMBUSTIBL'].apply(self.limpiar_texto)
+            df_transformado['fuel_type'] = self.limpiar_texto_serie(df_origen['COMBUSTIBL'])
             
             # id_unico se usa como la nueva llave única para el mapeo con deducciones
-            df_transformado['referencia_original'] = df_origen['id_unico'].apply(
-                lambda x: self.limpiar_numero(x, 'int')
-            )
+            df_transformado['referencia_original'] = df_origen['id_unico'].apply(self.limpiar_numero, tipo='int')
             
             # NUMERO_CER se mapea al campo cert
-            df_transformado['cert'] = df_origen['NUMERO_CER'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['cert'] = df_origen['NUMERO_CER'].apply(self.limpiar_numero)
             
-            df_transformado['applicant'] = df_origen['SOLICITANT'].apply(self.limpiar_texto)
-            df_transformado['owner'] = df_origen['PROPIETARI'].apply(self.limpiar_texto)
-            df_transformado['brand'] = df_origen['MARCA'].apply(self.limpiar_texto)
+            df_transformado['applicant'] = self.limpiar_texto_serie(df_origen['SOLICITANT'])
+            df_transformado['owner'] = self.limpiar_texto_serie(df_origen['PROPIETARI'])
+            df_transformado['brand'] = self.limpiar_texto_serie(df_origen['MARCA'])
             
             # Log para diagnosticar campos problemáticos
             logger.info(f"📊 Muestra de datos SOLICITANT: {df_origen['SOLICITANT'].head().tolist()}")
@@ -387,99 +746,52 @@ class ETLAvaluos:
             logger.info(f"📊 Ejemplos owner después de limpieza: {ejemplos_owner}")
             logger.info(f"📊 Ejemplos brand después de limpieza: {ejemplos_brand}")
             
-            df_transformado['vehicle_description'] = df_origen['MODELO'].apply(self.limpiar_texto)
+            df_transformado['vehicle_description'] = self.limpiar_texto_serie(df_origen['MODELO'])
             
             # Log temporal para ver cómo se mapea A_O a model_year
             logger.info(f"Ejemplo A_O original: {df_origen['A_O'].head(10).tolist()}")
-            def limpiar_model_year(x):
-                if isinstance(x, int):
-                    val = x
-                elif isinstance(x, str) and x.isdigit():
-                    val = int(x)
-                else:
-                    return None
-                if val < 1900 or val > 2030:
-                    return None
-                return val
-            df_transformado['model_year'] = df_origen['A_O'].apply(limpiar_model_year)
+            df_transformado['model_year'] = df_origen['A_O'].apply(self.limpiar_model_year)
             logger.info(f"Ejemplo model_year transformado: {df_transformado['model_year'].head(10).tolist()}")
             
             # Log temporal para ver cómo se mapea KMS a mileage
             logger.info(f"Ejemplo KMS original: {df_origen['KMS'].head(10).tolist()}")
-            def limpiar_mileage(x):
-                original = x
-                # Limpiar espacios y caracteres comunes
-                if isinstance(x, str):
-                    x = x.strip().replace(',', '').replace('.', '')
-                # Permitir enteros puros
-                if isinstance(x, int) and x >= 0:
-                    logger.info(f"[mileage] Entrada: {original} -> Salida: {x}")
-                    return x
-                elif isinstance(x, float) and x.is_integer() and x >= 0:
-                    logger.info(f"[mileage] Entrada: {original} -> Salida: {int(x)}")
-                    return int(x)
-                elif isinstance(x, str) and x.isdigit():
-                    val = int(x)
-                    logger.info(f"[mileage] Entrada: {original} -> Salida: {val}")
-                    return val if val >= 0 else None
-                else:
-                    logger.info(f"[mileage] Entrada: {original} -> Salida: None")
-                    return None
-            df_transformado['mileage'] = df_origen['KMS'].apply(limpiar_mileage)
+            df_transformado['mileage'] = df_origen['KMS'].apply(self.limpiar_mileage)
             logger.info(f"Ejemplo mileage transformado: {df_transformado['mileage'].head(10).tolist()}")
             
             # ORIGEN no se mapea según la especificación
             
-            df_transformado['color'] = df_origen['COLOR'].apply(self.limpiar_texto)
+            df_transformado['color'] = self.limpiar_texto_serie(df_origen['COLOR'])
             df_transformado['plate_number'] = df_origen['PLACAS'].apply(self.limpiar_texto)
             df_transformado['notes'] = df_origen['NOTA'].apply(self.limpiar_texto)
-            df_transformado['extras'] = df_origen['ACCESORIOS'].apply(self.limpiar_texto)
+            df_transformado['extras'] = self.limpiar_texto_serie(df_origen['ACCESORIOS'])
             df_transformado['vin'] = df_origen['VIN_CHASIS'].apply(self.limpiar_texto)
             df_transformado['vin_card'] = df_origen['__VIN_DE_C'].apply(self.limpiar_texto)
             df_transformado['engine_number'] = df_origen['__VIN_DE_M'].apply(self.limpiar_texto)
             df_transformado['engine_number_card'] = df_origen['VIN_DE_MOT'].apply(self.limpiar_texto)
             
             # Nuevos campos del mapeo
-            df_transformado['total_deductions'] = df_origen['TOTAL_DE_R'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['total_deductions'] = df_origen['TOTAL_DE_R'].apply(self.limpiar_numero)
             
-            df_transformado['modified_km'] = df_origen['MODIF_KM'].apply(
-                lambda x: self.limpiar_numero(x, 'int')
-            )
+            df_transformado['modified_km'] = self.limpiar_numero_serie(df_origen['MODIF_KM'], 'int')
             
-            df_transformado['extra_value'] = df_origen['VALOR_EXTR'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['extra_value'] = df_origen['VALOR_EXTR'].apply(self.limpiar_numero)
             
-            df_transformado['discounts'] = df_origen['DESCUENTOS'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['discounts'] = df_origen['DESCUENTOS'].apply(self.limpiar_numero)
             
-            df_transformado['bank_value_in_dollars'] = df_origen['AV_BANC_NU'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['bank_value_in_dollars'] = df_origen['AV_BANC_NU'].apply(self.limpiar_numero)
             
-            df_transformado['apprasail_value_bank'] = df_origen['AVALUO_BAN'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['apprasail_value_bank'] = df_origen['AVALUO_BAN'].apply(self.limpiar_numero)
             
             # Log para diagnosticar fechas
             logger.info(f"📊 Muestra de _FECHAS_1 original: {df_origen['_FECHAS_1'].head(5).tolist()}")
             df_transformado['appraisal_date'] = df_origen['_FECHAS_1'].apply(self.limpiar_fecha)
             logger.info(f"📊 Muestra de appraisal_date transformado: {df_transformado['appraisal_date'].head(5).tolist()}")
             
-            df_transformado['apprasail_value_lower_cost'] = df_origen['AVALUO_DIS'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['apprasail_value_lower_cost'] = df_origen['AVALUO_DIS'].apply(self.limpiar_numero)
             
-            df_transformado['appraisal_value_trochez'] = df_origen['VALOR_GIBS'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['appraisal_value_trochez'] = df_origen['VALOR_GIBS'].apply(self.limpiar_numero)
             
-            df_transformado['appraisal_value_usd'] = df_origen['AV_DIST_NU'].apply(
-                lambda x: self.limpiar_numero(x, 'float')
-            )
+            df_transformado['appraisal_value_usd'] = df_origen['AV_DIST_NU'].apply(self.limpiar_numero)
             
             # Valores fijos
             df_transformado['validity_days'] = 30
@@ -491,7 +803,8 @@ class ETLAvaluos:
             )
             
             # Filtrar registros con datos mínimos requeridos
-            df_limpio = df_transformado.dropna(subset=['referencia_original'])
+            # copy(): las columnas que se asignan después (limpiezas, IDs preasignados) van sobre un DataFrame propio
+            df_limpio = df_transformado.dropna(subset=['referencia_original']).copy()
             
             # Log para ver cuántos registros tienen los campos después de la limpieza
             logger.info(f"📊 Registros con applicant no vacío: {(df_limpio['applicant'] != '').sum()}")
@@ -531,30 +844,236 @@ class ETLAvaluos:
             logger.error(f"❌ Error en transformación: {e}")
             return None
     
-    def cargar_datos(self, df_transformado):
-        """Cargar datos en vehicle_appraisal usando inserción masiva"""
+    def _transformar_con_cache(self, df_origen):
+        """transformar_datos, reutilizando el resultado guardado para el mismo bloque de origen y código"""
+        if not self.cache or len(df_origen) == 0:
+            return self.transformar_datos(df_origen)
+        nombre = clave(self._versiones_cache['transformacion'], huella_dataframe(df_origen))
+        df_transformado = self.cache.leer('transformacion', nombre)
+        if df_transformado is not None:
+            logger.info(f"♻️ Transformación de {len(df_origen)} registros reutilizada de la caché")
+            return df_transformado
+        df_transformado = self.transformar_datos(df_origen)
+        if df_transformado is not None:
+            self.cache.guardar('transformacion', nombre, df_transformado)
+        return df_transformado
+    
+    def _construir_deducciones(self, df_origen, vehicle_appraisal_ids):
+        """procesar_deducciones con caché: se guardan por id_unico y se asignan a los IDs de esta carga"""
+        if not self.cache or len(df_origen) == 0:
+            return self.procesar_deducciones(df_origen, vehicle_appraisal_ids)
+        nombre = clave(self._versiones_cache['deducciones'], huella_dataframe(df_origen))
+        df_deducciones = self.cache.leer('deducciones', nombre)
+        if df_deducciones is None:
+            # Los IDs de vehicle_appraisal cambian en cada carga: lo guardado usa id_unico como llave
+            ids_identidad = {id_unico: id_unico for id_unico in df_origen['id_unico'].dropna().tolist()}
+            df_deducciones = pd.DataFrame(self.procesar_deducciones(df_origen, ids_identidad),
+                                          columns=COLUMNAS_DEDUCCIONES).rename(columns={'vehicle_appraisal_id': 'id_unico'})
+            self.cache.guardar('deducciones', nombre, df_deducciones)
+        else:
+            logger.info(f"♻️ Deducciones de {len(df_origen)} registros reutilizadas de la caché")
+        return [
+            {'vehicle_appraisal_id': vehicle_appraisal_ids[id_unico], 'amount': amount, 'description': description}
+            for id_unico, amount, description in zip(df_deducciones['id_unico'].tolist(), df_deducciones['amount'].tolist(),
+                                                     df_deducciones['description'].tolist())
+            if id_unico in vehicle_appraisal_ids
+        ]
+    
+    def _insertar_masivo(self, df_insert, tabla, checkpoint=None):
+        """
+        Insertar un DataFrame en public.<tabla>, repartido en particiones concurrentes si workers > 1.
+        `checkpoint` son los argumentos de _registrar_checkpoint para el bloque que se inserta
+        """
+        engine = self.db_connection.get_engine('bulk_load')
+        lote = self._obtener_registro_lotes().obtener(tabla)
+        # Ancho de fila estimado sobre una muestra para respetar el tope de memoria por lote
+        muestra = df_insert.head(1000)
+        bytes_por_fila = int(muestra.memory_usage(deep=True).sum() / len(muestra)) if len(muestra) else None
+        # El INSERT multi-fila usa un parámetro por celda: SQLite limita cuántos admite
+        max_parametros = self.db_connection.max_parametros
+        max_filas = max(1, max_parametros // len(df_insert.columns)) if max_parametros else None
+        
+        def cargar_particion(particion, con_checkpoint=False):
+            # Cada partición usa su propia conexión del pool y confirma su propia transacción,
+            # por lo que un reintento repite solo esa partición
+            with engine.begin() as conexion:
+                if self.cargador == 'copy':
+                    copiar_dataframe(conexion, particion, f'public.{tabla}', list(particion.columns))
+                else:
+                    inicio = 0
+                    while inicio < len(particion):
+                        # El tamaño de cada lote se ajusta según la latencia medida en los anteriores
+                        tamano = lote.tamano_actual(bytes_por_fila)
+                        if max_filas:
+                            tamano = min(tamano, max_filas)
+                        porcion = particion.iloc[inicio:inicio + tamano]
+                        t0 = time.perf_counter()
+                        porcion.to_sql(tabla, conexion, schema='public', if_exists='append', index=False, method='multi')
+                        lote.registrar(len(porcion), time.perf_counter() - t0)
+                        inicio += len(porcion)
+                if con_checkpoint:
+                    self._registrar_checkpoint(conexion=conexion, **checkpoint)
+                elif checkpoint is not None:
+                    # Con particiones concurrentes cada una suma sus filas a etl_runs al confirmarse
+                    filas = {clave: len(particion) for clave in ('filas_avaluos', 'filas_deducciones')
+                             if checkpoint.get(clave) is not None}
+                    self._registrar_avance(conexion, checkpoint['bloque'], **filas)
+            return len(particion)
+        
+        if self.workers <= 1 or len(df_insert) < 2:
+            # Inserción masiva con pandas; el checkpoint se confirma o se pierde junto con las filas
+            self.reintentador.ejecutar(f"carga de {tabla}", cargar_particion, df_insert, checkpoint is not None)
+            return
+        
+        tamano_particion = -(-len(df_insert) // self.workers)
+        particiones = [df_insert.iloc[i:i + tamano_particion] for i in range(0, len(df_insert), tamano_particion)]
+        
+        def cargar_con_reintentos(numero, particion):
+            return self.reintentador.ejecutar(f"carga de {tabla} (partición {numero})", cargar_particion, particion)
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for numero, cargados in enumerate(executor.map(cargar_con_reintentos, range(1, len(particiones) + 1), particiones), start=1):
+                logger.info(f"📦 {tabla}: partición {numero}/{len(particiones)} confirmada ({cargados} registros)")
+        # Las particiones confirman por separado: el checkpoint se registra cuando están todas
+        # (su avance en etl_runs ya se sumó con cada partición)
+        if checkpoint is not None:
+            self._registrar_checkpoint(avance=False, **checkpoint)
+    
+    def cargar_datos(self, df_transformado, checkpoint=None):
+        """Cargar datos en vehicle_appraisal usando inserción masiva (y el checkpoint del bloque, si se indica)"""
+        if self.modo_carga == 'upsert':
+            return self.cargar_datos_upsert(df_transformado, checkpoint)
         try:
-            # Inserción masiva con pandas
-            engine = self.db_connection.get_engine()
             # Selecciona solo las columnas que existen en la tabla destino
-            columnas_destino = [
-                'appraisal_date', 'vehicle_description', 'brand', 'model_year', 'color',
-                'mileage', 'fuel_type', 'engine_size', 'plate_number', 'applicant',
-                'owner', 'appraisal_value_usd', 'appraisal_value_trochez', 'vin',
-                'engine_number', 'notes', 'validity_days', 'validity_kms',
-                'apprasail_value_lower_cost', 'apprasail_value_bank',
-                'apprasail_value_lower_bank', 'extras', 'vin_card', 'engine_number_card',
-                'total_deductions', 'modified_km', 'extra_value', 'discounts', 'bank_value_in_dollars',
-                'referencia_original', 'cert'
-            ]
+            columnas_destino = list(COLUMNAS_VEHICLE_APPRAISAL)
+            # Con IDs preasignados se inserta también la llave primaria
+            if 'vehicle_appraisal_id' in df_transformado.columns:
+                columnas_destino = ['vehicle_appraisal_id'] + columnas_destino
             df_insert = df_transformado[columnas_destino]
-            df_insert.to_sql('vehicle_appraisal', engine, schema='public', if_exists='append', index=False, chunksize=2000, method='multi')
+            self._insertar_masivo(df_insert, 'vehicle_appraisal', checkpoint)
             logger.info(f"✅ Inserción masiva completada: {len(df_insert)} registros en vehicle_appraisal")
             return True
         except Exception as e:
             logger.error(f"❌ Error al cargar datos masivos: {e}")
             return False
     
+    def asegurar_indice_unico_referencia(self, conexion):
+        """Crear el índice único sobre referencia_original que requiere ON CONFLICT"""
+        if conexion.execute(sqlalchemy.text(
+                "SELECT to_regclass('public.ux_vehicle_appraisal_referencia_original')")).scalar() is not None:
+            return
+        # Cargas anteriores sin upsert pueden haber repetido avalúos: con duplicados el índice no se puede crear
+        repetidas = conexion.execute(sqlalchemy.text("""
+            SELECT referencia_original FROM public.vehicle_appraisal
+            WHERE referencia_original IS NOT NULL
+            GROUP BY referencia_original HAVING count(*) > 1
+        """)).scalars().all()
+        if repetidas:
+            raise ReferenciasDuplicadas(
+                f"vehicle_appraisal tiene {len(repetidas)} referencia_original repetidas (p. ej. "
+                f"{', '.join(map(str, sorted(repetidas)[:5]))}), probablemente de cargas anteriores sin upsert. "
+                f"El upsert necesita un índice único sobre referencia_original: elimine los avalúos duplicados "
+                f"(y sus deducciones) antes de usar modo_carga='upsert'")
+        conexion.execute(sqlalchemy.text("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_vehicle_appraisal_referencia_original
+            ON public.vehicle_appraisal (referencia_original)
+        """))
+    
+    def _preparar_staging(self, conexion, tabla_staging, tabla_destino, columnas):
+        """Crear (si no existe) y vaciar una tabla UNLOGGED de staging con las columnas de destino"""
+        lista_columnas = ', '.join(columnas)
+        conexion.execute(sqlalchemy.text(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {tabla_staging} AS
+            SELECT {lista_columnas} FROM {tabla_destino} WITH NO DATA
+        """))
+        conexion.execute(sqlalchemy.text(f"TRUNCATE {tabla_staging}"))
+    
+    def cargar_datos_upsert(self, df_transformado, checkpoint=None):
+        """Cargar vehicle_appraisal de forma idempotente: staging + INSERT ... ON CONFLICT (referencia_original)"""
+        try:
+            columnas = list(COLUMNAS_VEHICLE_APPRAISAL)
+            columnas_actualizables = [c for c in columnas if c != 'referencia_original']
+            asignaciones = ',\n                        '.join(f'{c} = EXCLUDED.{c}' for c in columnas_actualizables)
+            lista_columnas = ', '.join(columnas)
+            valores_actuales = ', '.join(f'va.{c}' for c in columnas_actualizables)
+            valores_nuevos = ', '.join(f'EXCLUDED.{c}' for c in columnas_actualizables)
+            
+            def upsert():
+                with self.db_connection.get_engine('bulk_load').begin() as conexion:
+                    self.asegurar_indice_unico_referencia(conexion)
+                    self._preparar_staging(conexion, 'public.etl_stg_vehicle_appraisal', 'public.vehicle_appraisal', columnas)
+                    copiar_dataframe(conexion, df_transformado, 'public.etl_stg_vehicle_appraisal', columnas)
+                    
+                    # Solo se escriben las filas nuevas o cuyos valores cambiaron
+                    escritos = conexion.execute(sqlalchemy.text(f"""
+                        INSERT INTO public.vehicle_appraisal AS va ({lista_columnas})
+                        SELECT {lista_columnas} FROM public.etl_stg_vehicle_appraisal
+                        ON CONFLICT (referencia_original) DO UPDATE SET
+                        {asignaciones}
+                        WHERE ({valores_actuales}) IS DISTINCT FROM ({valores_nuevos})
+                    """)).rowcount
+                    if checkpoint is not None:
+                        self._registrar_checkpoint(conexion=conexion, **checkpoint)
+                    return escritos
+            
+            escritos = self.reintentador.ejecutar("upsert de vehicle_appraisal", upsert)
+            logger.info(f"✅ Upsert completado: {escritos} de {len(df_transformado)} registros insertados o actualizados en vehicle_appraisal")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error en upsert de vehicle_appraisal: {e}")
+            return False
+    
+    def reservar_ids_vehicle_appraisal(self, cantidad):
+        """Reservar un bloque de IDs de la secuencia de vehicle_appraisal en una sola consulta"""
+        try:
+            query = """
+                SELECT nextval(pg_get_serial_sequence('public.vehicle_appraisal', 'vehicle_appraisal_id')) AS id
+                FROM generate_series(1, $1::integer)
+            """
+            def reservar():
+                with self.db_connection.get_engine().begin() as conexion:
+                    filas = self.db_connection.ejecutar_preparada(conexion, 'reservar_ids', query, (int(cantidad),))
+                    return sorted(row.id for row in filas)
+            
+            ids = self.reintentador.ejecutar("reserva de IDs", reservar)
+            logger.info(f"✅ Reservados {len(ids)} IDs de vehicle_appraisal ({ids[0]} - {ids[-1]})" if ids else "📝 No se reservaron IDs")
+            return ids
+        except Exception as e:
+            logger.error(f"❌ Error reservando IDs de vehicle_appraisal: {e}")
+            return None
+    
+    def asignar_ids_preasignados(self, df_transformado):
+        """Asignar IDs reservados al DataFrame transformado y devolver el mapeo id_unico -> vehicle_appraisal_id"""
+        ids = self.reservar_ids_vehicle_appraisal(len(df_transformado))
+        if ids is None or len(ids) != len(df_transformado):
+            return None
+        df_transformado['vehicle_appraisal_id'] = ids
+        return dict(zip(df_transformado['referencia_original'].tolist(), ids))
+    
+    def asegurar_indice_referencia(self):
+        """Crear el índice de vehicle_appraisal.referencia_original si no existe"""
+        if self._indice_referencia_verificado:
+            return True
+        try:
+            with self.db_connection.get_engine().begin() as conexion:
+                if self.db_connection.es_postgresql:
+                    conexion.execute(sqlalchemy.text("""
+                        CREATE INDEX IF NOT EXISTS idx_vehicle_appraisal_referencia_original
+                        ON public.vehicle_appraisal (referencia_original)
+                    """))
+                else:
+                    # En SQLite el esquema va en el nombre del índice
+                    conexion.execute(sqlalchemy.text("""
+                        CREATE INDEX IF NOT EXISTS public.idx_vehicle_appraisal_referencia_original
+                        ON vehicle_appraisal (referencia_original)
+                    """))
+            self._indice_referencia_verificado = True
+            logger.info("✅ Índice sobre referencia_original verificado")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo crear el índice sobre referencia_original: {e}")
+            return False
+    
     def obtener_vehicle_appraisal_ids(self, df_origen):
         """Obtener los IDs de vehicle_appraisal basados en id_unico"""
         try:
@@ -570,42 +1089,37 @@ class ETLAvaluos:
             logger.info(f"🔍 Valores a buscar: {len(ids_unicos)} id_unico únicos")
             logger.info(f"🔍 Ejemplos: {ids_unicos[:5].tolist()}")
             
-            # Buscar los vehicle_appraisal_id por id_unico (que se guarda como referencia_original)
-            session = self.db_connection.get_engine().connect()
-            try:
-                # Crear consulta con placeholders limitados para evitar errores
-                # Procesar en lotes de 100 para evitar demasiados parámetros
-                batch_size = 100
-                total_mapped = 0
-                
-                for i in range(0, len(ids_unicos), batch_size):
-                    batch = ids_unicos[i:i+batch_size]
-                    placeholders = ','.join([':val' + str(j) for j in range(len(batch))])
-                    query = f"""
-                        SELECT vehicle_appraisal_id, referencia_original 
-                        FROM public.vehicle_appraisal 
-                        WHERE referencia_original IN ({placeholders})
-                    """
-                    
-                    # Crear diccionario de parámetros para este lote
-                    params = {f'val{j}': valor for j, valor in enumerate(batch.tolist())}
-                    
-                    result = session.execute(text(query), params)
-                    batch_found = 0
-                    for row in result:
-                        vehicle_appraisal_ids[row.referencia_original] = row.vehicle_appraisal_id
-                        batch_found += 1
-                        total_mapped += 1
-                    
-                    logger.info(f"🔍 Lote {i//batch_size + 1}: {batch_found} IDs encontrados")
-                
-                logger.info(f"✅ Total mapeados: {total_mapped} IDs de vehicle_appraisal")
-                if len(vehicle_appraisal_ids) > 0:
-                    logger.info(f"📊 Ejemplos de mapeo: {list(vehicle_appraisal_ids.items())[:3]}")
-                return vehicle_appraisal_ids
-                
-            finally:
-                session.close()
+            self.asegurar_indice_referencia()
+            
+            # Una sola consulta con el conjunto completo como arreglo (= ANY) en lugar
+            # de lotes de placeholders: un solo plan, preparado una vez por conexión
+            query = """
+                SELECT vehicle_appraisal_id, referencia_original 
+                FROM public.vehicle_appraisal 
+                WHERE referencia_original = ANY($1)
+            """
+            ids = [int(valor) for valor in ids_unicos.tolist()]
+            parametro = ids
+            if not self.db_connection.es_postgresql:
+                # SQLite no tiene arreglos: el conjunto viaja como un solo parámetro JSON
+                query = """
+                    SELECT vehicle_appraisal_id, referencia_original 
+                    FROM public.vehicle_appraisal 
+                    WHERE referencia_original IN (SELECT value FROM json_each($1))
+                """
+                parametro = json.dumps(ids)
+            
+            def consultar():
+                with self.db_connection.get_engine().connect() as conexion:
+                    return self.db_connection.ejecutar_preparada(conexion, 'resolver_ids', query, (parametro,)).fetchall()
+            
+            for row in self.reintentador.ejecutar("resolución de IDs", consultar):
+                vehicle_appraisal_ids[row.referencia_original] = row.vehicle_appraisal_id
+            
+            logger.info(f"✅ Total mapeados: {len(vehicle_appraisal_ids)} IDs de vehicle_appraisal")
+            if len(vehicle_appraisal_ids) > 0:
+                logger.info(f"📊 Ejemplos de mapeo: {list(vehicle_appraisal_ids.items())[:3]}")
+            return vehicle_appraisal_ids
                 
         except Exception as e:
             logger.error(f"❌ Error obteniendo vehicle_appraisal_ids: {e}")
@@ -626,7 +1140,7 @@ class ETLAvaluos:
                     LIMIT {limite}
                 """
                 
-                result = session.execute(text(query))
+                result = session.execute(sqlalchemy.text(query))
                 for row in result:
                     vehicle_appraisal_ids[row.referencia_original] = row.vehicle_appraisal_id
                 
@@ -642,107 +1156,1133 @@ class ETLAvaluos:
             logger.error(f"❌ Error obteniendo últimos IDs: {e}")
             return {}
     
-    def cargar_deducciones(self, deducciones):
-        """Cargar deducciones en appraisal_deductions usando inserción masiva"""
+    def cargar_deducciones(self, deducciones, ids_reemplazar=None, checkpoint=None):
+        """Cargar deducciones en appraisal_deductions usando inserción masiva (y el checkpoint del bloque, si se indica)"""
+        if self.modo_carga == 'upsert':
+            return self.reemplazar_deducciones(deducciones, ids_reemplazar, checkpoint)
         try:
             if not deducciones:
                 logger.info("📝 No hay deducciones para cargar")
+                if checkpoint is not None:
+                    self._registrar_checkpoint(**checkpoint)
                 return True
-            engine = self.db_connection.get_engine()
             df_deducciones = pd.DataFrame(deducciones)
-            columnas_destino = ['vehicle_appraisal_id', 'amount', 'description']
-            df_insert = df_deducciones[columnas_destino]
-            df_insert.to_sql('appraisal_deductions', engine, schema='public', if_exists='append', index=False, chunksize=2000, method='multi')
+            df_insert = df_deducciones[COLUMNAS_DEDUCCIONES]
+            self._insertar_masivo(df_insert, 'appraisal_deductions', checkpoint)
             logger.info(f"✅ Inserción masiva completada: {len(df_insert)} registros en appraisal_deductions")
             return True
         except Exception as e:
             logger.error(f"❌ Error al cargar deducciones masivas: {e}")
             return False
     
+    def reemplazar_deducciones(self, deducciones, ids_reemplazar=None, checkpoint=None):
+        """Reemplazar las deducciones de cada avalúo en una sola transacción (staging + DELETE + INSERT)"""
+        try:
+            df_deducciones = pd.DataFrame(deducciones, columns=COLUMNAS_DEDUCCIONES)
+            # Se reemplazan las deducciones de todos los avalúos del lote, aunque ya no tengan ninguna
+            ids = set(df_deducciones['vehicle_appraisal_id'].tolist())
+            if ids_reemplazar is not None:
+                ids.update(ids_reemplazar)
+            ids = [int(i) for i in ids]
+            if not ids:
+                logger.info("📝 No hay deducciones para cargar")
+                if checkpoint is not None:
+                    self._registrar_checkpoint(**checkpoint)
+                return True
+            
+            def reemplazar():
+                with self.db_connection.get_engine('bulk_load').begin() as conexion:
+                    self._preparar_staging(conexion, 'public.etl_stg_appraisal_deductions', 'public.appraisal_deductions', COLUMNAS_DEDUCCIONES)
+                    copiar_dataframe(conexion, df_deducciones, 'public.etl_stg_appraisal_deductions', COLUMNAS_DEDUCCIONES)
+                    eliminadas = conexion.execute(sqlalchemy.text("""
+                        DELETE FROM public.appraisal_deductions WHERE vehicle_appraisal_id = ANY(:ids)
+                    """), {'ids': ids}).rowcount
+                    conexion.execute(sqlalchemy.text("""
+                        INSERT INTO public.appraisal_deductions (vehicle_appraisal_id, amount, description)
+                        SELECT vehicle_appraisal_id, amount, description FROM public.etl_stg_appraisal_deductions
+                    """))
+                    if checkpoint is not None:
+                        self._registrar_checkpoint(conexion=conexion, **checkpoint)
+                    return eliminadas
+            
+            eliminadas = self.reintentador.ejecutar("reemplazo de appraisal_deductions", reemplazar)
+            
+            logger.info(f"✅ Deducciones reemplazadas: {eliminadas} eliminadas, {len(df_deducciones)} insertadas para {len(ids)} avalúos")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al reemplazar deducciones: {e}")
+            return False
+    
     def verificar_carga(self):
-        """Verificar que los datos se cargaron correctamente"""
+        """
+        Verificar la carga de esta ejecución con su fila de etl_runs (búsqueda por llave primaria).
+        Sin registro de ejecuciones se cuenta vehicle_appraisal completa
+        """
         try:
-            query = "SELECT COUNT(*) as total FROM public.vehicle_appraisal"
-            resultado = pd.read_sql_query(query, self.db_connection.get_engine())
-            total = resultado['total'].iloc[0]
-            logger.info(f"📊 Total de registros en vehicle_appraisal: {total}")
+            if not self._checkpoints_activos or self.run_id is None:
+                query = "SELECT COUNT(*) as total FROM public.vehicle_appraisal"
+                resultado = pd.read_sql_query(query, self.db_connection.get_engine('verify'))
+                total = resultado['total'].iloc[0]
+                logger.info(f"📊 Total de registros en vehicle_appraisal: {total}")
+                return total
+            ejecucion = self.consultar_ejecucion(self.run_id)
+            total = ejecucion['filas_cargadas']
+            logger.info(f"📊 Ejecución {self.run_id}: {total} registros en vehicle_appraisal y "
+                        f"{ejecucion['deducciones_cargadas']} en appraisal_deductions "
+                        f"(id_unico {ejecucion['id_desde']} - {ejecucion['id_hasta']})")
+            transformadas = self.instrumentacion.etapas().get('transformacion', {}).get('filas_salida')
+            # Al reanudar, etl_runs también cuenta lo cargado por los intentos anteriores
+            if not self.reanudar and transformadas is not None and total != transformadas:
+                logger.warning(f"⚠️ Se transformaron {transformadas} registros pero etl_runs registra {total} cargados")
             return total
         except Exception as e:
             logger.error(f"❌ Error al verificar carga: {e}")
             return 0
     
+    def _verificar_simulacion(self):
+        """Contar los avalúos escritos por la simulación, leyendo solo la columna de IDs"""
+        if not self._salida_simulacion:
+            total = self._ids_simulados['vehicle_appraisal']
+        else:
+            total = len(pd.read_parquet(os.path.join(self._salida_simulacion, 'vehicle_appraisal'),
+                                        engine=motor_parquet(), columns=['vehicle_appraisal_id']))
+        logger.info(f"📊 Total de avalúos simulados: {total} (deducciones: {self._ids_simulados['appraisal_deductions']})")
+        return total
+    
+    def _cargar_encadenado(self, df_origen, df_transformado, bloque):
+        """Cargar avalúos, resolver sus IDs y después cargar deducciones"""
+        # 4. Cargar datos de vehicle_appraisal
+        checkpoint = {'bloque': bloque, 'etapa': 'avaluos', 'filas_avaluos': len(df_transformado)}
+        with self.instrumentacion.span('carga_avaluos', filas_entrada=len(df_transformado)):
+            if not self.cargar_datos(df_transformado, checkpoint):
+                return False
+        
+        # 5. Obtener los IDs de vehicle_appraisal para las deducciones
+        vehicle_appraisal_ids = self.instrumentacion.medir('mapeo_ids', self.obtener_vehicle_appraisal_ids, df_origen,
+                                                           filas_entrada=len(df_origen))
+        
+        # Si no encontramos IDs, intentar con los últimos registros insertados
+        if len(vehicle_appraisal_ids) == 0:
+            logger.warning("⚠️ No se encontraron IDs específicos, buscando últimos registros insertados...")
+            vehicle_appraisal_ids = self.obtener_ultimos_ids_insertados(1000)
+        
+        # 6. Procesar y cargar deducciones
+        deducciones = self.instrumentacion.medir('deducciones', self._construir_deducciones, df_origen,
+                                                 vehicle_appraisal_ids, filas_entrada=len(df_origen))
+        self._cargar_deducciones_bloque(bloque, deducciones, vehicle_appraisal_ids)
+        return True
+    
+    def _cargar_con_ids_preasignados(self, df_origen, df_transformado, bloque):
+        """Cargar avalúos y deducciones usando IDs reservados de antemano"""
+        vehicle_appraisal_ids = self.instrumentacion.medir('mapeo_ids', self.asignar_ids_preasignados, df_transformado,
+                                                           filas_entrada=len(df_transformado))
+        if vehicle_appraisal_ids is None:
+            logger.error("❌ No se pudieron preasignar los IDs de vehicle_appraisal")
+            return False
+        
+        # Las deducciones ya no dependen de la carga: se procesan en paralelo con ella
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            futuro_deducciones = executor.submit(self.instrumentacion.medir, 'deducciones', self._construir_deducciones,
+                                                 df_origen, vehicle_appraisal_ids, filas_entrada=len(df_origen))
+            with self.instrumentacion.span('carga_avaluos', filas_entrada=len(df_transformado)):
+                carga_exitosa = self.cargar_datos(df_transformado, {'bloque': bloque, 'etapa': 'avaluos',
+                                                                    'filas_avaluos': len(df_transformado)})
+            deducciones = futuro_deducciones.result()
+        
+        if not carga_exitosa:
+            return False
+        
+        self._cargar_deducciones_bloque(bloque, deducciones, vehicle_appraisal_ids)
+        return True
+    
+    def _cargar_bloque_cte(self, df_origen, df_transformado, bloque):
+        """Cargar avalúos y deducciones de un bloque en una sola transacción con INSERT ... RETURNING en un CTE"""
+        # Las deducciones se construyen con id_unico como llave; el CTE la cambia por el ID generado
+        ids_identidad = {id_unico: id_unico for id_unico in df_origen['id_unico'].dropna().tolist()}
+        deducciones = self.instrumentacion.medir('deducciones', self._construir_deducciones, df_origen, ids_identidad,
+                                                 filas_entrada=len(df_origen))
+        df_deducciones = pd.DataFrame(deducciones, columns=COLUMNAS_DEDUCCIONES).rename(
+            columns={'vehicle_appraisal_id': 'referencia_original'})
+        columnas = list(COLUMNAS_VEHICLE_APPRAISAL)
+        lista_columnas = ', '.join(columnas)
+        
+        def cargar():
+            with self.db_connection.get_engine('bulk_load').begin() as conexion:
+                conexion.execute(sqlalchemy.text(f"""
+                    CREATE TEMP TABLE etl_tmp_avaluos ON COMMIT DROP AS
+                    SELECT {lista_columnas} FROM public.vehicle_appraisal WITH NO DATA
+                """))
+                conexion.execute(sqlalchemy.text("""
+                    CREATE TEMP TABLE etl_tmp_deducciones ON COMMIT DROP AS
+                    SELECT NULL::bigint AS referencia_original, amount, description
+                    FROM public.appraisal_deductions WITH NO DATA
+                """))
+                copiar_dataframe(conexion, df_transformado, 'etl_tmp_avaluos', columnas)
+                copiar_dataframe(conexion, df_deducciones, 'etl_tmp_deducciones', ['referencia_original', 'amount', 'description'])
+                
+                filas_deducciones = conexion.execute(sqlalchemy.text(f"""
+                    WITH ins AS (
+                        INSERT INTO public.vehicle_appraisal ({lista_columnas})
+                        SELECT {lista_columnas} FROM etl_tmp_avaluos
+                        RETURNING vehicle_appraisal_id, referencia_original
+                    )
+                    INSERT INTO public.appraisal_deductions (vehicle_appraisal_id, amount, description)
+                    SELECT ins.vehicle_appraisal_id, d.amount, d.description
+                    FROM etl_tmp_deducciones d
+                    JOIN ins ON ins.referencia_original = d.referencia_original
+                """)).rowcount
+                self._registrar_checkpoint(bloque, 'completo', filas_avaluos=len(df_transformado),
+                                           filas_deducciones=filas_deducciones, conexion=conexion)
+                return filas_deducciones
+        
+        try:
+            with self.instrumentacion.span('carga_cte', filas_entrada=len(df_transformado)) as span:
+                filas_deducciones = self.reintentador.ejecutar(f"carga CTE del bloque {bloque['bloque']}", cargar)
+                span.filas_salida = len(df_transformado) + filas_deducciones
+            logger.info(f"✅ Bloque {bloque['bloque']} cargado en una transacción: {len(df_transformado)} registros en "
+                        f"vehicle_appraisal, {filas_deducciones} en appraisal_deductions")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error en la carga CTE del bloque {bloque['bloque']}: {e}")
+            return False
+    
+    def _enviar_bloque_asincrono(self, df_origen, df_transformado, bloque):
+        """Preasignar IDs, construir deducciones y encolar el bloque en el cargador asíncrono"""
+        vehicle_appraisal_ids = self.instrumentacion.medir('mapeo_ids', self.asignar_ids_preasignados, df_transformado,
+                                                           filas_entrada=len(df_transformado))
+        if vehicle_appraisal_ids is None:
+            logger.error("❌ No se pudieron preasignar los IDs de vehicle_appraisal")
+            return False
+        deducciones = self.instrumentacion.medir('deducciones', self._construir_deducciones, df_origen,
+                                                 vehicle_appraisal_ids, filas_entrada=len(df_origen))
+        df_avaluos = df_transformado[['vehicle_appraisal_id'] + COLUMNAS_VEHICLE_APPRAISAL]
+        df_deducciones = pd.DataFrame(deducciones, columns=COLUMNAS_DEDUCCIONES)
+        # El checkpoint 'completo' se escribe en la misma transacción que el bloque
+        checkpoint = dict(bloque, run_id=self.run_id) if self._checkpoints_activos else None
+        # Solo mide la espera por lugar en vuelo; la carga termina en segundo plano
+        try:
+            with self.instrumentacion.span('envio_asincrono', filas_entrada=len(df_avaluos)):
+                self._cargador_asincrono.enviar_bloque(df_avaluos, df_deducciones, checkpoint)
+        except Exception as e:
+            logger.error(f"❌ La carga asíncrona de un bloque anterior falló, no se envía el bloque {bloque['bloque']}: {e}")
+            return False
+        logger.info(f"📤 Bloque {bloque['bloque']} enviado a la carga asíncrona ({len(df_avaluos)} avalúos, {len(df_deducciones)} deducciones)")
+        return True
+    
+    def _esperar_carga_asincrona(self):
+        """Esperar los bloques en vuelo de la carga asíncrona"""
+        try:
+            with self.instrumentacion.span('espera_carga_asincrona') as span:
+                avaluos, deducciones = self._cargador_asincrono.esperar()
+                span.filas_salida = avaluos + deducciones
+            logger.info(f"✅ Carga asíncrona completada: {avaluos} registros en vehicle_appraisal, {deducciones} en appraisal_deductions")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error en la carga asíncrona: {e}")
+            return False
+    
+    def _cargar_deducciones_bloque(self, bloque, deducciones, vehicle_appraisal_ids):
+        """Cargar las deducciones de un bloque y marcarlo como completo si se confirmaron"""
+        logger.info(f"🔍 Deducciones procesadas: {len(deducciones) if deducciones else 0}")
+        checkpoint = {'bloque': bloque, 'etapa': 'completo', 'filas_deducciones': len(deducciones or [])}
+        # En upsert se reemplazan aunque el bloque no tenga deducciones: los avalúos actualizados pierden las anteriores
+        if deducciones or self.modo_carga == 'upsert':
+            if deducciones:
+                logger.info(f"📋 Ejemplos de deducciones a insertar: {deducciones[:3]}")
+            with self.instrumentacion.span('carga_deducciones', filas_entrada=len(deducciones or [])):
+                cargadas = self.cargar_deducciones(deducciones or [], list(vehicle_appraisal_ids.values()), checkpoint)
+            if not cargadas:
+                # El bloque queda en etapa 'avaluos' para completarlo con --resume
+                logger.warning("⚠️ Error al cargar deducciones, pero el ETL principal se completó")
+                return False
+        else:
+            logger.warning("⚠️ No se generaron deducciones para insertar")
+            self._registrar_checkpoint(**checkpoint)
+        return True
+    
+    def _asegurar_tabla_checkpoints(self):
+        """Crear las tablas de checkpoints por bloque y de ejecuciones (etl_runs) si no existen"""
+        ahora = self.db_connection.marca_tiempo
+        try:
+            with self.db_connection.get_engine().begin() as conexion:
+                conexion.execute(sqlalchemy.text(f"""
+                    CREATE TABLE IF NOT EXISTS public.etl_checkpoints (
+                        run_id text NOT NULL,
+                        bloque integer NOT NULL,
+                        id_desde bigint,
+                        id_hasta bigint,
+                        filas_avaluos integer,
+                        filas_deducciones integer,
+                        etapa text NOT NULL,
+                        actualizado timestamptz NOT NULL DEFAULT ({ahora}),
+                        PRIMARY KEY (run_id, bloque)
+                    )
+                """))
+                conexion.execute(sqlalchemy.text(f"""
+                    CREATE TABLE IF NOT EXISTS public.etl_runs (
+                        run_id text PRIMARY KEY,
+                        estado text NOT NULL,
+                        huella_origen text,
+                        id_desde bigint,
+                        id_hasta bigint,
+                        filas_extraidas bigint,
+                        filas_transformadas bigint,
+                        filas_rechazadas bigint,
+                        filas_cargadas bigint NOT NULL DEFAULT 0,
+                        deducciones_cargadas bigint NOT NULL DEFAULT 0,
+                        duraciones text,
+                        iniciado timestamptz NOT NULL DEFAULT ({ahora}),
+                        actualizado timestamptz NOT NULL DEFAULT ({ahora})
+                    )
+                """))
+                # `verify` sin run_id busca la última ejecución
+                indice = "etl_runs_iniciado ON public.etl_runs" if self.db_connection.es_postgresql \
+                    else "public.etl_runs_iniciado ON etl_runs"
+                conexion.execute(sqlalchemy.text(f"CREATE INDEX IF NOT EXISTS {indice} (iniciado)"))
+            self._checkpoints_activos = True
+        except Exception as e:
+            self._checkpoints_activos = False
+            logger.warning(f"⚠️ No se pudo crear etl_checkpoints, se continúa sin checkpoints ni etl_runs: {e}")
+        return self._checkpoints_activos
+    
+    def _registrar_avance(self, conexion, bloque, filas_avaluos=None, filas_deducciones=None):
+        """Sumar a la fila de la ejecución en etl_runs las filas confirmadas en la transacción de `conexion`"""
+        if not self._checkpoints_activos:
+            return
+        self.db_connection.ejecutar_preparada(
+            conexion, 'registrar_avance_ejecucion', SQL_AVANCE_EJECUCION.format(ahora=self.db_connection.marca_tiempo),
+            (self.run_id, filas_avaluos, filas_deducciones, bloque['id_desde'], bloque['id_hasta']))
+    
+    def _registrar_checkpoint(self, bloque, etapa, filas_avaluos=None, filas_deducciones=None, conexion=None,
+                              avance=True):
+        """
+        Registrar la etapa confirmada de un bloque (avaluos o completo) y, salvo con avance=False,
+        sumar sus filas a etl_runs
+        """
+        if not self._checkpoints_activos:
+            return
+        ahora = self.db_connection.marca_tiempo
+        def escribir(conexion):
+            # actualizado explícito: las tablas ya creadas conservan el DEFAULT de su versión
+            self.db_connection.ejecutar_preparada(conexion, 'registrar_checkpoint', f"""
+                INSERT INTO public.etl_checkpoints
+                    (run_id, bloque, id_desde, id_hasta, filas_avaluos, filas_deducciones, etapa, actualizado)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, {ahora})
+                ON CONFLICT (run_id, bloque) DO UPDATE SET
+                    filas_avaluos = COALESCE(EXCLUDED.filas_avaluos, etl_checkpoints.filas_avaluos),
+                    filas_deducciones = COALESCE(EXCLUDED.filas_deducciones, etl_checkpoints.filas_deducciones),
+                    etapa = EXCLUDED.etapa,
+                    actualizado = {ahora}
+            """, (self.run_id, bloque['bloque'], bloque['id_desde'], bloque['id_hasta'],
+                  filas_avaluos, filas_deducciones, etapa))
+            # Las filas confirmadas se suman a etl_runs en la misma transacción que el checkpoint
+            if avance:
+                self._registrar_avance(conexion, bloque, filas_avaluos, filas_deducciones)
+        
+        # Dentro de una transacción ajena el checkpoint se confirma junto con los datos
+        if conexion is not None:
+            escribir(conexion)
+            return
+        
+        def registrar():
+            with self.db_connection.get_engine('bulk_load').begin() as conexion:
+                escribir(conexion)
+        
+        try:
+            self.reintentador.ejecutar("checkpoint", registrar)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo registrar el checkpoint del bloque {bloque['bloque']}: {e}")
+    
+    def _registrar_huella_extraida(self, df_origen):
+        """Sumar un bloque extraído a la huella de origen, que no depende del tamaño de bloque ni del orden"""
+        if not self._checkpoints_activos:
+            return
+        with self.instrumentacion.span('huella_extraccion', filas_entrada=len(df_origen)):
+            suma = int(pd.util.hash_pandas_object(df_origen, index=False).sum())
+            filas, columnas, total = self._huella_extraida or (0, list(map(str, df_origen.columns)), 0)
+            self._huella_extraida = (filas + len(df_origen), columnas, (total + suma) % 2 ** 64)
+    
+    def _iniciar_registro_ejecucion(self):
+        """Crear (o, al reanudar, reabrir) la fila de la ejecución en etl_runs"""
+        if not self._checkpoints_activos:
+            return
+        ahora = self.db_connection.marca_tiempo
+        try:
+            with self.db_connection.get_engine().begin() as conexion:
+                conexion.execute(sqlalchemy.text(f"""
+                    INSERT INTO public.etl_runs (run_id, estado, iniciado, actualizado)
+                    VALUES (:run_id, 'en_curso', {ahora}, {ahora})
+                    ON CONFLICT (run_id) DO UPDATE SET estado = 'en_curso', actualizado = {ahora}
+                """), {'run_id': self.run_id})
+        except Exception as e:
+            self._checkpoints_activos = False
+            logger.warning(f"⚠️ No se pudo registrar la ejecución en etl_runs, se continúa sin checkpoints: {e}")
+    
+    def _cerrar_registro_ejecucion(self, exito):
+        """Registrar en etl_runs el estado final, la huella de origen, las filas por etapa y las duraciones"""
+        if not self._checkpoints_activos or self.run_id is None:
+            return
+        etapas = self.instrumentacion.etapas()
+        extraidas = etapas.get('extraccion', {}).get('filas_salida') or 0
+        transformadas = etapas.get('transformacion', {}).get('filas_salida') or 0
+        rechazadas = (etapas.get('transformacion', {}).get('filas_entrada') or 0) - transformadas
+        duraciones = json.dumps({nombre: etapa['segundos'] for nombre, etapa in etapas.items()})
+        huella = clave(*self._huella_extraida) if self._huella_extraida else None
+        try:
+            with self.db_connection.get_engine().begin() as conexion:
+                # Al reanudar, las filas por etapa se suman a las de los intentos anteriores
+                conexion.execute(sqlalchemy.text(f"""
+                    UPDATE public.etl_runs SET
+                        estado = :estado,
+                        huella_origen = COALESCE(:huella, huella_origen),
+                        filas_extraidas = COALESCE(filas_extraidas, 0) + :extraidas,
+                        filas_transformadas = COALESCE(filas_transformadas, 0) + :transformadas,
+                        filas_rechazadas = COALESCE(filas_rechazadas, 0) + :rechazadas,
+                        duraciones = :duraciones,
+                        actualizado = {self.db_connection.marca_tiempo}
+                    WHERE run_id = :run_id
+                """), {'estado': 'completo' if exito else 'fallido', 'huella': huella, 'extraidas': extraidas,
+                       'transformadas': transformadas, 'rechazadas': rechazadas, 'duraciones': duraciones,
+                       'run_id': self.run_id})
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo cerrar la ejecución {self.run_id} en etl_runs: {e}")
+    
+    def consultar_ejecucion(self, run_id=None):
+        """Fila de etl_runs de la ejecución indicada o, sin run_id, de la última iniciada (None si no hay)"""
+        filtro = "WHERE run_id = :run_id" if run_id else "ORDER BY iniciado DESC LIMIT 1"
+        with self.db_connection.get_engine('verify').connect() as conexion:
+            fila = conexion.execute(sqlalchemy.text(f"SELECT * FROM public.etl_runs {filtro}"),
+                                    {'run_id': run_id} if run_id else {}).first()
+        if fila is None:
+            return None
+        ejecucion = dict(fila._mapping)
+        ejecucion['duraciones'] = json.loads(ejecucion['duraciones']) if ejecucion['duraciones'] else None
+        return ejecucion
+    
+    def _preparar_reanudacion(self):
+        """Retomar la última ejecución: completar bloques a medias y continuar después del último bloque confirmado"""
+        with self.db_connection.get_engine().connect() as conexion:
+            # Solo se retoman ejecuciones sin terminar; las anteriores a etl_runs no tienen fila
+            ultimo = conexion.execute(sqlalchemy.text("""
+                SELECT c.run_id FROM public.etl_checkpoints c
+                LEFT JOIN public.etl_runs r ON r.run_id = c.run_id
+                WHERE r.estado IS NULL OR r.estado <> 'completo'
+                ORDER BY c.actualizado DESC LIMIT 1
+            """)).scalar()
+            if ultimo is None:
+                logger.info("📝 No hay ejecuciones incompletas, se inicia una ejecución nueva")
+                return True
+            bloques = [dict(row._mapping) for row in conexion.execute(sqlalchemy.text("""
+                SELECT bloque, id_desde, id_hasta, etapa FROM public.etl_checkpoints
+                WHERE run_id = :run_id ORDER BY bloque
+            """), {'run_id': ultimo})]
+            # etl_runs suma cada partición al confirmarse: si registra más filas que los checkpoints,
+            # hay particiones de un bloque sin checkpoint que la extracción volvería a cargar
+            avance = conexion.execute(sqlalchemy.text("""
+                SELECT r.filas_cargadas - COALESCE(SUM(c.filas_avaluos), 0),
+                       r.deducciones_cargadas - COALESCE(SUM(c.filas_deducciones), 0)
+                FROM public.etl_runs r JOIN public.etl_checkpoints c ON c.run_id = r.run_id
+                WHERE r.run_id = :run_id
+                GROUP BY r.filas_cargadas, r.deducciones_cargadas
+            """), {'run_id': ultimo}).first()
+        
+        sin_checkpoint = tuple(avance) if avance is not None else (0, 0)
+        if any(filas > 0 for filas in sin_checkpoint):
+            if self.modo_carga != 'upsert':
+                logger.error(f"❌ La ejecución {ultimo} confirmó {sin_checkpoint[0]} avalúos y {sin_checkpoint[1]} "
+                             f"deducciones en particiones sin checkpoint (workers > 1): reanudar en modo "
+                             f"'{self.modo_carga}' los duplicaría. Reanude con modo_carga='upsert'")
+                return False
+            logger.warning(f"⚠️ La ejecución {ultimo} tiene filas confirmadas sin checkpoint: el upsert las reemplaza")
+        
+        self.run_id = ultimo
+        self._siguiente_bloque = max(b['bloque'] for b in bloques) + 1
+        # Los bloques se confirman fuera de orden (workers, carga asíncrona): el watermark es el final del último
+        # bloque antes del primero que falta, y los confirmados después de ese hueco se excluyen de la extracción
+        consecutivos = 0
+        while consecutivos < len(bloques) and bloques[consecutivos]['bloque'] == consecutivos + 1:
+            consecutivos += 1
+        self._watermark_reanudacion = bloques[consecutivos - 1]['id_hasta'] if consecutivos else None
+        rangos_confirmados = [(b['id_desde'], b['id_hasta']) for b in bloques[consecutivos:]]
+        pendientes = [b for b in bloques if b['etapa'] != 'completo']
+        logger.info(f"🔁 Reanudando ejecución {ultimo}: {len(bloques) - len(pendientes)} bloques completos, "
+                    f"{len(pendientes)} con deducciones pendientes, continuando después de id_unico {self._watermark_reanudacion}"
+                    + (f" sin los {len(rangos_confirmados)} bloques ya confirmados después del primero que falta"
+                       if rangos_confirmados else ""))
+        
+        # Los avalúos de estos bloques ya se confirmaron: solo faltan sus deducciones
+        for pendiente in pendientes:
+            bloque = {'bloque': pendiente['bloque'], 'id_desde': pendiente['id_desde'], 'id_hasta': pendiente['id_hasta']}
+            query = self._consulta_extraccion(desde_id=pendiente['id_desde'] - 1, hasta_id=pendiente['id_hasta'])
+            df_origen = pd.read_sql_query(query, self.db_connection.get_engine('extract'))
+            vehicle_appraisal_ids = self.obtener_vehicle_appraisal_ids(df_origen)
+            deducciones = self.procesar_deducciones(df_origen, vehicle_appraisal_ids)
+            if not self._cargar_deducciones_bloque(bloque, deducciones, vehicle_appraisal_ids):
+                return False
+        # La exclusión se activa después: los bloques pendientes también están entre los confirmados
+        self._rangos_confirmados = rangos_confirmados
+        return True
+    
+    def _desactivar_indices_y_restricciones(self):
+        """Registrar y retirar índices secundarios y llaves foráneas de las tablas de destino"""
+        engine = self.db_connection.get_engine()
+        # Si una ejecución anterior murió sin restaurar, primero se restaura lo pendiente
+        if os.path.exists(ARCHIVO_MODO_MASIVO):
+            logger.warning("⚠️ Hay índices y restricciones pendientes de una ejecución anterior, restaurando...")
+            with open(ARCHIVO_MODO_MASIVO, encoding='utf-8') as archivo:
+                self._definiciones_masivas = json.load(archivo)
+            try:
+                restaurado = self._restaurar_indices_y_restricciones()
+            except Exception as e:
+                logger.error(f"❌ Error restaurando índices y restricciones: {e}")
+                restaurado = False
+            if not restaurado:
+                # Retirar más índices sobrescribiría las únicas definiciones de los que siguen sin restaurar
+                self._definiciones_masivas = None
+                logger.error(f"❌ Modo masivo cancelado: restaure los pendientes de {ARCHIVO_MODO_MASIVO} antes de volver a ejecutar")
+                return False
+        
+        with engine.begin() as conexion:
+            llaves_foraneas = [dict(row._mapping) for row in conexion.execute(sqlalchemy.text("""
+                SELECT conrelid::regclass::text AS tabla, conname AS nombre, pg_get_constraintdef(oid) AS definicion
+                FROM pg_constraint
+                WHERE contype = 'f'
+                  AND (conrelid IN ('public.vehicle_appraisal'::regclass, 'public.appraisal_deductions'::regclass)
+                       OR confrelid IN ('public.vehicle_appraisal'::regclass, 'public.appraisal_deductions'::regclass))
+            """))]
+            # Se conservan llaves primarias, índices únicos (ON CONFLICT) y los de referencia_original (resolución de IDs)
+            indices = [dict(row._mapping) for row in conexion.execute(sqlalchemy.text("""
+                SELECT i.indexrelid::regclass::text AS nombre, pg_get_indexdef(i.indexrelid) AS definicion
+                FROM pg_index i
+                WHERE i.indrelid IN ('public.vehicle_appraisal'::regclass, 'public.appraisal_deductions'::regclass)
+                  AND NOT i.indisprimary
+                  AND NOT i.indisunique
+                  AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+                  AND pg_get_indexdef(i.indexrelid) NOT LIKE '%referencia_original%'
+            """))]
+            
+            self._definiciones_masivas = {'llaves_foraneas': llaves_foraneas, 'indices': indices}
+            # Se guardan antes de retirar nada para poder restaurar incluso si el proceso muere; 'x' no pisa un pendiente
+            with open(ARCHIVO_MODO_MASIVO, 'x', encoding='utf-8') as archivo:
+                json.dump(self._definiciones_masivas, archivo, indent=2)
+            
+            for fk in llaves_foraneas:
+                conexion.execute(sqlalchemy.text(f'ALTER TABLE {fk["tabla"]} DROP CONSTRAINT "{fk["nombre"]}"'))
+            for indice in indices:
+                conexion.execute(sqlalchemy.text(f'DROP INDEX {indice["nombre"]}'))
+        
+        logger.info(f"🚧 Modo masivo: retiradas {len(llaves_foraneas)} llaves foráneas y {len(indices)} índices")
+        return True
+    
+    def _restaurar_indices_y_restricciones(self):
+        """Reconstruir en paralelo los índices retirados y volver a crear las llaves foráneas"""
+        if not self._definiciones_masivas:
+            return True
+        engine = self.db_connection.get_engine('bulk_load')
+        indices = self._definiciones_masivas.get('indices', [])
+        llaves_foraneas = self._definiciones_masivas.get('llaves_foraneas', [])
+        
+        def reconstruir_indice(indice):
+            with engine.begin() as conexion:
+                existe = conexion.execute(sqlalchemy.text("SELECT to_regclass(:nombre)"), {'nombre': indice['nombre']}).scalar()
+                if existe is None:
+                    conexion.execute(sqlalchemy.text(indice['definicion']))
+            return indice['nombre']
+        
+        errores = []
+        if indices:
+            with ThreadPoolExecutor(max_workers=min(len(indices), max(self.workers, 4))) as executor:
+                futuros = {executor.submit(reconstruir_indice, indice): indice for indice in indices}
+                for futuro, indice in futuros.items():
+                    try:
+                        logger.info(f"🔧 Índice reconstruido: {futuro.result()}")
+                    except Exception as e:
+                        errores.append(f"{indice['nombre']}: {e}")
+        
+        # Las llaves foráneas se validan después de tener los índices de nuevo
+        for fk in llaves_foraneas:
+            try:
+                with engine.begin() as conexion:
+                    existe = conexion.execute(sqlalchemy.text("""
+                        SELECT 1 FROM pg_constraint WHERE conname = :nombre AND conrelid = CAST(:tabla AS regclass)
+                    """), {'nombre': fk['nombre'], 'tabla': fk['tabla']}).scalar()
+                    if existe is None:
+                        conexion.execute(sqlalchemy.text(f'ALTER TABLE {fk["tabla"]} ADD CONSTRAINT "{fk["nombre"]}" {fk["definicion"]}'))
+                logger.info(f"🔧 Llave foránea restaurada: {fk['nombre']}")
+            except Exception as e:
+                errores.append(f"{fk['nombre']}: {e}")
+        
+        if errores:
+            logger.error(f"❌ No se pudieron restaurar: {'; '.join(errores)} (definiciones en {ARCHIVO_MODO_MASIVO})")
+            return False
+        
+        self._definiciones_masivas = None
+        if os.path.exists(ARCHIVO_MODO_MASIVO):
+            os.remove(ARCHIVO_MODO_MASIVO)
+        logger.info("✅ Modo masivo: índices y restricciones restaurados")
+        return True
+    
+    def _preparar_simulacion(self):
+        """Directorio de salida de la simulación para esta ejecución (None si no hay motor de Parquet)"""
+        self._ids_simulados = {'vehicle_appraisal': 0, 'appraisal_deductions': 0}
+        if motor_parquet() is None:
+            logger.warning("⚠️ Simulación sin pyarrow ni fastparquet: solo se miden las etapas, "
+                           "no se escriben archivos (pip install pyarrow)")
+            self._salida_simulacion = None
+            return
+        self._salida_simulacion = os.path.join(self.directorio_simulacion, self.run_id)
+        for tabla in self._ids_simulados:
+            os.makedirs(os.path.join(self._salida_simulacion, tabla), exist_ok=True)
+        logger.info(f"🧪 Simulación: se transforma y se escribe en {self._salida_simulacion} sin tocar la base")
+    
+    def _ids_sinteticos(self, tabla, cantidad):
+        """IDs consecutivos desde 1 por tabla, como los daría la secuencia en una base vacía"""
+        primero = self._ids_simulados[tabla] + 1
+        self._ids_simulados[tabla] += cantidad
+        return list(range(primero, primero + cantidad))
+    
+    def _escribir_simulacion(self, tabla, df, bloque):
+        if self._salida_simulacion:
+            df.to_parquet(os.path.join(self._salida_simulacion, tabla, f"{bloque['bloque']:05d}.parquet"),
+                          engine=motor_parquet(), index=False)
+    
+    def _simular_carga_bloque(self, df_origen, df_transformado, bloque):
+        """Las etapas de carga de un bloque con IDs sintéticos, escribiendo Parquet en lugar de la base"""
+        with self.instrumentacion.span('mapeo_ids', filas_entrada=len(df_transformado)) as span:
+            ids = self._ids_sinteticos('vehicle_appraisal', len(df_transformado))
+            df_avaluos = df_transformado[COLUMNAS_VEHICLE_APPRAISAL].copy()
+            df_avaluos.insert(0, 'vehicle_appraisal_id', ids)
+            vehicle_appraisal_ids = dict(zip(df_transformado['referencia_original'].tolist(), ids))
+            span.filas_salida = len(vehicle_appraisal_ids)
+        deducciones = self.instrumentacion.medir('deducciones', self._construir_deducciones, df_origen,
+                                                 vehicle_appraisal_ids, filas_entrada=len(df_origen))
+        df_deducciones = pd.DataFrame(deducciones, columns=COLUMNAS_DEDUCCIONES)
+        df_deducciones.insert(0, 'appraisal_deduction_id', self._ids_sinteticos('appraisal_deductions', len(df_deducciones)))
+        try:
+            with self.instrumentacion.span('carga_avaluos', filas_entrada=len(df_avaluos)):
+                self._escribir_simulacion('vehicle_appraisal', df_avaluos, bloque)
+            with self.instrumentacion.span('carga_deducciones', filas_entrada=len(df_deducciones)):
+                self._escribir_simulacion('appraisal_deductions', df_deducciones, bloque)
+        except Exception as e:
+            logger.error(f"❌ Error al escribir la simulación del bloque {bloque['bloque']}: {e}")
+            return False
+        logger.info(f"🧪 Simulación: bloque {bloque['bloque']} ({len(df_avaluos)} avalúos, {len(df_deducciones)} deducciones, "
+                    f"id_unico {bloque['id_desde']}-{bloque['id_hasta']}) sin escribir en la base")
+        return True
+    
+    def _cargar_bloque(self, df_origen, df_transformado, numero=1):
+        """Cargar avalúos, obtener sus IDs y cargar deducciones de un bloque ya transformado"""
+        bloque = {
+            'bloque': numero,
+            'id_desde': int(df_origen['id_unico'].min()),
+            'id_hasta': int(df_origen['id_unico'].max()),
+        }
+        if self.simulacion:
+            return self._simular_carga_bloque(df_origen, df_transformado, bloque)
+        if self._cargador_asincrono:
+            return self._enviar_bloque_asincrono(df_origen, df_transformado, bloque)
+        if self.modo_carga == 'cte':
+            return self._cargar_bloque_cte(df_origen, df_transformado, bloque)
+        if self.preasignar_ids:
+            return self._cargar_con_ids_preasignados(df_origen, df_transformado, bloque)
+        return self._cargar_encadenado(df_origen, df_transformado, bloque)
+    
+    def _ejecutar_secuencial(self):
+        """Extraer, transformar y cargar todos los registros en una sola pasada"""
+        # 2. Extraer datos
+        with self.instrumentacion.span('extraccion') as span:
+            df_origen = self.extraer_datos()
+            span.filas_salida = len(df_origen) if df_origen is not None else None
+        if df_origen is None:
+            return False
+        self._registrar_huella_extraida(df_origen)
+        if len(df_origen) == 0:
+            if self._watermark_reanudacion is not None or self._rangos_confirmados:
+                logger.info("✅ No quedan registros pendientes por reanudar")
+                return True
+            logger.warning("⚠️ No se encontraron datos para procesar")
+            return False
+        
+        # Para una ejecución de prueba: limite (primeros registros) o fraccion_muestra en la consulta
+        logger.info(f"📊 Procesando {len(df_origen)} registros")
+        
+        # 3. Transformar datos
+        df_transformado = self.instrumentacion.medir('transformacion', self._transformar_con_cache, df_origen,
+                                                     filas_entrada=len(df_origen))
+        if df_transformado is None or len(df_transformado) == 0:
+            logger.warning("⚠️ No se pudieron transformar los datos")
+            return False
+        
+        # 4-6. Cargar avalúos, obtener sus IDs y cargar deducciones
+        return self._cargar_bloque(df_origen, df_transformado, self._siguiente_bloque)
+    
+    def _ejecutar_pipeline(self):
+        """Extraer, transformar y cargar por bloques con etapas solapadas en hilos y colas acotadas"""
+        cola_extraidos = queue.Queue(maxsize=self.tamano_cola)
+        cola_transformados = queue.Queue(maxsize=self.tamano_cola)
+        detener = threading.Event()
+        errores = []
+        
+        def poner(cola, elemento):
+            # put con timeout para no quedar bloqueado si la etapa siguiente se detuvo
+            while not detener.is_set():
+                try:
+                    cola.put(elemento, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def tomar(cola):
+            # get con timeout: si alguna etapa falla se corta la espera
+            while not detener.is_set():
+                try:
+                    return cola.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            return _FIN_BLOQUES
+        
+        def etapa_extraccion():
+            try:
+                bloques = self.extraer_datos_por_bloques(self.tamano_bloque)
+                while True:
+                    # Se mide la lectura de cada bloque, no la espera en la cola
+                    df_origen = self.instrumentacion.medir('extraccion', next, bloques, None)
+                    if df_origen is None:
+                        break
+                    self._registrar_huella_extraida(df_origen)
+                    if not poner(cola_extraidos, df_origen):
+                        return
+            except Exception as e:
+                errores.append(f"extracción: {e}")
+                detener.set()
+            finally:
+                poner(cola_extraidos, _FIN_BLOQUES)
+        
+        def etapa_transformacion():
+            try:
+                while True:
+                    df_origen = tomar(cola_extraidos)
+                    if df_origen is _FIN_BLOQUES:
+                        break
+                    df_transformado = self.instrumentacion.medir('transformacion', self._transformar_con_cache, df_origen,
+                                                                 filas_entrada=len(df_origen))
+                    if df_transformado is None:
+                        raise RuntimeError("no se pudo transformar el bloque")
+                    if not poner(cola_transformados, (df_origen, df_transformado)):
+                        return
+            except Exception as e:
+                errores.append(f"transformación: {e}")
+                detener.set()
+            finally:
+                poner(cola_transformados, _FIN_BLOQUES)
+        
+        hilos = [
+            threading.Thread(target=etapa_extraccion, name='etl-extraccion', daemon=True),
+            threading.Thread(target=etapa_transformacion, name='etl-transformacion', daemon=True),
+        ]
+        for hilo in hilos:
+            hilo.start()
+        
+        # La carga corre en el hilo principal mientras el siguiente bloque se transforma
+        bloques = 0
+        registros = 0
+        try:
+            while True:
+                elemento = tomar(cola_transformados)
+                if elemento is _FIN_BLOQUES:
+                    break
+                df_origen, df_transformado = elemento
+                if len(df_transformado) == 0:
+                    continue
+                if not self._cargar_bloque(df_origen, df_transformado, self._siguiente_bloque + bloques):
+                    errores.append(f"carga del bloque {bloques + 1}")
+                    break
+                bloques += 1
+                registros += len(df_transformado)
+                logger.info(f"📦 Bloque {bloques} cargado ({registros} registros acumulados)")
+        finally:
+            detener.set()
+            for hilo in hilos:
+                hilo.join()
+        
+        if errores:
+            logger.error(f"❌ Pipeline detenido: {'; '.join(errores)}")
+            return False
+        if bloques == 0:
+            if self._watermark_reanudacion is not None or self._rangos_confirmados:
+                logger.info("✅ No quedan registros pendientes por reanudar")
+                return True
+            logger.warning("⚠️ No se encontraron datos para procesar")
+            return False
+        logger.info(f"✅ Pipeline completado: {bloques} bloques, {registros} registros")
+        return True
+    
+    def _obtener_registro_lotes(self):
+        """Registro de tamaños de lote del servidor actual, cargado del archivo de la ejecución anterior"""
+        if self._registro_lotes is None:
+            conexion = self.db_connection
+            entorno = f"{conexion.db_host}:{conexion.db_port}/{conexion.db_name}"
+            self._registro_lotes = RegistroLotes(entorno, latencia_objetivo=self.latencia_objetivo_lote,
+                                                 memoria_maxima_mb=self.memoria_maxima_lote_mb)
+        return self._registro_lotes
+    
+    def _guardar_tamanos_lote(self):
+        """Guardar los tamaños de lote elegidos para que la próxima ejecución arranque de ahí"""
+        if self._registro_lotes is None:
+            return
+        try:
+            for clave, estado in self._registro_lotes.guardar().items():
+                if clave.startswith(f"{self._registro_lotes.entorno}/"):
+                    logger.info(f"📏 Lote de {clave}: {estado['tamano']} filas "
+                                f"({estado['filas_por_segundo']} filas/s)")
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudieron guardar los tamaños de lote: {e}")
+    
+    def _registrar_resumen_reintentos(self):
+        """Incluir los reintentos en el resumen de la ejecución"""
+        resumen = self.reintentador.resumen()
+        if resumen['total']:
+            logger.info(f"🔁 Reintentos en la ejecución: {resumen['total']} {resumen['por_operacion']}")
+        else:
+            logger.info("📊 Sin reintentos en la ejecución")
+        return resumen
+    
+    def _registrar_estadisticas_pool(self):
+        """Instantánea del pool de conexiones y de las sentencias preparadas al final de la ejecución"""
+        for nombre, sentencia in self.db_connection.estadisticas_sentencias().items():
+            logger.info(f"🧾 Sentencia {nombre}: {sentencia['ejecuciones']} ejecuciones, "
+                        f"{sentencia['aciertos']} reutilizadas, promedio {sentencia['tiempo_promedio_ms']} ms")
+        estadisticas = self.db_connection.estadisticas_pool()
+        logger.info(f"🔌 Pool: {estadisticas['checkouts']} checkouts, espera promedio "
+                    f"{estadisticas['espera_promedio_ms']} ms (máx. {estadisticas['espera_maxima_ms']} ms), "
+                    f"hasta {estadisticas['en_uso_maximo']} conexiones en uso, "
+                    f"{estadisticas['checkouts_con_overflow']} checkouts con overflow, "
+                    f"{estadisticas['preping_fallidos']} pre-ping fallidos")
+        logger.debug(f"🔌 Estadísticas del pool: {json.dumps(estadisticas)}")
+        return estadisticas
+    
     def ejecutar_etl(self):
         """Ejecutar el proceso ETL completo"""
+        self.instrumentacion = Instrumentacion(memoria_python=self.medir_memoria_python)
+        perfilador = None
+        if self.perfil:
+            perfilador = crear_perfilador(self.perfil, self.directorio_perfiles)
+            perfilador.iniciar(self.instrumentacion)
+        exito = False
+        try:
+            with self.instrumentacion.span('ejecucion'):
+                exito = self._ejecutar_etl()
+        finally:
+            if perfilador:
+                try:
+                    self._directorio_perfil = perfilador.detener()
+                except OSError as e:
+                    logger.warning(f"⚠️ No se pudieron escribir los perfiles: {e}")
+                self._etapas_sin_perfil = dict(perfilador.etapas_omitidas) or None
+            self.instrumentacion.registrar_resumen()
+            self._escribir_reporte(exito)
+            self.instrumentacion.cerrar()
+        return exito
+    
+    def _escribir_reporte(self, exito):
+        """Escribir el reporte JSON de la ejecución: etapas, opciones, reintentos, pool y sentencias"""
+        if not self.directorio_reportes:
+            return None
+        nombre = self.run_id or f"{datetime.now():%Y%m%d-%H%M%S}-sin-conexion"
+        ruta = os.path.join(self.directorio_reportes, f"{nombre}.json")
+        opciones = {
+            'modo_carga': self.modo_carga, 'preasignar_ids': self.preasignar_ids,
+            'tamano_bloque': self.tamano_bloque, 'workers': self.workers, 'modo_masivo': self.modo_masivo,
+            'reanudar': self.reanudar, 'carga_asincrona': self.carga_asincrona, 'cargador': self.cargador,
+            'limite': self.limite, 'fraccion_muestra': self.fraccion_muestra, 'simulacion': self.simulacion,
+            'usar_cache': self.usar_cache,
+            'registros_seleccionados': (sum(hasta - desde + 1 for desde, hasta in self.rangos_origen)
+                                        if self.rangos_origen is not None else None),
+        }
+        try:
+            self.instrumentacion.escribir_reporte(
+                ruta, run_id=self.run_id, exito=exito,
+                backend=self.db_connection.backend if self.db_connection else None,
+                opciones=opciones, reintentos=self.reintentador.resumen(), perfil=self._directorio_perfil,
+                perfil_etapas_omitidas=self._etapas_sin_perfil,
+                cache=self.cache.resumen() if self.cache else None, salida_simulacion=self._salida_simulacion,
+                **(self._resumen_conexiones or {}))
+            logger.info(f"📝 Reporte de la ejecución en {ruta}")
+            return ruta
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ No se pudo escribir el reporte de la ejecución: {e}")
+            return None
+    
+    def _ejecutar_etl(self):
+        """Conectar, extraer, transformar, cargar y verificar"""
         logger.info("🚀 Iniciando proceso ETL...")
+        completado = False
         
         try:
             # 1. Conectar a la base de datos
-            if not self.conectar_base_datos():
+            with self.instrumentacion.span('conexion'):
+                conectado = self.conectar_base_datos()
+            if not conectado:
                 return False
             
-            # 2. Extraer datos
-            df_origen = self.extraer_datos()
-            if df_origen is None or len(df_origen) == 0:
-                logger.warning("⚠️ No se encontraron datos para procesar")
-                return False
-            
-            # SOLO PARA PRUEBA: procesar solo los primeros 5 registros
-            #df_origen = df_origen.head(5)
-            #logger.info(f"🧪 Modo prueba: procesando solo {len(df_origen)} registros")
-            # Para procesar todo, comenta la línea anterior y descomenta la siguiente:
-            logger.info(f"📊 Procesando {len(df_origen)} registros completos")
-            
-            # 3. Transformar datos
-            df_transformado = self.transformar_datos(df_origen)
-            if df_transformado is None or len(df_transformado) == 0:
-                logger.warning("⚠️ No se pudieron transformar los datos")
-                return False
-            
-            # 4. Cargar datos de vehicle_appraisal
-            if not self.cargar_datos(df_transformado):
-                return False
-            
-            # 5. Obtener los IDs de vehicle_appraisal para las deducciones
-            vehicle_appraisal_ids = self.obtener_vehicle_appraisal_ids(df_origen)
-            
-            # Si no encontramos IDs, intentar con los últimos registros insertados
-            if len(vehicle_appraisal_ids) == 0:
-                logger.warning("⚠️ No se encontraron IDs específicos, buscando últimos registros insertados...")
-                vehicle_appraisal_ids = self.obtener_ultimos_ids_insertados(1000)
-            
-            # 6. Procesar y cargar deducciones
-            deducciones = self.procesar_deducciones(df_origen, vehicle_appraisal_ids)
-            logger.info(f"🔍 Deducciones procesadas: {len(deducciones) if deducciones else 0}")
-            if deducciones:
-                logger.info(f"📋 Ejemplos de deducciones a insertar: {deducciones[:3]}")
-                if not self.cargar_deducciones(deducciones):
-                    logger.warning("⚠️ Error al cargar deducciones, pero el ETL principal se completó")
+            # Checkpoints por bloque; con --resume se retoma la última ejecución
+            self.run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+            if self.simulacion:
+                self._preparar_simulacion()
+            elif self._asegurar_tabla_checkpoints() and self.reanudar:
+                if not self._preparar_reanudacion():
+                    return False
+            logger.info(f"🏷️ Ejecución {self.run_id}")
+            self._iniciar_registro_ejecucion()
+            
+            if self.usar_cache:
+                with self.instrumentacion.span('huella_origen'):
+                    self._preparar_cache()
+            
+            if self.modo_masivo:
+                with self.instrumentacion.span('desactivacion_indices'):
+                    if not self._desactivar_indices_y_restricciones():
+                        return False
+            
+            if self.carga_asincrona:
+                self._cargador_asincrono = CargadorAsincrono(
+                    self.db_connection.obtener_dsn(), tamano_pool=self.tamano_pool_asincrono,
+                    max_en_vuelo=2 * self.tamano_pool_asincrono, reintentador=self.reintentador,
+                    server_settings=PERFILES_CONEXION['bulk_load'])
+                self._cargador_asincrono.iniciar()
+            
+            # 2-6. Extraer, transformar y cargar (por bloques solapados si hay tamano_bloque)
+            if self.tamano_bloque:
+                exito = self._ejecutar_pipeline()
             else:
-                logger.warning("⚠️ No se generaron deducciones para insertar")
+                exito = self._ejecutar_secuencial()
+            if self._cargador_asincrono:
+                # Aunque haya fallado una etapa se espera a los bloques ya enviados
+                exito = self._esperar_carga_asincrona() and exito
+            if not exito:
+                return False
             
-            # 7. Verificar carga
-            self.verificar_carga()
+            # 7. Verificar carga (en la simulación, los avalúos escritos en Parquet)
+            with self.instrumentacion.span('verificacion') as span:
+                span.filas_salida = self._verificar_simulacion() if self.simulacion else self.verificar_carga()
+            self._registrar_resumen_reintentos()
+            if self.cache:
+                resumen = self.cache.resumen()
+                logger.info(f"🗂️ Caché de etapas: aciertos {resumen['aciertos']}, escrituras {resumen['escrituras']}")
             
             logger.info("🎉 Proceso ETL completado exitosamente")
+            completado = True
             return True
             
         except Exception as e:
             logger.error(f"❌ Error general en ETL: {e}")
+            self._registrar_resumen_reintentos()
             return False
         
         finally:
+            self._guardar_tamanos_lote()
+            if self._cargador_asincrono:
+                self._cargador_asincrono.cerrar()
+                self._cargador_asincrono = None
+            # En modo masivo los índices y restricciones se restauran aunque la carga falle
+            if self._definiciones_masivas:
+                try:
+                    with self.instrumentacion.span('restauracion_indices'):
+                        self._restaurar_indices_y_restricciones()
+                except Exception as e:
+                    logger.error(f"❌ Error restaurando índices y restricciones: {e}")
             if self.db_connection:
+                self._cerrar_registro_ejecucion(completado)
+                self._resumen_conexiones = {
+                    'pool': self._registrar_estadisticas_pool(),
+                    'sentencias': self.db_connection.estadisticas_sentencias(),
+                }
                 self.db_connection.close_connection()
 
-def main():
+COMANDOS = ('import-dbf', 'run', 'watch', 'verify', 'bench')
+
+
+def _entero_positivo(valor):
+    numero = int(valor)
+    if numero < 1:
+        raise argparse.ArgumentTypeError(f"debe ser un entero positivo: {valor}")
+    return numero
+
+
+def _fraccion(valor):
+    fraccion = float(valor)
+    if not 0 < fraccion <= 1:
+        raise argparse.ArgumentTypeError(f"debe estar entre 0 (excluido) y 1: {valor}")
+    return fraccion
+
+
+def crear_parser():
+    """Parser de la línea de comandos: import-dbf, run (por defecto), watch, verify y bench"""
+    parser = argparse.ArgumentParser(
+        description="ETL de mi_tabla hacia vehicle_appraisal",
+        epilog="Sin subcomando se ejecuta 'run'. 'bench' acepta las opciones de benchmark.py (bench -h)")
+    subparsers = parser.add_subparsers(dest='comando', metavar='{' + ','.join(COMANDOS) + '}')
+    
+    importar = subparsers.add_parser('import-dbf', help="reemplazar mi_tabla por el contenido del DBF de Lotus")
+    importar.add_argument('ruta', nargs='?', default=None, help="archivo DBF (por defecto BaseDatosDBF/avaluos2.dbf)")
+    
+    ejecutar = subparsers.add_parser('run', help="extraer, transformar y cargar mi_tabla en vehicle_appraisal")
+    ejecutar.add_argument('--bulk-mode', action='store_true',
+                          help="retirar índices secundarios y llaves foráneas durante la carga y reconstruirlos al final")
+    ejecutar.add_argument('--resume', action='store_true',
+                          help="retomar la última ejecución a partir de su primer bloque incompleto")
+    ejecutar.add_argument('--sample-fraction', type=_fraccion,
+                          help="procesar una muestra del servidor (TABLESAMPLE SYSTEM), p. ej. 0.05 para el 5 %%")
+    ejecutar.add_argument('--workers', type=_entero_positivo, default=1,
+                          help="conexiones concurrentes para la carga de cada bloque")
+    ejecutar.add_argument('--report-dir', default=DIRECTORIO_REPORTES,
+                          help="directorio del reporte JSON de la ejecución (tiempos, filas y memoria por etapa)")
+    ejecutar.add_argument('--tracemalloc', action='store_true',
+                          help="incluir en el reporte el pico de memoria de Python por etapa (más lento)")
+    ejecutar.add_argument('--profile', choices=tuple(PERFILADORES),
+                          help="perfilar cada etapa: cpu (cProfile), memory (tracemalloc) o sampling (muestreo de pilas)")
+    ejecutar.add_argument('--profile-dir', default=DIRECTORIO_PERFILES,
+                          help="directorio donde se crea la carpeta de perfiles de la ejecución")
+    ejecutar.add_argument('--cache', action='store_true',
+                          help="guardar y reutilizar en Parquet la extracción, la transformación y las deducciones "
+                               "(requiere pyarrow)")
+    ejecutar.add_argument('--cache-dir', default=DIRECTORIO_CACHE, help="directorio de la caché de etapas")
+    ejecutar.add_argument('--dry-run-dir', default=DIRECTORIO_SIMULACION,
+                          help="directorio de los Parquet de --dry-run (una carpeta por ejecución)")
+    
+    # Opciones compartidas por import-dbf y run
+    for subparser in (importar, ejecutar):
+        subparser.add_argument('--limit', type=_entero_positivo,
+                               help="procesar solo los primeros N registros (por id_unico en run)")
+        subparser.add_argument('--chunk-size', type=_entero_positivo,
+                               help="registros por bloque; en run activa el pipeline por bloques")
+        subparser.add_argument('--loader', choices=CARGADORES, default='to_sql',
+                               help="inserción con to_sql (INSERT multi-fila) o copy (COPY FROM STDIN, solo PostgreSQL)")
+        subparser.add_argument('--dry-run', action='store_true',
+                               help="leer y transformar sin escribir en la base (run escribe el resultado en Parquet)")
+    
+    vigilar = subparsers.add_parser(
+        'watch', help="vigilar el DBF e importar y cargar solo los registros nuevos o modificados cuando cambie")
+    vigilar.add_argument('ruta', nargs='?', default=None, help="archivo DBF (por defecto BaseDatosDBF/avaluos2.dbf)")
+    vigilar.add_argument('--settle-seconds', type=float, default=30,
+                         help="segundos sin cambios de tamaño ni fecha antes de procesar una nueva exportación")
+    vigilar.add_argument('--poll-interval', type=float, default=10,
+                         help="segundos entre revisiones (sin inotify, o como máximo entre eventos)")
+    vigilar.add_argument('--polling', action='store_true', help="sondear el archivo aunque inotify esté disponible")
+    vigilar.add_argument('--once', action='store_true',
+                         help="procesar los cambios pendientes y terminar (p. ej. desde cron)")
+    vigilar.add_argument('--chunk-size', type=_entero_positivo, help="registros por bloque del ETL incremental")
+    vigilar.add_argument('--workers', type=_entero_positivo, default=1,
+                         help="conexiones concurrentes para la carga de cada bloque")
+    vigilar.add_argument('--loader', choices=CARGADORES, default='to_sql',
+                         help="inserción con to_sql o copy en la primera importación y en las cargas sin upsert")
+    vigilar.add_argument('--report-dir', default=DIRECTORIO_REPORTES,
+                         help="directorio de los reportes JSON de cada carga incremental")
+    
+    verificar = subparsers.add_parser('verify', help="mostrar lo que cargó la última ejecución (o RUN_ID) según etl_runs")
+    verificar.add_argument('run_id', nargs='?', default=None, help="ejecución a mostrar (por defecto la última iniciada)")
+    subparsers.add_parser('bench', help="benchmarks sobre datos sintéticos (opciones de benchmark.py)", add_help=False)
+    return parser
+
+
+def main(argv=None):
     """Función principal"""
-    etl = ETLAvaluos()
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Compatibilidad: `python etl_avaluos.py --resume` equivale a `run --resume`
+    if not argv or argv[0] not in COMANDOS + ('-h', '--help'):
+        argv = ['run'] + argv
+    parser = crear_parser()
+    if argv[0] == 'bench':
+        # Las opciones de bench las interpreta benchmark.py
+        import benchmark
+        benchmark.main(argv[1:])
+        return True
+    args = parser.parse_args(argv)
+    
+    if args.comando == 'watch':
+        import signal
+        from vigilante_dbf import VigilanteDBF
+        vigilante = VigilanteDBF(args.ruta, espera_estable=args.settle_seconds, intervalo=args.poll_interval,
+                                 usar_inotify=not args.polling,
+                                 opciones_etl={'tamano_bloque': args.chunk_size, 'workers': args.workers,
+                                               'cargador': args.loader, 'directorio_reportes': args.report_dir})
+        detener = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            # systemd y docker detienen con SIGTERM: se termina el ciclo en curso y se sale
+            signal.signal(signal.SIGTERM, lambda *_: detener.set())
+        try:
+            return vigilante.ejecutar(detener, una_vez=args.once)
+        except KeyboardInterrupt:
+            logger.info("👋 Vigilante detenido")
+            return True
+    
+    # Las ejecuciones que escriben en la base no se solapan entre sí ni con el vigilante
+    bloqueo = contextlib.nullcontext() if args.comando == 'verify' or args.dry_run else BloqueoEjecucion()
+    try:
+        with bloqueo:
+            return _ejecutar_comando(parser, args)
+    except EjecucionEnCurso as e:
+        logger.error(f"❌ {e}")
+        print("❌ Hay otra ejecución en curso")
+        return False
+
+
+def _ejecutar_comando(parser, args):
+    """import-dbf, verify o run, ya con el bloqueo de ejecución tomado"""
+    if args.comando == 'import-dbf':
+        from CrearTablasDesdeLotus import RUTA_DBF, importar_dbf
+        try:
+            total = importar_dbf(args.ruta or RUTA_DBF, cargador=args.loader, tamano_bloque=args.chunk_size,
+                                 limite=args.limit, simulacion=args.dry_run)
+        except Exception as e:
+            logger.error(f"❌ Error al importar el DBF: {e}")
+            print("❌ Importación falló")
+            return False
+        print(f"✅ DBF {'leído' if args.dry_run else 'importado'}: {total} registros")
+        return True
+    
+    if args.comando == 'verify':
+        etl = ETLAvaluos()
+        if not etl.conectar_base_datos():
+            print("❌ No se pudo conectar")
+            return False
+        try:
+            ejecucion = etl.consultar_ejecucion(args.run_id)
+        except Exception as e:
+            # Bases anteriores a etl_runs: solo se puede contar vehicle_appraisal
+            logger.warning(f"⚠️ No se pudo leer etl_runs ({e}), se cuenta vehicle_appraisal")
+            total = etl.verificar_carga()
+            print(f"📊 vehicle_appraisal: {total} registros")
+            return True
+        finally:
+            etl.db_connection.close_connection()
+        if ejecucion is None:
+            print(f"❌ No hay {'ejecución ' + args.run_id if args.run_id else 'ejecuciones'} en etl_runs")
+            return False
+        print(f"📊 Ejecución {ejecucion['run_id']} ({ejecucion['estado']}, iniciada {ejecucion['iniciado']}): "
+              f"{ejecucion['filas_cargadas']} avalúos y {ejecucion['deducciones_cargadas']} deducciones cargados, "
+              f"id_unico {ejecucion['id_desde']} - {ejecucion['id_hasta']}")
+        print(f"   Extraídos {ejecucion['filas_extraidas']}, transformados {ejecucion['filas_transformadas']}, "
+              f"rechazados {ejecucion['filas_rechazadas']}; huella de origen {ejecucion['huella_origen']}")
+        return ejecucion['estado'] == 'completo'
+    
+    try:
+        etl = ETLAvaluos(modo_masivo=args.bulk_mode, reanudar=args.resume, directorio_reportes=args.report_dir,
+                         medir_memoria_python=args.tracemalloc, perfil=args.profile,
+                         directorio_perfiles=args.profile_dir, tamano_bloque=args.chunk_size, workers=args.workers,
+                         limite=args.limit, fraccion_muestra=args.sample_fraction, cargador=args.loader,
+                         simulacion=args.dry_run, usar_cache=args.cache, directorio_cache=args.cache_dir,
+                         directorio_simulacion=args.dry_run_dir)
+    except ValueError as e:
+        parser.error(str(e))
     exito = etl.ejecutar_etl()
     
     if exito:
         print("✅ ETL ejecutado correctamente")
     else:
         print("❌ ETL falló")
+    return exito
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,51 @@
+"""
+Importación diferida de dependencias pesadas (pandas, numpy, SQLAlchemy): el módulo
+se importa recién al acceder a su primer atributo, de modo que --help, los chequeos
+de cron y los scripts que fallan temprano no pagan su carga
+"""
+
+import importlib
+import importlib.util
+import threading
+
+
+class ModuloDiferido:
+    """
+    Sustituto de un módulo que lo importa en el primer acceso a un atributo.
+    No se registra en sys.modules (a diferencia de importlib.util.LazyLoader), así que
+    un `from paquete.submodulo import X` en otro lado importa el paquete normalmente
+    y no termina con dos copias de sus submódulos
+    """
+
+    def __init__(self, nombre):
+        self.__dict__['_nombre'] = nombre
+        self.__dict__['_modulo'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _cargar(self):
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    self.__dict__['_modulo'] = importlib.import_module(self._nombre)
+        return self._modulo
+
+    def __getattr__(self, atributo):
+        valor = getattr(self._cargar(), atributo)
+        # Los siguientes accesos ya no pasan por __getattr__
+        self.__dict__[atributo] = valor
+        return valor
+
+    def __setattr__(self, atributo, valor):
+        setattr(self._cargar(), atributo, valor)
+        self.__dict__[atributo] = valor
+
+    def __repr__(self):
+        estado = 'cargado' if self._modulo is not None else 'sin cargar'
+        return f"<módulo diferido '{self._nombre}' ({estado})>"
+
+
+def importar_diferido(nombre):
+    """Devolver un sustituto de `nombre` que lo importa cuando se use por primera vez"""
+    if importlib.util.find_spec(nombre) is None:
+        raise ModuleNotFoundError(f"No module named '{nombre}'", name=nombre)
+    return ModuloDiferido(nombre)
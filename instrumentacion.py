@@ -0,0 +1,223 @@
+"""
+Instrumentación por etapas: spans (context managers) alrededor de cada etapa y subetapa
+del ETL que acumulan tiempo de reloj y de CPU, filas de entrada y salida, filas/segundo y
+pico de memoria (RSS del proceso y, opcionalmente, asignaciones de Python con tracemalloc).
+Al final de la ejecución se escribe un reporte JSON comparable entre ejecuciones
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_REPORTES = 'etl_reportes'
+
+
+def reiniciar_pico_rss():
+    """Reiniciar el pico de RSS del proceso (solo Linux) para medir cada etapa por separado"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as archivo:
+            archivo.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def pico_rss_mb():
+    """Pico de memoria residente del proceso en MB (VmHWM en Linux, getrusage en otros sistemas)"""
+    try:
+        with open('/proc/self/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('VmHWM:'):
+                    return round(int(linea.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en bytes en macOS y en KB en Linux
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Span:
+    """Una medición en curso; filas_salida se completa dentro del bloque `with`"""
+
+    __slots__ = ('nombre', 'filas_entrada', 'filas_salida', 'pico_rss_mb', 'pico_python_mb',
+                 '_inicio', '_cpu_inicio')
+
+    def __init__(self, nombre, filas_entrada=None):
+        self.nombre = nombre
+        self.filas_entrada = filas_entrada
+        self.filas_salida = None
+        self.pico_rss_mb = 0.0
+        self.pico_python_mb = 0.0
+        self._iniciar()
+
+    def _iniciar(self):
+        self._inicio = time.perf_counter()
+        self._cpu_inicio = time.thread_time()
+
+
+class Instrumentacion:
+    """
+    Acumula los spans por nombre de etapa. Los spans pueden anidarse y abrirse desde varios
+    hilos a la vez; el pico de memoria de cada uno es el del proceso durante su duración.
+    Los oyentes (p. ej. los perfiladores de perfilado.py) reciben al_abrir(span) y
+    al_cerrar(span) en el hilo del span, fuera del tiempo medido
+    """
+
+    def __init__(self, memoria_python=False):
+        self.memoria_python = memoria_python
+        self.inicio = datetime.now()
+        self._etapas = {}
+        self._abiertos = set()
+        self._pico_rss_mb = 0.0
+        self._pico_python_mb = 0.0
+        self._lock = threading.Lock()
+        self._oyentes = []
+        self._tracemalloc_propio = False
+        if memoria_python and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc_propio = True
+
+    def agregar_oyente(self, oyente):
+        """Registrar un objeto con al_abrir(span) y al_cerrar(span)"""
+        self._oyentes.append(oyente)
+
+    def _leer_picos(self):
+        rss = pico_rss_mb() or 0.0
+        python = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if tracemalloc.is_tracing() else 0.0
+        return rss, python
+
+    def _volcar_picos(self, reiniciar):
+        # Se reparte el pico actual entre todos los spans abiertos antes de reiniciarlo, así
+        # ninguno pierde lo ocurrido mientras estaba abierto (llamar con el lock tomado)
+        rss, python = self._leer_picos()
+        for span in self._abiertos:
+            span.pico_rss_mb = max(span.pico_rss_mb, rss)
+            span.pico_python_mb = max(span.pico_python_mb, python)
+        self._pico_rss_mb = max(self._pico_rss_mb, rss)
+        self._pico_python_mb = max(self._pico_python_mb, python)
+        if reiniciar:
+            reiniciar_pico_rss()
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+
+    @contextmanager
+    def span(self, nombre, filas_entrada=None):
+        """Medir el bloque `with` como una llamada de la etapa `nombre`"""
+        with self._lock:
+            self._volcar_picos(reiniciar=True)
+            span = Span(nombre, filas_entrada)
+            self._abiertos.add(span)
+        for oyente in self._oyentes:
+            oyente.al_abrir(span)
+        span._iniciar()
+        error = False
+        try:
+            yield span
+        except BaseException:
+            error = True
+            raise
+        finally:
+            segundos = time.perf_counter() - span._inicio
+            cpu = time.thread_time() - span._cpu_inicio
+            for oyente in reversed(self._oyentes):
+                oyente.al_cerrar(span)
+            with self._lock:
+                self._volcar_picos(reiniciar=False)
+                self._abiertos.discard(span)
+                self._acumular(span, segundos, cpu, error)
+
+    def medir(self, nombre, funcion, *args, filas_entrada=None):
+        """Ejecutar funcion(*args) dentro de un span; las filas de salida son len(resultado)"""
+        with self.span(nombre, filas_entrada) as span:
+            resultado = funcion(*args)
+            if hasattr(resultado, '__len__'):
+                span.filas_salida = len(resultado)
+            return resultado
+
+    def _acumular(self, span, segundos, cpu, error):
+        etapa = self._etapas.setdefault(span.nombre, {
+            'llamadas': 0, 'errores': 0, 'segundos': 0.0, 'segundos_maximo': 0.0, 'cpu_segundos': 0.0,
+            'filas_entrada': None, 'filas_salida': None, 'pico_rss_mb': 0.0, 'pico_python_mb': 0.0,
+        })
+        etapa['llamadas'] += 1
+        etapa['errores'] += int(error)
+        etapa['segundos'] += segundos
+        etapa['segundos_maximo'] = max(etapa['segundos_maximo'], segundos)
+        etapa['cpu_segundos'] += cpu
+        for clave in ('filas_entrada', 'filas_salida'):
+            valor = getattr(span, clave)
+            if valor is not None:
+                etapa[clave] = (etapa[clave] or 0) + int(valor)
+        etapa['pico_rss_mb'] = max(etapa['pico_rss_mb'], span.pico_rss_mb)
+        etapa['pico_python_mb'] = max(etapa['pico_python_mb'], span.pico_python_mb)
+
+    def etapas(self):
+        """Resumen por etapa, en el orden en que terminó cada una por primera vez"""
+        with self._lock:
+            resumen = {}
+            for nombre, etapa in self._etapas.items():
+                filas = etapa['filas_salida'] if etapa['filas_salida'] is not None else etapa['filas_entrada']
+                resumen[nombre] = dict(etapa)
+                for clave in ('segundos', 'segundos_maximo', 'cpu_segundos'):
+                    resumen[nombre][clave] = round(etapa[clave], 3)
+                resumen[nombre]['pico_python_mb'] = round(etapa['pico_python_mb'], 1)
+                resumen[nombre]['filas_por_segundo'] = (
+                    round(filas / etapa['segundos'], 1) if filas is not None and etapa['segundos'] > 0 else None)
+                if not self.memoria_python:
+                    del resumen[nombre]['pico_python_mb']
+            return resumen
+
+    def reporte(self, **contexto):
+        """Reporte de la ejecución: etapas medidas más el contexto recibido (opciones, estadísticas)"""
+        with self._lock:
+            self._volcar_picos(reiniciar=False)
+        reporte = {
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            'duracion_segundos': round((datetime.now() - self.inicio).total_seconds(), 3),
+            'pico_rss_mb': self._pico_rss_mb,
+        }
+        if self.memoria_python:
+            reporte['pico_python_mb'] = round(self._pico_python_mb, 1)
+        reporte.update(contexto)
+        reporte['etapas'] = self.etapas()
+        return reporte
+
+    def registrar_resumen(self):
+        """Una línea de log por etapa con tiempo, CPU, filas y memoria"""
+        for nombre, etapa in self.etapas().items():
+            filas = ''
+            if etapa['filas_entrada'] is not None or etapa['filas_salida'] is not None:
+                filas = f", filas {etapa['filas_entrada'] if etapa['filas_entrada'] is not None else '-'}" \
+                        f" → {etapa['filas_salida'] if etapa['filas_salida'] is not None else '-'}"
+            velocidad = f", {etapa['filas_por_segundo']} filas/s" if etapa['filas_por_segundo'] else ''
+            logger.info(f"⏱️ {nombre}: {etapa['llamadas']} llamadas, {etapa['segundos']} s "
+                        f"(CPU {etapa['cpu_segundos']} s){filas}{velocidad}, pico RSS {etapa['pico_rss_mb']} MB")
+
+    def escribir_reporte(self, ruta, **contexto):
+        """Escribir el reporte JSON de forma atómica"""
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(self.reporte(**contexto), archivo, ensure_ascii=False, indent=2, default=str)
+        os.replace(temporal, ruta)
+        return ruta
+
+    def cerrar(self):
+        """Detener tracemalloc si lo inició esta instrumentación"""
+        if self._tracemalloc_propio:
+            tracemalloc.stop()
+            self._tracemalloc_propio = False
@@ -0,0 +1,134 @@
+"""
+Tamaño de lote adaptativo: mide filas/segundo y latencia de cada lote y ajusta el
+tamaño hacia una latencia objetivo por lote, sin superar un tope de memoria.
+Los tamaños elegidos se guardan por destino para que la siguiente ejecución arranque de ahí
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_LOTES = 'etl_lotes.json'
+
+# El INSERT multi-fila ocupa bastante más memoria que las filas en el DataFrame
+FACTOR_MEMORIA_SQL = 3
+
+
+class LoteAdaptativo:
+    """
+    Controlador del tamaño de lote de un destino. Después de cada lote se estima el
+    tamaño que habría tardado latencia_objetivo según las filas/segundo medidas; el
+    cambio se suaviza y se limita a duplicar o reducir a la mitad por lote
+    """
+
+    def __init__(self, clave, tamano_inicial=2000, latencia_objetivo=2.0, memoria_maxima_mb=256,
+                 minimo=100, maximo=50000, suavizado=0.5):
+        self.clave = clave
+        self.latencia_objetivo = latencia_objetivo
+        self.memoria_maxima = memoria_maxima_mb * 1024 * 1024
+        self.minimo = minimo
+        self.maximo = maximo
+        self.suavizado = suavizado
+        self.tamano = self._acotar(tamano_inicial)
+        self.filas_por_segundo = None
+        self.historial = []
+        self._lock = threading.Lock()
+
+    def _acotar(self, tamano):
+        return int(max(self.minimo, min(self.maximo, tamano)))
+
+    def tamano_actual(self, bytes_por_fila=None):
+        """Tamaño del próximo lote, limitado por el tope de memoria si se conoce el ancho de fila"""
+        tamano = self.tamano
+        if bytes_por_fila:
+            tope = self.memoria_maxima // (bytes_por_fila * FACTOR_MEMORIA_SQL)
+            tamano = min(tamano, max(self.minimo, int(tope)))
+        return tamano
+
+    def registrar(self, filas, segundos):
+        """Registrar un lote confirmado y recalcular el tamaño"""
+        if filas <= 0:
+            return self.tamano
+        segundos = max(segundos, 1e-6)
+        velocidad = filas / segundos
+        with self._lock:
+            anterior = self.tamano
+            ideal = velocidad * self.latencia_objetivo
+            # Lotes pequeños miden mal la velocidad: se limita el salto por lote
+            ideal = max(anterior / 2, min(anterior * 2, ideal))
+            self.tamano = self._acotar(self.suavizado * ideal + (1 - self.suavizado) * anterior)
+            if self.filas_por_segundo is None:
+                self.filas_por_segundo = velocidad
+            else:
+                self.filas_por_segundo = self.suavizado * velocidad + (1 - self.suavizado) * self.filas_por_segundo
+            self.historial.append({
+                'filas': filas,
+                'segundos': round(segundos, 4),
+                'filas_por_segundo': round(velocidad, 1),
+                'tamano_siguiente': self.tamano,
+            })
+            return self.tamano
+
+    def estado(self):
+        """Estado a persistir para la siguiente ejecución"""
+        return {
+            'tamano': self.tamano,
+            'filas_por_segundo': round(self.filas_por_segundo, 1) if self.filas_por_segundo else None,
+            'lotes': len(self.historial),
+            'actualizado': datetime.now().isoformat(timespec='seconds'),
+        }
+
+
+class RegistroLotes:
+    """
+    Controladores por tabla de un mismo entorno, persistidos en un archivo JSON.
+    La clave incluye el servidor para no mezclar los tamaños de staging y producción
+    """
+
+    def __init__(self, entorno, archivo=ARCHIVO_LOTES, **opciones):
+        self.entorno = entorno
+        self.archivo = archivo
+        self.opciones = opciones
+        self._controladores = {}
+        self._lock = threading.Lock()
+        self._guardado = self._leer()
+
+    def _leer(self):
+        if not os.path.exists(self.archivo):
+            return {}
+        try:
+            with open(self.archivo, encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ No se pudo leer {self.archivo}, se usan tamaños iniciales: {e}")
+            return {}
+
+    def obtener(self, tabla):
+        """Controlador de la tabla, arrancando del tamaño guardado por la ejecución anterior"""
+        clave = f"{self.entorno}/{tabla}"
+        with self._lock:
+            if clave not in self._controladores:
+                opciones = dict(self.opciones)
+                guardado = self._guardado.get(clave)
+                if guardado and guardado.get('tamano'):
+                    opciones['tamano_inicial'] = guardado['tamano']
+                self._controladores[clave] = LoteAdaptativo(clave, **opciones)
+            return self._controladores[clave]
+
+    def guardar(self):
+        """Guardar los tamaños elegidos en esta ejecución"""
+        with self._lock:
+            estado = dict(self._guardado)
+            for clave, controlador in self._controladores.items():
+                if controlador.historial:
+                    estado[clave] = controlador.estado()
+        temporal = f"{self.archivo}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(estado, archivo, indent=2, ensure_ascii=False)
+        os.replace(temporal, self.archivo)
+        self._guardado = estado
+        return estado
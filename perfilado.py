@@ -0,0 +1,291 @@
+"""
+Perfilado por etapa sin tocar el código del ETL: se engancha a los spans de
+instrumentacion.py y deja un archivo por etapa en un directorio por ejecución.
+- cpu: cProfile exclusivo por etapa (la subetapa abierta pausa el perfil de la que la contiene), en .pstats
+- memory: instantáneas de tracemalloc al abrir y cerrar cada etapa, con las líneas que más memoria sumaron
+- sampling: muestreo periódico de las pilas de todos los hilos, en formato colapsado (.folded) para flamegraphs
+"""
+
+import abc
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_PERFILES = 'etl_perfiles'
+SIN_ETAPA = 'sin_etapa'
+
+
+def _nombre_archivo(etapa):
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in etapa)
+
+
+class Perfilador(abc.ABC):
+    """Base de los perfiladores: directorio de la ejecución y pila de etapas abiertas por hilo"""
+
+    modo = None
+
+    def __init__(self, directorio=DIRECTORIO_PERFILES):
+        self.directorio = os.path.join(directorio, f"{datetime.now():%Y%m%d-%H%M%S}-{self.modo}")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Llamadas por etapa que quedaron sin perfil (van al reporte de la ejecución)
+        self.etapas_omitidas = Counter()
+
+    def _pila(self):
+        pila = getattr(self._local, 'pila', None)
+        if pila is None:
+            pila = self._local.pila = []
+        return pila
+
+    def iniciar(self, instrumentacion):
+        """Engancharse a los spans de la instrumentación"""
+        instrumentacion.agregar_oyente(self)
+
+    def al_abrir(self, span):
+        pass
+
+    def al_cerrar(self, span):
+        pass
+
+    def detener(self):
+        """Detener la captura y escribir los archivos; devuelve el directorio de la ejecución"""
+        os.makedirs(self.directorio, exist_ok=True)
+        archivos = self._escribir()
+        logger.info(f"🔬 Perfil '{self.modo}': {len(archivos)} archivos en {self.directorio}")
+        if self.etapas_omitidas:
+            logger.warning(f"⚠️ Etapas sin perfil '{self.modo}': "
+                           f"{', '.join(f'{etapa} ({veces})' for etapa, veces in self.etapas_omitidas.items())}")
+        return self.directorio
+
+    @abc.abstractmethod
+    def _escribir(self):
+        """Escribir los archivos del perfil en self.directorio y devolver sus rutas"""
+
+
+class PerfiladorCPU(Perfilador):
+    """cProfile por etapa; cada hilo perfila solo la etapa más interna que tiene abierta"""
+
+    modo = 'cpu'
+
+    def __init__(self, directorio=DIRECTORIO_PERFILES):
+        super().__init__(directorio)
+        self._estadisticas = {}
+
+    def al_abrir(self, span):
+        pila = self._pila()
+        if pila and pila[-1][1]:
+            pila[-1][1].disable()
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Desde Python 3.12 solo puede haber un perfilador activo a la vez en el proceso
+            perfil = None
+            with self._lock:
+                if not self.etapas_omitidas:
+                    logger.warning("⚠️ Hay otro perfilador activo: algunas etapas concurrentes quedan sin perfil de CPU")
+                self.etapas_omitidas[span.nombre] += 1
+        pila.append((span.nombre, perfil))
+
+    def al_cerrar(self, span):
+        pila = self._pila()
+        nombre, perfil = pila.pop()
+        if perfil:
+            perfil.disable()
+            with self._lock:
+                try:
+                    if nombre in self._estadisticas:
+                        self._estadisticas[nombre].add(perfil)
+                    else:
+                        self._estadisticas[nombre] = pstats.Stats(perfil)
+                except TypeError:
+                    # Perfil sin llamadas registradas
+                    pass
+        if pila and pila[-1][1]:
+            pila[-1][1].enable()
+
+    def _escribir(self):
+        archivos = []
+        total = None
+        for etapa, estadisticas in self._estadisticas.items():
+            base = os.path.join(self.directorio, _nombre_archivo(etapa))
+            estadisticas.dump_stats(f"{base}.pstats")
+            # Resumen legible sin herramientas: las 40 funciones con más tiempo acumulado
+            texto = io.StringIO()
+            estadisticas.stream = texto
+            estadisticas.sort_stats('cumulative').print_stats(40)
+            with open(f"{base}.txt", 'w', encoding='utf-8') as archivo:
+                archivo.write(texto.getvalue())
+            archivos += [f"{base}.pstats", f"{base}.txt"]
+            if total is None:
+                total = pstats.Stats(f"{base}.pstats")
+            else:
+                total.add(f"{base}.pstats")
+        if total is not None:
+            total.dump_stats(os.path.join(self.directorio, 'total.pstats'))
+            archivos.append(os.path.join(self.directorio, 'total.pstats'))
+        return archivos
+
+
+class PerfiladorMemoria(Perfilador):
+    """
+    Diferencias de tracemalloc entre la apertura y el cierre de las primeras llamadas de
+    cada etapa (las instantáneas son costosas). tracemalloc es global: con etapas
+    concurrentes la diferencia incluye lo asignado por los otros hilos
+    """
+
+    modo = 'memory'
+
+    def __init__(self, directorio=DIRECTORIO_PERFILES, llamadas_por_etapa=3, lineas=30, profundidad=1):
+        super().__init__(directorio)
+        self.llamadas_por_etapa = llamadas_por_etapa
+        self.lineas = lineas
+        self.profundidad = profundidad
+        self._inicios = {}
+        self._medidas = Counter()
+        self._diferencias = defaultdict(list)
+        self._ultimas = {}
+        self._tracemalloc_propio = False
+
+    def iniciar(self, instrumentacion):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.profundidad)
+            self._tracemalloc_propio = True
+        super().iniciar(instrumentacion)
+
+    def al_abrir(self, span):
+        with self._lock:
+            if self._medidas[span.nombre] >= self.llamadas_por_etapa:
+                return
+            self._medidas[span.nombre] += 1
+        self._inicios[id(span)] = tracemalloc.take_snapshot()
+
+    def al_cerrar(self, span):
+        inicial = self._inicios.pop(id(span), None)
+        if inicial is None:
+            return
+        final = tracemalloc.take_snapshot()
+        diferencias = final.compare_to(inicial, 'lineno')[:self.lineas]
+        with self._lock:
+            self._diferencias[span.nombre].append(diferencias)
+            self._ultimas[span.nombre] = final
+
+    def detener(self):
+        try:
+            return super().detener()
+        finally:
+            if self._tracemalloc_propio:
+                tracemalloc.stop()
+                self._tracemalloc_propio = False
+
+    def _escribir(self):
+        archivos = []
+        for etapa, llamadas in self._diferencias.items():
+            base = os.path.join(self.directorio, _nombre_archivo(etapa))
+            with open(f"{base}.txt", 'w', encoding='utf-8') as archivo:
+                for numero, diferencias in enumerate(llamadas, start=1):
+                    archivo.write(f"# {etapa}, llamada {numero}: líneas que más memoria sumaron\n")
+                    for diferencia in diferencias:
+                        archivo.write(f"{diferencia}\n")
+                    archivo.write("\n")
+            # Instantánea completa al cierre de la última llamada medida (tracemalloc.Snapshot.load)
+            self._ultimas[etapa].dump(f"{base}.snapshot")
+            archivos += [f"{base}.txt", f"{base}.snapshot"]
+        return archivos
+
+
+class PerfiladorMuestreo(Perfilador):
+    """
+    Muestreo de bajo costo: un hilo toma cada `intervalo` segundos la pila de todos los
+    hilos y la cuenta en la etapa abierta en ese hilo (también mide esperas de E/S y colas)
+    """
+
+    modo = 'sampling'
+
+    def __init__(self, directorio=DIRECTORIO_PERFILES, intervalo=0.005):
+        super().__init__(directorio)
+        self.intervalo = intervalo
+        self._etapas_por_hilo = {}
+        self._conteos = defaultdict(Counter)
+        self._detener = threading.Event()
+        self._hilo = None
+        self.muestras = 0
+
+    def iniciar(self, instrumentacion):
+        super().iniciar(instrumentacion)
+        self._hilo = threading.Thread(target=self._muestrear, name='etl-muestreo', daemon=True)
+        self._hilo.start()
+
+    def al_abrir(self, span):
+        self._etapas_por_hilo.setdefault(threading.get_ident(), []).append(span.nombre)
+
+    def al_cerrar(self, span):
+        etapas = self._etapas_por_hilo.get(threading.get_ident())
+        if etapas:
+            etapas.pop()
+
+    @staticmethod
+    def _colapsar(frame):
+        marcos = []
+        while frame is not None:
+            codigo = frame.f_code
+            marcos.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}".replace(' ', '_').replace(';', '_'))
+            frame = frame.f_back
+        return ';'.join(reversed(marcos))
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo):
+            for hilo, frame in sys._current_frames().items():
+                if hilo == propio:
+                    continue
+                try:
+                    etapa = self._etapas_por_hilo[hilo][-1]
+                except (KeyError, IndexError):
+                    etapa = SIN_ETAPA
+                self._conteos[etapa][self._colapsar(frame)] += 1
+            self.muestras += 1
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join()
+        return super().detener()
+
+    def _escribir(self):
+        archivos = []
+        todas = os.path.join(self.directorio, 'todas.folded')
+        with open(todas, 'w', encoding='utf-8') as archivo_todas:
+            for etapa, conteos in self._conteos.items():
+                ruta = os.path.join(self.directorio, f"{_nombre_archivo(etapa)}.folded")
+                with open(ruta, 'w', encoding='utf-8') as archivo:
+                    for pila, cantidad in conteos.most_common():
+                        archivo.write(f"{pila} {cantidad}\n")
+                        # En el archivo conjunto la etapa es la raíz de cada pila
+                        archivo_todas.write(f"{_nombre_archivo(etapa)};{pila} {cantidad}\n")
+                archivos.append(ruta)
+        archivos.append(todas)
+        return archivos
+
+
+PERFILADORES = {
+    'cpu': PerfiladorCPU,
+    'memory': PerfiladorMemoria,
+    'sampling': PerfiladorMuestreo,
+}
+
+
+def crear_perfilador(modo, directorio=DIRECTORIO_PERFILES):
+    """Perfilador del modo indicado: cpu, memory o sampling"""
+    if modo not in PERFILADORES:
+        raise ValueError(f"Perfil debe ser uno de {tuple(PERFILADORES)}, no '{modo}'")
+    return PERFILADORES[modo](directorio)
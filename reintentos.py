@@ -0,0 +1,116 @@
+"""
+Clasificación de errores de base de datos y reintentos con espera exponencial
+"""
+
+import logging
+import random
+import threading
+import time
+
+from importacion_diferida import importar_diferido
+
+sqlalchemy = importar_diferido('sqlalchemy')
+
+logger = logging.getLogger(__name__)
+
+# Códigos SQLSTATE que se consideran transitorios: serialización, deadlock,
+# timeouts, caídas y reinicios del servidor, exceso de conexiones
+CODIGOS_TRANSITORIOS = {
+    '40001',  # serialization_failure
+    '40P01',  # deadlock_detected
+    '55P03',  # lock_not_available
+    '57014',  # query_canceled (statement_timeout)
+    '57P01',  # admin_shutdown
+    '57P02',  # crash_shutdown
+    '57P03',  # cannot_connect_now
+    '53300',  # too_many_connections
+}
+
+def es_codigo_transitorio(codigo):
+    """Indicar si un SQLSTATE corresponde a un error transitorio"""
+    # Clase 08: excepciones de conexión
+    return codigo in CODIGOS_TRANSITORIOS or codigo.startswith('08')
+
+
+def es_error_transitorio(error):
+    """Indicar si un error de base de datos puede resolverse reintentando"""
+    # psycopg2 se importa al clasificar el primer error, no al cargar el módulo
+    import psycopg2
+    from psycopg2.errors import (
+        InFailedSqlTransaction, DataError, IntegrityError, OperationalError,
+        SerializationFailure, DeadlockDetected, QueryCanceled, AdminShutdown,
+        CrashShutdown, CannotConnectNow, TooManyConnections, LockNotAvailable,
+    )
+    errores_transitorios = (
+        SerializationFailure, DeadlockDetected, LockNotAvailable, QueryCanceled,
+        AdminShutdown, CrashShutdown, CannotConnectNow, TooManyConnections,
+    )
+    errores_fatales = (DataError, IntegrityError, InFailedSqlTransaction, psycopg2.ProgrammingError)
+
+    if isinstance(error, sqlalchemy.exc.DBAPIError):
+        # SQLAlchemy marca la conexión como inválida cuando se cayó
+        if error.connection_invalidated:
+            return True
+        error = error.orig
+
+    codigo = getattr(error, 'pgcode', None)
+    if codigo:
+        return es_codigo_transitorio(codigo)
+
+    if isinstance(error, errores_transitorios):
+        return True
+    if isinstance(error, errores_fatales):
+        return False
+    # OperationalError sin SQLSTATE: conexión reiniciada, servidor inaccesible, timeout de red
+    if isinstance(error, OperationalError):
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class Reintentador:
+    """
+    Ejecuta operaciones reintentando los errores transitorios con espera
+    exponencial y jitter, y registra cada reintento para el reporte de la ejecución
+    """
+
+    def __init__(self, max_intentos=4, espera_base=1.0, espera_maxima=30.0):
+        self.max_intentos = max(1, int(max_intentos))
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.registro = []
+        self._lock = threading.Lock()
+
+    def calcular_espera(self, intento):
+        """Espera con jitter completo: aleatoria entre 0 y base * 2^(intento-1), acotada"""
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** (intento - 1)))
+
+    def ejecutar(self, descripcion, funcion, *args, **kwargs):
+        """Ejecutar funcion(*args, **kwargs); cada intento debe abrir su propia conexión del pool"""
+        for intento in range(1, self.max_intentos + 1):
+            try:
+                return funcion(*args, **kwargs)
+            except Exception as e:
+                if intento == self.max_intentos or not es_error_transitorio(e):
+                    raise
+                time.sleep(self.registrar(descripcion, intento, e))
+
+    def registrar(self, descripcion, intento, error):
+        """Registrar un reintento y devolver la espera que le corresponde"""
+        espera = self.calcular_espera(intento)
+        with self._lock:
+            self.registro.append({
+                'operacion': descripcion,
+                'intento': intento,
+                'error': str(error).splitlines()[0][:200] if str(error) else type(error).__name__,
+                'espera_segundos': round(espera, 3),
+            })
+        logger.warning(f"🔁 Error transitorio en {descripcion} (intento {intento}/{self.max_intentos}), "
+                       f"reintentando en {espera:.1f}s: {error}")
+        return espera
+
+    def resumen(self):
+        """Resumen de reintentos por operación"""
+        por_operacion = {}
+        for evento in self.registro:
+            por_operacion[evento['operacion']] = por_operacion.get(evento['operacion'], 0) + 1
+        return {'total': len(self.registro), 'por_operacion': por_operacion, 'eventos': list(self.registro)}
@@ -0,0 +1,107 @@
+"""
+Registro de sentencias preparadas: las consultas parametrizadas que se repiten en cada
+bloque (resolución y reserva de IDs, checkpoints) se preparan una vez por conexión con
+PREPARE y luego solo se ejecutan con EXECUTE, sin volver a analizarlas ni planificarlas
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+CLAVE_INFO = 'sentencias_preparadas'
+_NOMBRE_VALIDO = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+
+class RegistroSentencias:
+    """
+    Prepara sentencias por conexión del pool con un límite LRU (DEALLOCATE de la menos
+    usada) y acumula por sentencia ejecuciones, aciertos y tiempos.
+    Con max_por_conexion=0 las sentencias se ejecutan sin preparar (p. ej. detrás de
+    PgBouncer en modo transacción, donde las sentencias preparadas no sobreviven)
+    """
+
+    def __init__(self, max_por_conexion=32):
+        self.max_por_conexion = max(0, int(max_por_conexion))
+        self._estadisticas = {}
+        self._lock = threading.Lock()
+
+    def ejecutar(self, conexion, nombre, sql, parametros=()):
+        """
+        Ejecutar `sql` (con parámetros $1, $2, ... de PostgreSQL) en una conexión de
+        SQLAlchemy, preparándola en esa conexión si todavía no lo está
+        """
+        if not _NOMBRE_VALIDO.match(nombre):
+            raise ValueError(f"Nombre de sentencia inválido: '{nombre}'")
+        parametros = tuple(parametros)
+        marcadores = ', '.join(['%s'] * len(parametros))
+        inicio = time.perf_counter()
+
+        if self.max_por_conexion == 0:
+            # Sin preparar: los $n se sustituyen por marcadores del driver
+            if getattr(conexion.dialect, 'paramstyle', 'pyformat') == 'qmark':
+                # SQLite: un ? por aparición, con los valores en ese orden
+                valores = tuple(parametros[int(n) - 1] for n in re.findall(r'\$(\d+)', sql))
+                directa = re.sub(r'\$\d+', '?', sql)
+            else:
+                valores = {f"p{i}": valor for i, valor in enumerate(parametros, start=1)}
+                directa = re.sub(r'\$(\d+)', r'%(p\1)s', sql.replace('%', '%%'))
+            resultado = conexion.exec_driver_sql(directa, valores if valores else None)
+            self._registrar(nombre, time.perf_counter() - inicio, preparada=False, desalojada=False)
+            return resultado
+
+        preparadas = conexion.connection.info.setdefault(CLAVE_INFO, OrderedDict())
+        identificador = f"etl_{nombre}"
+        preparada = desalojada = False
+        if identificador in preparadas:
+            preparadas.move_to_end(identificador)
+        else:
+            if len(preparadas) >= self.max_por_conexion:
+                antigua, _ = preparadas.popitem(last=False)
+                self._sin_parametros(conexion, f"DEALLOCATE {antigua}")
+                desalojada = True
+            self._sin_parametros(conexion, f"PREPARE {identificador} AS {sql}")
+            # PREPARE y DEALLOCATE no son transaccionales: valen para toda la sesión
+            preparadas[identificador] = sql
+            preparada = True
+
+        try:
+            resultado = conexion.exec_driver_sql(
+                f"EXECUTE {identificador} ({marcadores})" if parametros else f"EXECUTE {identificador}",
+                parametros if parametros else None)
+        except Exception as e:
+            if getattr(getattr(e, 'orig', None), 'pgcode', None) == '26000':
+                # La sesión ya no tiene la sentencia (DISCARD ALL de un pooler): se volverá a preparar
+                preparadas.pop(identificador, None)
+            raise
+        self._registrar(nombre, time.perf_counter() - inicio, preparada, desalojada)
+        return resultado
+
+    @staticmethod
+    def _sin_parametros(conexion, sql):
+        conexion.exec_driver_sql(sql, execution_options={'no_parameters': True})
+
+    def _registrar(self, nombre, segundos, preparada, desalojada):
+        with self._lock:
+            estadistica = self._estadisticas.setdefault(nombre, {
+                'ejecuciones': 0, 'preparaciones': 0, 'aciertos': 0, 'desalojos': 0,
+                'tiempo_total_ms': 0.0, 'tiempo_maximo_ms': 0.0,
+            })
+            milisegundos = 1000 * segundos
+            estadistica['ejecuciones'] += 1
+            estadistica['preparaciones'] += int(preparada)
+            estadistica['aciertos'] += int(not preparada and self.max_por_conexion > 0)
+            estadistica['desalojos'] += int(desalojada)
+            estadistica['tiempo_total_ms'] += milisegundos
+            estadistica['tiempo_maximo_ms'] = max(estadistica['tiempo_maximo_ms'], milisegundos)
+
+    def resumen(self):
+        """Estadísticas por sentencia: ejecuciones, preparaciones, aciertos y tiempos"""
+        with self._lock:
+            resumen = {}
+            for nombre, estadistica in self._estadisticas.items():
+                resumen[nombre] = dict(estadistica)
+                resumen[nombre]['tiempo_total_ms'] = round(estadistica['tiempo_total_ms'], 2)
+                resumen[nombre]['tiempo_maximo_ms'] = round(estadistica['tiempo_maximo_ms'], 2)
+                resumen[nombre]['tiempo_promedio_ms'] = round(estadistica['tiempo_total_ms'] / estadistica['ejecuciones'], 2)
+            return resumen
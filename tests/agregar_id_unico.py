@@ -3,11 +3,13 @@
 Script para agregar una columna de ID único a mi_tabla
 """
 
-import pandas as pd
 import logging
-from sqlalchemy import text
+from importacion_diferida import importar_diferido
 from database_connection import DatabaseConnection
 
+pd = importar_diferido('pandas')
+sqlalchemy = importar_diferido('sqlalchemy')
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -43,7 +45,7 @@ def agregar_id_unico():
                 ALTER TABLE mi_tabla 
                 ADD COLUMN id_unico SERIAL
             """
-            conn.execute(text(query_add))
+            conn.execute(sqlalchemy.text(query_add))
             conn.commit()
             logger.info("✅ Columna 'id_unico' agregada exitosamente")
         
@@ -4,9 +4,11 @@ Script para agregar la columna referencia_original a la tabla vehicle_appraisal
 """
 
 import logging
-from sqlalchemy import text
+from importacion_diferida import importar_diferido
 from database_connection import DatabaseConnection
 
+sqlalchemy = importar_diferido('sqlalchemy')
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -31,7 +33,7 @@ def agregar_referencia_original():
         """
         
         with db_connection.get_engine().connect() as connection:
-            result = connection.execute(text(query_check))
+            result = connection.execute(sqlalchemy.text(query_check))
             column_exists = result.fetchone() is not None
             
             if column_exists:
@@ -44,13 +46,13 @@ def agregar_referencia_original():
                 ADD COLUMN referencia_original DOUBLE PRECISION
             """
             
-            connection.execute(text(query_add))
+            connection.execute(sqlalchemy.text(query_add))
             connection.commit()
             
             logger.info("✅ Columna referencia_original agregada exitosamente")
             
             # Verificar que se agregó correctamente
-            result = connection.execute(text(query_check))
+            result = connection.execute(sqlalchemy.text(query_check))
             if result.fetchone():
                 logger.info("✅ Verificación: la columna se agregó correctamente")
             else:
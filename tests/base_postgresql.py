@@ -0,0 +1,59 @@
+"""
+Base PostgreSQL para las pruebas de las cargas que solo existen en PostgreSQL (IDs
+preasignados, upsert, CTE, carga asíncrona). Se activan con ETL_PRUEBAS_POSTGRESQL=1 y
+usan la base de las variables DB_*: reemplazan mi_tabla y vacían las tablas de destino,
+así que esas variables deben apuntar a una base de pruebas
+"""
+
+import os
+import pytest
+import sqlalchemy
+import datos_sinteticos
+from database_connection import DatabaseConnection
+
+TABLAS_DESTINO = ('appraisal_deductions', 'vehicle_appraisal', 'etl_checkpoints', 'etl_runs')
+
+# Marca de las pruebas que necesitan la base: pytest las informa como omitidas, no como aprobadas
+requerida = pytest.mark.skipif(os.getenv('ETL_PRUEBAS_POSTGRESQL') != '1',
+                               reason="ETL_PRUEBAS_POSTGRESQL no habilitado: requiere una base PostgreSQL de pruebas")
+
+
+def habilitada(prueba):
+    """Si hay base PostgreSQL de pruebas; si no, avisa que la prueba se omite (al ejecutar el script directamente)"""
+    if os.getenv('ETL_PRUEBAS_POSTGRESQL') == '1':
+        return True
+    print(f"⏭️ ETL_PRUEBAS_POSTGRESQL no habilitado: se omite {prueba}")
+    return False
+
+
+def preparar(filas, semilla=42):
+    """mi_tabla sintética con `filas` registros y tablas de destino vacías"""
+    db = DatabaseConnection(backend='postgresql')
+    try:
+        datos_sinteticos.cargar_mi_tabla(db, filas, semilla)
+        with db.get_engine().begin() as conexion:
+            for tabla in TABLAS_DESTINO:
+                if sqlalchemy.inspect(conexion).has_table(tabla, schema='public'):
+                    conexion.execute(sqlalchemy.text(f"DELETE FROM public.{tabla}"))
+    finally:
+        db.close_connection()
+
+
+def consultar(sql, **parametros):
+    """Filas de una consulta sobre la base de pruebas"""
+    db = DatabaseConnection(backend='postgresql')
+    try:
+        with db.get_engine().connect() as conexion:
+            return [tuple(fila) for fila in conexion.execute(sqlalchemy.text(sql), parametros)]
+    finally:
+        db.close_connection()
+
+
+def ejecutar(sql, **parametros):
+    """Ejecutar una sentencia sobre la base de pruebas en su propia transacción"""
+    db = DatabaseConnection(backend='postgresql')
+    try:
+        with db.get_engine().begin() as conexion:
+            conexion.execute(sqlalchemy.text(sql), parametros)
+    finally:
+        db.close_connection()
@@ -3,11 +3,12 @@
 Script de diagnóstico para verificar el mapeo entre NUMERO_CER y vehicle_appraisal_id
 """
 
-import pandas as pd
 import logging
-from sqlalchemy import text
+from importacion_diferida import importar_diferido
 from database_connection import DatabaseConnection
 
+pd = importar_diferido('pandas')
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
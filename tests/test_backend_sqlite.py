@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import tempfile
+import backend_sqlite
+from etl_avaluos import ETLAvaluos
+
+def crear_mi_tabla(ruta, filas):
+    conexion = backend_sqlite.conectar(ruta)
+    backend_sqlite.crear_esquema(conexion)
+    columnas = backend_sqlite.COLUMNAS_MI_TABLA
+    registros = []
+    for i in range(1, filas + 1):
+        fila = dict.fromkeys(columnas, '')
+        fila.update({'NUMERO_CER': str(1000 + i), 'MARCA': 'TOYOTA', 'MODELO': 'HILUX', 'A_O': str(2000 + i % 20),
+                     'KMS': f"{i * 1000:,}", 'CILINDRADA': '2.4' if i % 2 else '1600', '_FECHAS_1': f'2024-01-{i % 28 + 1:02d}',
+                     'MOTOR1': '150' if i % 3 else None, 'MOTOR_': 'Golpe en cárter' if i % 3 else '', 'AVALUO_BAN': '12500,50'})
+        registros.append([i] + [fila[columna] for columna in columnas])
+    conexion.executemany(f"INSERT INTO public.mi_tabla VALUES ({', '.join('?' * (len(columnas) + 1))})", registros)
+    conexion.commit()
+    conexion.close()
+
+def test_etl_completo_sin_red():
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        crear_mi_tabla(ruta, 60)
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        # El ETL escribe etl_lotes.json en el directorio de trabajo
+        os.chdir(directorio)
+        try:
+            assert ETLAvaluos(tamano_bloque=25).ejecutar_etl()
+            # Las opciones exclusivas de PostgreSQL se rechazan
+            assert not ETLAvaluos(modo_carga='upsert').ejecutar_etl()
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+        conexion = sqlite3.connect(ruta)
+        avaluos, deducciones, huerfanas = conexion.execute("""
+            SELECT (SELECT COUNT(*) FROM vehicle_appraisal),
+                   (SELECT COUNT(*) FROM appraisal_deductions),
+                   (SELECT COUNT(*) FROM appraisal_deductions d
+                    LEFT JOIN vehicle_appraisal v ON v.vehicle_appraisal_id = d.vehicle_appraisal_id
+                    WHERE v.vehicle_appraisal_id IS NULL)
+        """).fetchone()
+        etapas = [fila[0] for fila in conexion.execute("SELECT etapa FROM etl_checkpoints ORDER BY bloque")]
+        conexion.close()
+    assert avaluos == 60
+    assert deducciones == 40 and huerfanas == 0
+    assert etapas == ['completo'] * 3
+    print('✅ ETL completo sobre SQLite')
+
+if __name__ == "__main__":
+    test_etl_completo_sin_red()
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+import datos_sinteticos
+from cache_etapas import motor_parquet
+from database_connection import DatabaseConnection
+from etl_avaluos import ETLAvaluos, COLUMNAS_VEHICLE_APPRAISAL
+
+def ejecutar(directorio_cache):
+    etl = ETLAvaluos(tamano_bloque=80, usar_cache=True, directorio_cache=directorio_cache, directorio_reportes=None)
+    assert etl.ejecutar_etl()
+    return etl.cache.resumen()
+
+def cargados(conexion, desde, hasta):
+    """Avalúos y deducciones de una ejecución, sin sus IDs generados"""
+    avaluos = pd.read_sql_query(f"""
+        SELECT {', '.join(COLUMNAS_VEHICLE_APPRAISAL)} FROM vehicle_appraisal
+        WHERE vehicle_appraisal_id BETWEEN {desde} AND {hasta} ORDER BY referencia_original
+    """, conexion)
+    deducciones = pd.read_sql_query(f"""
+        SELECT v.referencia_original, d.amount, d.description FROM appraisal_deductions d
+        JOIN vehicle_appraisal v ON v.vehicle_appraisal_id = d.vehicle_appraisal_id
+        WHERE v.vehicle_appraisal_id BETWEEN {desde} AND {hasta}
+        ORDER BY v.referencia_original, d.description, d.amount
+    """, conexion)
+    return avaluos, deducciones
+
+def test_reutilizar_etapas_sin_cambios_en_mi_tabla():
+    if motor_parquet() is None:
+        print('⏭️ pyarrow no instalado: se omite la prueba de la caché de etapas')
+        return
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        directorio_cache = os.path.join(directorio, 'cache')
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        # El ETL escribe etl_lotes.json en el directorio de trabajo
+        os.chdir(directorio)
+        try:
+            db = DatabaseConnection()
+            datos_sinteticos.cargar_mi_tabla(db, 200)
+            db.close_connection()
+            primera = ejecutar(directorio_cache)
+            segunda = ejecutar(directorio_cache)
+            # Un registro modificado invalida la extracción y solo la transformación de su bloque
+            with sqlite3.connect(ruta) as conexion:
+                conexion.execute("UPDATE mi_tabla SET MARCA = 'NISSAN' WHERE id_unico = 5")
+            tercera = ejecutar(directorio_cache)
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+        with sqlite3.connect(ruta) as conexion:
+            avaluos_1, deducciones_1 = cargados(conexion, 1, 200)
+            avaluos_2, deducciones_2 = cargados(conexion, 201, 400)
+            avaluos_3, _ = cargados(conexion, 401, 600)
+    assert primera['aciertos'] == {} and primera['escrituras'] == {'extraccion': 3, 'transformacion': 3, 'deducciones': 3}
+    assert segunda['aciertos'] == {'extraccion': 3, 'transformacion': 3, 'deducciones': 3}
+    assert segunda['escrituras'] == {}
+    assert tercera['aciertos'] == {'transformacion': 2, 'deducciones': 2}
+    assert tercera['escrituras'] == {'extraccion': 3, 'transformacion': 1, 'deducciones': 1}
+    # Lo cargado desde la caché es igual a lo calculado
+    assert len(avaluos_1) == 200 and avaluos_1.equals(avaluos_2)
+    assert len(deducciones_1) > 0 and deducciones_1.equals(deducciones_2)
+    assert avaluos_3.loc[avaluos_3['referencia_original'] == 5, 'brand'].item() == 'NISSAN'
+    print('✅ Caché de etapas reutilizada e invalidada por contenido')
+
+if __name__ == "__main__":
+    test_reutilizar_etapas_sin_cambios_en_mi_tabla()
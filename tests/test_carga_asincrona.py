@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import pytest
+import base_postgresql
+import datos_sinteticos
+import etl_avaluos
+from carga_asincrona import CargadorAsincrono, asyncpg
+from etl_avaluos import ETLAvaluos
+
+class CargadorConFallo(CargadorAsincrono):
+    """Falla el bloque 2 cuando el bloque 3 ya se confirmó, como un error fuera de orden"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bloque_3_confirmado = threading.Event()
+
+    async def _cargar_bloque(self, columnas_avaluos, registros_avaluos, columnas_deducciones,
+                             registros_deducciones, checkpoint):
+        if checkpoint['bloque'] == 2:
+            await asyncio.get_running_loop().run_in_executor(None, self.bloque_3_confirmado.wait, 30)
+            raise RuntimeError("fallo simulado del bloque 2")
+        resultado = await super()._cargar_bloque(columnas_avaluos, registros_avaluos, columnas_deducciones,
+                                                 registros_deducciones, checkpoint)
+        if checkpoint['bloque'] == 3:
+            self.bloque_3_confirmado.set()
+        return resultado
+
+@base_postgresql.requerida
+@pytest.mark.skipif(asyncpg is None, reason="asyncpg no instalado")
+def test_reanudar_recarga_el_bloque_asincrono_fallido():
+    if not base_postgresql.habilitada('la prueba de la carga asíncrona'):
+        return
+    if asyncpg is None:
+        print("⏭️ asyncpg no instalado: se omite la prueba de la carga asíncrona")
+        return
+    base_postgresql.preparar(600)
+    opciones = {'carga_asincrona': True, 'tamano_pool_asincrono': 1, 'tamano_bloque': 50, 'directorio_reportes': None}
+    etl_avaluos.CargadorAsincrono = CargadorConFallo
+    try:
+        fallida = ETLAvaluos(**opciones).ejecutar_etl()
+    finally:
+        etl_avaluos.CargadorAsincrono = CargadorAsincrono
+    confirmados = {bloque for (bloque,) in base_postgresql.consultar("SELECT bloque FROM public.etl_checkpoints")}
+    assert ETLAvaluos(reanudar=True, **opciones).ejecutar_etl()
+    avaluos = base_postgresql.consultar("SELECT count(*), count(DISTINCT referencia_original) FROM public.vehicle_appraisal")[0]
+    deducciones = base_postgresql.consultar("SELECT count(*) FROM public.appraisal_deductions")[0][0]
+    df_origen = datos_sinteticos.generar_mi_tabla(600)
+    esperadas = ETLAvaluos(directorio_reportes=None).procesar_deducciones(
+        df_origen, {i: i for i in df_origen['id_unico'].tolist()})
+    assert not fallida
+    # El bloque 3 se confirmó antes del fallo del 2, y después del fallo no se enviaron los 12 bloques
+    assert {1, 3} <= confirmados and 2 not in confirmados and len(confirmados) < 11
+    assert avaluos == (600, 600) and deducciones == len(esperadas)
+    print('✅ --resume recarga el bloque asíncrono que falló sin duplicar los confirmados después')
+
+if __name__ == "__main__":
+    test_reanudar_recarga_el_bloque_asincrono_fallido()
@@ -0,0 +1,60 @@
+import base_postgresql
+import datos_sinteticos
+from etl_avaluos import ETLAvaluos
+
+class ETLCteInterrumpido(ETLAvaluos):
+    """Falla el bloque 2 después de insertar avalúos y deducciones, antes del commit"""
+    def _registrar_checkpoint(self, bloque, etapa, *args, **kwargs):
+        if bloque['bloque'] == 2:
+            raise RuntimeError('fallo simulado a mitad del bloque 2')
+        return super()._registrar_checkpoint(bloque, etapa, *args, **kwargs)
+
+def deducciones_esperadas(filas, hasta_id=None):
+    df_origen = datos_sinteticos.generar_mi_tabla(filas)
+    if hasta_id is not None:
+        df_origen = df_origen[df_origen['id_unico'] <= hasta_id]
+    return ETLAvaluos(directorio_reportes=None).procesar_deducciones(
+        df_origen, {i: i for i in df_origen['id_unico'].tolist()})
+
+@base_postgresql.requerida
+def test_cte_carga_avaluos_y_deducciones_por_bloque():
+    if not base_postgresql.habilitada('la prueba de la carga CTE'):
+        return
+    base_postgresql.preparar(300)
+    etl = ETLAvaluos(modo_carga='cte', tamano_bloque=100, directorio_reportes=None)
+    assert etl.ejecutar_etl()
+    avaluos = base_postgresql.consultar("SELECT count(*), count(DISTINCT referencia_original) FROM public.vehicle_appraisal")[0]
+    huerfanas, deducciones = base_postgresql.consultar("""
+        SELECT count(*) FILTER (WHERE v.vehicle_appraisal_id IS NULL), count(*)
+        FROM public.appraisal_deductions d
+        LEFT JOIN public.vehicle_appraisal v ON v.vehicle_appraisal_id = d.vehicle_appraisal_id
+    """)[0]
+    etapas = dict(base_postgresql.consultar("SELECT bloque, etapa FROM public.etl_checkpoints WHERE run_id = :run_id",
+                                            run_id=etl.run_id))
+    assert avaluos == (300, 300)
+    assert huerfanas == 0 and deducciones == len(deducciones_esperadas(300))
+    assert etapas == {1: 'completo', 2: 'completo', 3: 'completo'}
+    print('✅ La carga CTE inserta avalúos y deducciones y marca cada bloque como completo')
+
+@base_postgresql.requerida
+def test_cte_revierte_el_bloque_que_falla():
+    if not base_postgresql.habilitada('la prueba de reversión de la carga CTE'):
+        return
+    base_postgresql.preparar(300)
+    etl = ETLCteInterrumpido(modo_carga='cte', tamano_bloque=100, max_intentos=1, directorio_reportes=None)
+    assert not etl.ejecutar_etl()
+    referencias = base_postgresql.consultar("""
+        SELECT count(*), min(referencia_original), max(referencia_original) FROM public.vehicle_appraisal
+    """)[0]
+    deducciones = base_postgresql.consultar("SELECT count(*) FROM public.appraisal_deductions")[0][0]
+    etapas = dict(base_postgresql.consultar("SELECT bloque, etapa FROM public.etl_checkpoints WHERE run_id = :run_id",
+                                            run_id=etl.run_id))
+    # Del bloque 2 no queda nada: ni avalúos, ni deducciones, ni checkpoint
+    assert referencias == (100, 1, 100)
+    assert deducciones == len(deducciones_esperadas(300, hasta_id=100))
+    assert etapas == {1: 'completo'}
+    print('✅ Un fallo a mitad de un bloque CTE revierte sus avalúos y sus deducciones')
+
+if __name__ == "__main__":
+    test_cte_carga_avaluos_y_deducciones_por_bloque()
+    test_cte_revierte_el_bloque_que_falla()
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import datos_sinteticos
+from benchmark import Benchmark
+from database_connection import DatabaseConnection
+from etl_avaluos import ETLAvaluos
+
+def test_generacion_reproducible():
+    df = datos_sinteticos.generar_mi_tabla(3000, semilla=7, tamano_bloque=1000)
+    assert df.equals(datos_sinteticos.generar_mi_tabla(3000, semilla=7, tamano_bloque=1000))
+    assert not df.equals(datos_sinteticos.generar_mi_tabla(3000, semilla=8, tamano_bloque=1000))
+    assert list(df.columns) == ['id_unico'] + datos_sinteticos.COLUMNAS_MI_TABLA
+    assert df['id_unico'].tolist() == list(range(1, 3001))
+    assert datos_sinteticos.interpretar_filas('10M') == 10_000_000
+    assert datos_sinteticos.interpretar_filas('250k') == 250_000
+    print('✅ Generación reproducible')
+
+def test_mezcla_de_valores_sucios():
+    df = datos_sinteticos.generar_mi_tabla(5000, semilla=1)
+    montos = df['AVALUO_BAN'].dropna()
+    assert montos.str.contains(r'^\d+,\d\d$').any(), "faltan decimales con coma"
+    assert (montos == 'N/A').any()
+    cilindradas = df['CILINDRADA'].dropna()
+    assert cilindradas.str.fullmatch(r'\d\.\d').any() and cilindradas.str.fullmatch(r'\d{4}').any()
+    fechas = df['_FECHAS_1'].dropna()
+    for patron in (r'\d{4}-\d\d-\d\d', r'\d\d/\d\d/\d{4}', r'\d{4}/\d\d/\d\d'):
+        assert fechas.str.fullmatch(patron).any(), patron
+    # El ETL interpreta la mayoría, pero no todo, como en los datos reales
+    etl = ETLAvaluos()
+    transformado = etl.transformar_datos(df.head(500))
+    assert 0.5 < (transformado['engine_size'] > 0).mean() < 1
+    assert 0.5 < transformado['appraisal_date'].notna().mean() < 1
+    deducciones = etl.procesar_deducciones(df.head(500), dict(zip(df['id_unico'], df['id_unico'])))
+    # Con 8 pares por registro y ~60 % de pares vacíos quedan entre 2 y 5 deducciones por registro
+    assert 1000 < len(deducciones) < 2500
+    print('✅ Mezcla de valores sucios')
+
+def test_dbf_legible():
+    try:
+        from dbfread import DBF
+    except ImportError:
+        print('⏭️ dbfread no instalado')
+        return
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = datos_sinteticos.escribir_dbf(os.path.join(directorio, 'avaluos.dbf'), 1500, tamano_bloque=400)
+        leidos = list(DBF(ruta, encoding='latin-1'))
+    original = datos_sinteticos.generar_mi_tabla(1500, tamano_bloque=400)
+    assert len(leidos) == 1500
+    assert list(leidos[0]) == datos_sinteticos.COLUMNAS_MI_TABLA
+    for campo in ('KMS', 'SOLICITANT', '_FECHAS_1', 'MOTOR_'):
+        esperado = original[campo].fillna('').str.rstrip().tolist()
+        assert [registro[campo] for registro in leidos] == esperado, campo
+    print('✅ DBF legible con dbfread')
+
+def test_benchmark_sqlite():
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    directorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as directorio:
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = os.path.join(directorio, 'benchmark.sqlite')
+        # El ETL escribe etl_lotes.json en el directorio de trabajo
+        os.chdir(directorio)
+        try:
+            benchmark = Benchmark(400, tamano_bloque=150, archivo_resultados='resultados.jsonl')
+            benchmark.medir_transformacion()
+            db = DatabaseConnection()
+            try:
+                benchmark.medir_cargas(db, ['append', 'workers', 'upsert'])
+            finally:
+                db.close_connection()
+            benchmark.guardar()
+            with open('resultados.jsonl', encoding='utf-8') as archivo:
+                resultados = [json.loads(linea) for linea in archivo]
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+    # upsert requiere PostgreSQL: se omite
+    assert [r['etapa'] for r in resultados] == ['transformar_datos', 'procesar_deducciones', 'carga:append', 'carga:workers']
+    assert all(r['filas_por_segundo'] > 0 for r in resultados)
+    assert all(r['filas_cargadas'] == 400 for r in resultados if r['etapa'].startswith('carga'))
+    print('✅ Benchmark sobre SQLite')
+
+if __name__ == "__main__":
+    test_generacion_reproducible()
+    test_mezcla_de_valores_sucios()
+    test_dbf_legible()
+    test_benchmark_sqlite()
@@ -0,0 +1,43 @@
+from datetime import date
+import base_postgresql
+import CrearTablasDesdeLotus
+from database_connection import DatabaseConnection
+
+# Registros como los entrega dbfread: campos N como float, D como date y C como texto
+REGISTROS = [
+    {'MARCA': 'TOYOTA', 'A_O': 2020.0, 'KMS': 45000.0, '_FECHAS_1': date(2023, 5, 17)},
+    {'MARCA': 'NISSAN', 'A_O': 2018.0, 'KMS': None, '_FECHAS_1': date(2022, 11, 2)},
+    {'MARCA': 'HONDA', 'A_O': None, 'KMS': 120500.5, '_FECHAS_1': None},
+]
+
+def importar(cargador):
+    """Tipos y valores de mi_tabla después de importar REGISTROS con el cargador indicado"""
+    db = DatabaseConnection(backend='postgresql')
+    try:
+        CrearTablasDesdeLotus.importar_dbf(db_connection=db, cargador=cargador, tamano_bloque=2)
+    finally:
+        db.close_connection()
+    tipos = dict(base_postgresql.consultar("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'mi_tabla'"""))
+    filas = base_postgresql.consultar('SELECT "A_O", "KMS", "_FECHAS_1" FROM public.mi_tabla ORDER BY "id_unico"')
+    return tipos, filas
+
+@base_postgresql.requerida
+def test_copy_y_to_sql_crean_los_mismos_tipos():
+    if not base_postgresql.habilitada('la prueba de tipos de import-dbf'):
+        return
+    abrir_original = CrearTablasDesdeLotus.abrir_dbf
+    CrearTablasDesdeLotus.abrir_dbf = lambda ruta=None: iter([dict(registro) for registro in REGISTROS])
+    try:
+        con_to_sql = importar('to_sql')
+        con_copy = importar('copy')
+    finally:
+        CrearTablasDesdeLotus.abrir_dbf = abrir_original
+    assert con_copy == con_to_sql
+    assert con_copy[0]['A_O'] == 'double precision' and con_copy[0]['id_unico'] == 'bigint'
+    assert con_copy[1][0] == (2020.0, 45000.0, date(2023, 5, 17))
+    print('✅ import-dbf con copy y con to_sql deja los mismos tipos y valores')
+
+if __name__ == "__main__":
+    test_copy_y_to_sql_crean_los_mismos_tipos()
@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from instrumentacion import Instrumentacion
+
+def test_spans_acumulan_por_etapa():
+    instrumentacion = Instrumentacion(memoria_python=True)
+    try:
+        with instrumentacion.span('ejecucion'):
+            for _ in range(3):
+                with instrumentacion.span('transformacion', filas_entrada=100) as span:
+                    time.sleep(0.01)
+                    span.filas_salida = 90
+            # Un span en otro hilo mientras el principal sigue abierto
+            hilo = threading.Thread(target=instrumentacion.medir, args=('deducciones', lambda: [0] * 10))
+            hilo.start()
+            hilo.join()
+            try:
+                with instrumentacion.span('carga_avaluos', filas_entrada=50):
+                    bloque = bytearray(20 * 1024 * 1024)
+                    raise RuntimeError("falla de carga")
+            except RuntimeError:
+                del bloque
+        etapas = instrumentacion.etapas()
+    finally:
+        instrumentacion.cerrar()
+    assert list(etapas) == ['transformacion', 'deducciones', 'carga_avaluos', 'ejecucion']
+    transformacion = etapas['transformacion']
+    assert transformacion['llamadas'] == 3 and transformacion['filas_entrada'] == 300 and transformacion['filas_salida'] == 270
+    assert transformacion['segundos'] >= 0.03 and transformacion['filas_por_segundo'] > 0
+    assert etapas['deducciones']['filas_salida'] == 10
+    assert etapas['carga_avaluos']['errores'] == 1
+    # El pico de memoria del span interno también cuenta para el que lo contiene
+    assert etapas['carga_avaluos']['pico_python_mb'] >= 20
+    assert etapas['ejecucion']['pico_python_mb'] >= etapas['carga_avaluos']['pico_python_mb']
+    assert etapas['ejecucion']['pico_rss_mb'] >= etapas['carga_avaluos']['pico_rss_mb'] > 0
+    print('✅ Spans acumulados por etapa')
+
+def test_reporte_json():
+    instrumentacion = Instrumentacion()
+    with instrumentacion.span('extraccion') as span:
+        span.filas_salida = 5
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = instrumentacion.escribir_reporte(os.path.join(directorio, 'reportes', 'ejecucion.json'),
+                                                run_id='prueba', reintentos={'total': 0})
+        with open(ruta, encoding='utf-8') as archivo:
+            reporte = json.load(archivo)
+    assert reporte['run_id'] == 'prueba' and reporte['reintentos'] == {'total': 0}
+    assert reporte['etapas']['extraccion']['filas_salida'] == 5
+    assert 'pico_python_mb' not in reporte['etapas']['extraccion']
+    print('✅ Reporte JSON')
+
+if __name__ == "__main__":
+    test_spans_acumulan_por_etapa()
+    test_reporte_json()
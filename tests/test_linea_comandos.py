@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import tempfile
+import datos_sinteticos
+import etl_avaluos
+from etl_avaluos import ETLAvaluos, crear_parser
+
+def test_opciones_de_linea_de_comandos():
+    args = crear_parser().parse_args(['run', '--limit', '500', '--sample-fraction', '0.1', '--chunk-size', '200',
+                                      '--workers', '3', '--loader', 'copy', '--dry-run'])
+    assert (args.limit, args.sample_fraction, args.chunk_size, args.workers, args.loader, args.dry_run) == \
+        (500, 0.1, 200, 3, 'copy', True)
+    # La consulta de extracción aplica la muestra del servidor y el límite ordenado por id_unico
+    consulta = ETLAvaluos(limite=500, fraccion_muestra=0.1)._consulta_extraccion()
+    assert 'FROM public.mi_tabla TABLESAMPLE SYSTEM (10)' in consulta
+    assert consulta.rstrip().endswith('ORDER BY "id_unico" LIMIT 500')
+    for opciones in ({'cargador': 'bcp'}, {'limite': 0}, {'fraccion_muestra': 1.5},
+                     {'simulacion': True, 'reanudar': True}, {'fraccion_muestra': 0.5, 'reanudar': True}):
+        try:
+            ETLAvaluos(**opciones)
+            assert False, f"se aceptó {opciones}"
+        except ValueError:
+            pass
+    print('✅ Opciones de línea de comandos')
+
+def test_importar_simular_y_verificar_en_sqlite():
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        # El ETL escribe etl_lotes.json y el reporte en el directorio de trabajo
+        os.chdir(directorio)
+        try:
+            datos_sinteticos.escribir_dbf('avaluos.dbf', 300)
+            assert etl_avaluos.main(['import-dbf', 'avaluos.dbf', '--limit', '250', '--chunk-size', '100'])
+            # Sin subcomando se ejecuta run; --dry-run no escribe en la base
+            assert etl_avaluos.main(['--limit', '80', '--chunk-size', '30', '--dry-run'])
+            with sqlite3.connect(ruta) as conexion:
+                importados, cargados = conexion.execute(
+                    "SELECT (SELECT COUNT(*) FROM mi_tabla), (SELECT COUNT(*) FROM vehicle_appraisal)").fetchone()
+            assert (importados, cargados) == (250, 0)
+            assert etl_avaluos.main(['run', '--limit', '80', '--workers', '2'])
+            assert etl_avaluos.main(['verify'])
+            # COPY requiere PostgreSQL
+            assert not etl_avaluos.main(['run', '--loader', 'copy'])
+            with sqlite3.connect(ruta) as conexion:
+                cargados = conexion.execute("SELECT COUNT(*) FROM vehicle_appraisal").fetchone()[0]
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+    assert cargados == 80
+    print('✅ import-dbf, run --dry-run, run y verify sobre SQLite')
+
+if __name__ == "__main__":
+    test_opciones_de_linea_de_comandos()
+    test_importar_simular_y_verificar_en_sqlite()
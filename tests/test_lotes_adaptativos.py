@@ -0,0 +1,46 @@
+import os
+import tempfile
+from lotes_adaptativos import LoteAdaptativo, RegistroLotes
+
+def test_ajuste_hacia_latencia_objetivo():
+    # Enlace rápido: 2000 filas en 0.1s con objetivo de 2s, el lote crece como mucho al doble
+    lote = LoteAdaptativo('local/vehicle_appraisal', tamano_inicial=2000, latencia_objetivo=2.0, suavizado=1.0)
+    assert lote.registrar(2000, 0.1) == 4000
+    # Enlace lento: 4000 filas en 16s, el lote baja como mucho a la mitad
+    assert lote.registrar(4000, 16.0) == 2000
+    # Cerca del objetivo converge al tamaño que tarda latencia_objetivo
+    assert lote.registrar(2000, 2.5) == 1600
+    assert len(lote.historial) == 3
+    # Siempre dentro de los límites configurados
+    lote = LoteAdaptativo('x', tamano_inicial=150, minimo=100, maximo=500, suavizado=1.0)
+    assert lote.registrar(150, 100.0) == 100
+    lote.tamano = 400
+    assert lote.registrar(400, 0.001) == 500
+    print('✅ Ajuste del tamaño de lote correcto')
+
+def test_tope_de_memoria():
+    lote = LoteAdaptativo('x', tamano_inicial=50000, memoria_maxima_mb=1, minimo=10)
+    # 1 MiB / (100 bytes * 3 de sobrecosto del INSERT) ≈ 3495 filas
+    assert lote.tamano_actual(100) == 3495
+    assert lote.tamano_actual() == 50000
+    assert lote.tamano_actual(10 ** 9) == 10
+    print('✅ Tope de memoria respetado')
+
+def test_persistencia_entre_ejecuciones():
+    with tempfile.TemporaryDirectory() as directorio:
+        archivo = os.path.join(directorio, 'lotes.json')
+        registro = RegistroLotes('staging:5432/avaluos', archivo=archivo, suavizado=1.0)
+        registro.obtener('vehicle_appraisal').registrar(2000, 0.5)
+        # Un controlador sin lotes no se guarda
+        registro.obtener('appraisal_deductions')
+        estado = registro.guardar()
+        assert list(estado) == ['staging:5432/avaluos/vehicle_appraisal']
+        # La siguiente ejecución arranca del tamaño guardado, por servidor
+        assert RegistroLotes('staging:5432/avaluos', archivo=archivo).obtener('vehicle_appraisal').tamano == 4000
+        assert RegistroLotes('prod:5432/avaluos', archivo=archivo).obtener('vehicle_appraisal').tamano == 2000
+    print('✅ Tamaños de lote persistidos')
+
+if __name__ == "__main__":
+    test_ajuste_hacia_latencia_objetivo()
+    test_tope_de_memoria()
+    test_persistencia_entre_ejecuciones()
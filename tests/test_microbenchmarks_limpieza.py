@@ -0,0 +1,197 @@
+"""
+Micro-benchmarks de las funciones de limpieza con líneas base guardadas por función y perfil
+de entrada. Los tiempos se expresan relativos a una carga de referencia medida en la misma
+máquina, para que la comparación no dependa del hardware donde corre la prueba.
+
+    python -m tests.test_microbenchmarks_limpieza                 # comparar contra las líneas base
+    python -m tests.test_microbenchmarks_limpieza --actualizar    # regrabar las líneas base
+
+MICROBENCH_UMBRAL fija la regresión tolerada (0.3 = 30 % más lento) y MICROBENCH_OMITIR=1
+omite la comparación de tiempos (la equivalencia escalar/vectorizada se prueba siempre).
+"""
+
+import json
+import logging
+import os
+import platform
+import re
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+import datos_sinteticos
+from etl_avaluos import ETLAvaluos
+
+ARCHIVO_LINEAS_BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'microbenchmarks_limpieza.json')
+UMBRAL = float(os.getenv('MICROBENCH_UMBRAL', '0.3'))
+VALORES_POR_PERFIL = 2000
+REPETICIONES = 9
+# Mediciones adicionales antes de dar por buena una regresión (descarta picos de carga de la máquina)
+REINTENTOS = 2
+
+NULOS = [None, '', '  ', 'N/A', 'NULL', 'None', np.nan]
+
+# (función, perfil) -> columna de mi_tabla sintética (None: solo nulos) y argumentos extra
+BENCHMARKS = {
+    ('limpiar_texto', 'nombres'): ('SOLICITANT', ()),
+    ('limpiar_texto', 'vin'): ('VIN_CHASIS', ()),
+    ('limpiar_texto', 'nulos'): (None, ()),
+    ('limpiar_numero', 'montos'): ('AVALUO_BAN', ('float',)),
+    ('limpiar_numero', 'enteros'): ('id_unico', ('int',)),
+    ('limpiar_numero', 'nulos'): (None, ('float',)),
+    ('limpiar_fecha', 'fechas'): ('_FECHAS_1', ()),
+    ('limpiar_fecha', 'nulos'): (None, ()),
+    ('procesar_cilindrada', 'cilindradas'): ('CILINDRADA', ()),
+    ('procesar_cilindrada', 'nulos'): (None, ()),
+    ('limpiar_mileage', 'kms'): ('KMS', ()),
+    ('limpiar_mileage', 'nulos'): (None, ()),
+    ('limpiar_model_year', 'anios'): ('A_O', ()),
+    ('limpiar_model_year', 'nulos'): (None, ()),
+}
+
+# Versión escalar -> versión por columna que debe devolver lo mismo que Series.apply
+VECTORIZADAS = {
+    'limpiar_texto': 'limpiar_texto_serie',
+    'limpiar_numero': 'limpiar_numero_serie',
+    'procesar_cilindrada': 'procesar_cilindrada_serie',
+}
+
+
+def crear_etl():
+    etl = ETLAvaluos()
+    # Se mide la limpieza, no la escritura de logs: las llamadas a logger siguen evaluándose pero no se emiten
+    logging.getLogger('etl_avaluos').setLevel(logging.ERROR)
+    return etl
+
+
+def perfiles_de_entrada():
+    """Valores de entrada por (función, perfil), reproducibles entre ejecuciones"""
+    df = datos_sinteticos.generar_mi_tabla(VALORES_POR_PERFIL, semilla=11)
+    entradas = {}
+    for clave, (columna, _) in BENCHMARKS.items():
+        if columna is None:
+            valores = (NULOS * (VALORES_POR_PERFIL // len(NULOS) + 1))[:VALORES_POR_PERFIL]
+            entradas[clave] = pd.Series(valores, dtype=object)
+        else:
+            entradas[clave] = df[columna]
+    return entradas
+
+
+def _referencia():
+    """Carga fija de Python puro (regex y métodos de str) contra la que se normaliza cada medición"""
+    valores = [f"  Valor {i:05d}, N/A  " for i in range(VALORES_POR_PERFIL)]
+    patron = re.compile(r'[^\w\s]')
+
+    def referencia():
+        for valor in valores:
+            patron.sub('', valor.strip().upper()).replace(' ', '')
+
+    return referencia
+
+
+def _medir_relativo(funcion, cantidad, referencia):
+    """
+    Microsegundos por valor y tiempo relativo a la referencia. Cada repetición mide la
+    referencia justo antes que la función, así una máquina cargada afecta a ambas por igual
+    """
+    tiempos, tiempos_referencia = [], []
+    for _ in range(REPETICIONES):
+        tiempos_referencia.append(timeit.timeit(referencia, number=1))
+        tiempos.append(timeit.timeit(funcion, number=1))
+    mejor = min(tiempos)
+    return mejor / cantidad * 1e6, mejor / min(tiempos_referencia)
+
+
+def _funciones(etl, entradas):
+    """(clave, función a medir, cantidad de valores) de cada escalar (vía apply) y su versión por columna"""
+    for (nombre, perfil), (_, argumentos) in BENCHMARKS.items():
+        serie = entradas[(nombre, perfil)]
+        escalar = getattr(etl, nombre)
+        yield f"{nombre}/{perfil}", lambda: serie.apply(escalar, args=argumentos), len(serie)
+        if nombre in VECTORIZADAS:
+            vectorizada = getattr(etl, VECTORIZADAS[nombre])
+            yield f"{VECTORIZADAS[nombre]}/{perfil}", lambda: vectorizada(serie, *argumentos), len(serie)
+
+
+def medir(etl, entradas, claves=None):
+    """{clave: (µs por valor, tiempo relativo a la referencia)}"""
+    referencia = _referencia()
+    return {clave: _medir_relativo(funcion, cantidad, referencia)
+            for clave, funcion, cantidad in _funciones(etl, entradas) if claves is None or clave in claves}
+
+
+def cargar_lineas_base():
+    if not os.path.exists(ARCHIVO_LINEAS_BASE):
+        return {}
+    with open(ARCHIVO_LINEAS_BASE, encoding='utf-8') as archivo:
+        return json.load(archivo)['lineas_base']
+
+
+def actualizar_lineas_base():
+    etl = crear_etl()
+    lineas_base = {
+        clave: {'relativo': round(relativo, 3), 'us_por_valor': round(tiempo, 3)}
+        for clave, (tiempo, relativo) in medir(etl, perfiles_de_entrada()).items()
+    }
+    with open(ARCHIVO_LINEAS_BASE, 'w', encoding='utf-8') as archivo:
+        json.dump({'python': platform.python_version(), 'pandas': pd.__version__, 'lineas_base': lineas_base},
+                  archivo, ensure_ascii=False, indent=2)
+        archivo.write('\n')
+    print(f"💾 {len(lineas_base)} líneas base guardadas en {ARCHIVO_LINEAS_BASE}")
+
+
+def test_equivalencia_escalar_vectorizada():
+    etl = crear_etl()
+    entradas = perfiles_de_entrada()
+    # Valores con tipos mezclados que la versión por columna debe tratar igual que la escalar
+    bordes = pd.Series(['1,5', '$ 1.200,00', '-.5', '5.', '1.2.3', '--5', ' - ', 1, 1.0, True, -2.7,
+                        float('inf'), 1e20, pd.NaT, '٣٤', 'ñandú  ¿qué?', '\t a\n b ', 'x' * 150], dtype=object)
+    for (nombre, perfil), (_, argumentos) in BENCHMARKS.items():
+        if nombre not in VECTORIZADAS:
+            continue
+        for serie in (entradas[(nombre, perfil)], pd.concat([entradas[(nombre, perfil)], bordes], ignore_index=True),
+                      entradas[(nombre, perfil)].head(0)):
+            esperado = serie.apply(getattr(etl, nombre), args=argumentos)
+            obtenido = getattr(etl, VECTORIZADAS[nombre])(serie, *argumentos)
+            assert obtenido.dtype == esperado.dtype, f"{nombre}/{perfil}: {obtenido.dtype} != {esperado.dtype}"
+            assert obtenido.equals(esperado), f"{VECTORIZADAS[nombre]} difiere de {nombre} en el perfil {perfil}"
+    print('✅ Versiones escalares y vectorizadas equivalentes')
+
+
+def test_sin_regresiones_de_tiempo():
+    if os.getenv('MICROBENCH_OMITIR') == '1':
+        print('⏭️ Micro-benchmarks omitidos (MICROBENCH_OMITIR=1)')
+        return
+    lineas_base = cargar_lineas_base()
+    assert lineas_base, "Faltan las líneas base: python -m tests.test_microbenchmarks_limpieza --actualizar"
+    etl = crear_etl()
+    entradas = perfiles_de_entrada()
+    mediciones = medir(etl, entradas)
+    for _ in range(REINTENTOS):
+        sospechosas = [clave for clave, (_, relativo) in mediciones.items()
+                       if clave in lineas_base and relativo / lineas_base[clave]['relativo'] - 1 > UMBRAL]
+        if not sospechosas:
+            break
+        for clave, (tiempo, relativo) in medir(etl, entradas, sospechosas).items():
+            if relativo < mediciones[clave][1]:
+                mediciones[clave] = (tiempo, relativo)
+    regresiones = []
+    for clave, (tiempo, relativo) in mediciones.items():
+        base = lineas_base.get(clave)
+        if base is None:
+            print(f"⚠️ {clave}: sin línea base ({relativo:.3f})")
+            continue
+        variacion = relativo / base['relativo'] - 1
+        print(f"⏱️ {clave}: {tiempo:.3f} µs/valor, {relativo:.3f} (base {base['relativo']:.3f}, {variacion:+.0%})")
+        if variacion > UMBRAL:
+            regresiones.append(f"{clave} {variacion:+.0%}")
+    assert not regresiones, f"Limpiezas más lentas que su línea base (umbral {UMBRAL:.0%}): {', '.join(regresiones)}"
+    print('✅ Sin regresiones de tiempo en las limpiezas')
+
+
+if __name__ == "__main__":
+    if '--actualizar' in sys.argv:
+        actualizar_lineas_base()
+    else:
+        test_equivalencia_escalar_vectorizada()
+        test_sin_regresiones_de_tiempo()
@@ -0,0 +1,32 @@
+import os
+import json
+import tempfile
+import base_postgresql
+from etl_avaluos import ETLAvaluos, ARCHIVO_MODO_MASIVO
+
+@base_postgresql.requerida
+def test_pendiente_sin_restaurar_cancela_la_ejecucion():
+    if not base_postgresql.habilitada('la prueba del modo masivo'):
+        return
+    base_postgresql.preparar(30)
+    # Un índice pendiente de una ejecución anterior que no se puede reconstruir
+    pendiente = {'llaves_foraneas': [], 'indices': [
+        {'nombre': 'public.ix_pendiente_fallido', 'definicion': 'CREATE INDEX ix_pendiente_fallido ON public.tabla_inexistente (x)'}]}
+    directorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        try:
+            with open(ARCHIVO_MODO_MASIVO, 'w', encoding='utf-8') as archivo:
+                json.dump(pendiente, archivo)
+            exito = ETLAvaluos(modo_masivo=True, directorio_reportes=None).ejecutar_etl()
+            with open(ARCHIVO_MODO_MASIVO, encoding='utf-8') as archivo:
+                conservado = json.load(archivo)
+        finally:
+            os.chdir(directorio_original)
+    assert not exito
+    assert conservado == pendiente
+    assert base_postgresql.consultar("SELECT count(*) FROM public.vehicle_appraisal")[0][0] == 0
+    print('✅ Un modo masivo pendiente sin restaurar cancela la ejecución y conserva sus definiciones')
+
+if __name__ == "__main__":
+    test_pendiente_sin_restaurar_cancela_la_ejecucion()
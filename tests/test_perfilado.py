@@ -0,0 +1,99 @@
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+import perfilado
+from instrumentacion import Instrumentacion
+from perfilado import crear_perfilador
+
+def transformar():
+    return [str(i) * 3 for i in range(20000)]
+
+def cargar():
+    time.sleep(0.05)
+
+def ejecutar_con_perfil(modo, directorio):
+    instrumentacion = Instrumentacion()
+    perfilador = crear_perfilador(modo, directorio)
+    perfilador.iniciar(instrumentacion)
+    with instrumentacion.span('ejecucion'):
+        with instrumentacion.span('transformacion'):
+            datos = transformar()
+        with instrumentacion.span('carga_avaluos'):
+            cargar()
+    del datos
+    return perfilador.detener()
+
+def test_perfil_cpu_por_etapa():
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = ejecutar_con_perfil('cpu', directorio)
+        assert os.path.basename(ruta).endswith('-cpu')
+        funciones = {f[2] for f in pstats.Stats(os.path.join(ruta, 'transformacion.pstats')).stats}
+        assert 'transformar' in funciones and 'cargar' not in funciones
+        # La etapa que contiene a otras solo registra su propio tiempo
+        funciones = {f[2] for f in pstats.Stats(os.path.join(ruta, 'ejecucion.pstats')).stats}
+        assert 'transformar' not in funciones
+        assert os.path.exists(os.path.join(ruta, 'total.pstats'))
+    print('✅ Perfil de CPU por etapa')
+
+class PerfilOcupado:
+    """cProfile.Profile cuando otra herramienta ya perfila el proceso (Python 3.12+)"""
+    def enable(self):
+        raise ValueError("Another profiling tool is already active")
+
+def test_perfil_cpu_registra_etapas_omitidas():
+    original = perfilado.cProfile
+    perfilado.cProfile = type('cProfileOcupado', (), {'Profile': PerfilOcupado})
+    try:
+        with tempfile.TemporaryDirectory() as directorio:
+            perfilador = crear_perfilador('cpu', directorio)
+            instrumentacion = Instrumentacion()
+            perfilador.iniciar(instrumentacion)
+            with instrumentacion.span('ejecucion'):
+                for _ in range(2):
+                    with instrumentacion.span('transformacion'):
+                        transformar()
+            perfilador.detener()
+    finally:
+        perfilado.cProfile = original
+    assert perfilador.etapas_omitidas == {'ejecucion': 1, 'transformacion': 2}
+    print('✅ Las etapas sin perfil de CPU quedan registradas')
+
+def test_perfilador_sin_escribir_no_se_instancia():
+    class PerfiladorIncompleto(perfilado.Perfilador):
+        modo = 'incompleto'
+    try:
+        PerfiladorIncompleto()
+        assert False, "Se esperaba TypeError"
+    except TypeError:
+        pass
+    print('✅ Perfilador exige _escribir')
+
+def test_perfil_memoria_por_etapa():
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = ejecutar_con_perfil('memory', directorio)
+        with open(os.path.join(ruta, 'transformacion.txt'), encoding='utf-8') as archivo:
+            assert 'test_perfilado.py' in archivo.read()
+        assert tracemalloc.Snapshot.load(os.path.join(ruta, 'transformacion.snapshot')).traces
+    assert not tracemalloc.is_tracing()
+    print('✅ Perfil de memoria por etapa')
+
+def test_muestreo_colapsado():
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = ejecutar_con_perfil('sampling', directorio)
+        with open(os.path.join(ruta, 'carga_avaluos.folded'), encoding='utf-8') as archivo:
+            lineas = archivo.read().splitlines()
+        with open(os.path.join(ruta, 'todas.folded'), encoding='utf-8') as archivo:
+            todas = archivo.read().splitlines()
+    pila, cantidad = lineas[0].rsplit(' ', 1)
+    assert pila.endswith('test_perfilado.py:cargar') and int(cantidad) > 0
+    assert any(linea.startswith('carga_avaluos;') for linea in todas)
+    print('✅ Muestreo de pilas en formato colapsado')
+
+if __name__ == "__main__":
+    test_perfil_cpu_por_etapa()
+    test_perfil_cpu_registra_etapas_omitidas()
+    test_perfilador_sin_escribir_no_se_instancia()
+    test_perfil_memoria_por_etapa()
+    test_muestreo_colapsado()
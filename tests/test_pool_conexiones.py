@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import tempfile
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from database_connection import (configuracion_pool, EstadisticasPool, PoolInstrumentado,
+                                 DatabaseConnection, PERFILES_CONEXION)
+
+def test_configuracion_desde_entorno():
+    anteriores = {v: os.environ.pop(v, None) for v in ('DB_POOL_SIZE', 'DB_MAX_OVERFLOW')}
+    try:
+        assert configuracion_pool()['pool_size'] == 5
+        os.environ['DB_POOL_SIZE'] = '12'
+        os.environ['DB_MAX_OVERFLOW'] = '0'
+        configuracion = configuracion_pool()
+        assert configuracion['pool_size'] == 12 and configuracion['max_overflow'] == 0
+        # Los argumentos explícitos tienen prioridad sobre el entorno
+        assert configuracion_pool(pool_size=3)['pool_size'] == 3
+        os.environ['DB_POOL_SIZE'] = 'muchos'
+        try:
+            configuracion_pool()
+            assert False, "Se esperaba ValueError"
+        except ValueError:
+            pass
+    finally:
+        for variable, valor in anteriores.items():
+            os.environ.pop(variable, None)
+            if valor is not None:
+                os.environ[variable] = valor
+    print('✅ Configuración del pool por entorno correcta')
+
+def test_instrumentacion_del_pool():
+    pool = PoolInstrumentado(lambda: sqlite3.connect(':memory:', check_same_thread=False),
+                             pool_size=1, max_overflow=1, timeout=0.05)
+    pool.estadisticas = EstadisticasPool()
+    primera = pool.connect()
+    segunda = pool.connect()  # usa el overflow
+    try:
+        pool.connect()
+        assert False, "Se esperaba timeout del pool"
+    except PoolTimeoutError:
+        pass
+    primera.close()
+    segunda.close()
+    resumen = pool.estadisticas.resumen()
+    assert resumen['checkouts'] == 2
+    assert resumen['checkouts_con_overflow'] == 1
+    assert resumen['en_uso_maximo'] == 2
+    assert resumen['timeouts'] == 1
+    assert resumen['espera_maxima_ms'] >= 40
+    # Las estadísticas sobreviven a la recreación del pool; la marca por hilo es de cada pool
+    recreado = pool.recreate()
+    assert recreado.estadisticas is pool.estadisticas
+    assert recreado._local is not pool._local
+    print('✅ Instrumentación del pool correcta')
+
+def test_perfiles_de_conexion():
+    # Los valores van como texto a set_config y a server_settings de asyncpg
+    assert all(isinstance(valor, str) for perfil in PERFILES_CONEXION.values() for valor in perfil.values())
+    assert PERFILES_CONEXION['bulk_load']['synchronous_commit'] == 'off'
+    with tempfile.TemporaryDirectory() as directorio:
+        db = DatabaseConnection(backend='sqlite', ruta_sqlite=os.path.join(directorio, 'etl.sqlite'))
+        try:
+            # Los perfiles comparten el pool del engine base y se reutilizan
+            engine = db.get_engine('bulk_load')
+            assert engine.pool is db.get_engine().pool
+            assert db.get_engine('bulk_load') is engine
+            try:
+                db.get_engine('reportes')
+                assert False, "Se esperaba ValueError"
+            except ValueError:
+                pass
+        finally:
+            db.close_connection()
+    print('✅ Perfiles de conexión correctos')
+
+def test_conexion_fallida_no_crea_engine():
+    db = DatabaseConnection(backend='postgresql', connect_timeout=2)
+    # Puerto sin servidor: el engine solo se da por creado después de conectar
+    db.db_user, db.db_password, db.db_host, db.db_port, db.db_name = 'etl', 'x', '127.0.0.1', '9', 'avaluos'
+    try:
+        db.get_engine()
+        assert False, "Se esperaba OperationalError"
+    except OperationalError:
+        pass
+    assert db.engine is None
+    print('✅ Una conexión fallida no se informa como establecida')
+
+if __name__ == "__main__":
+    test_configuracion_desde_entorno()
+    test_instrumentacion_del_pool()
+    test_perfiles_de_conexion()
+    test_conexion_fallida_no_crea_engine()
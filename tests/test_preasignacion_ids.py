@@ -0,0 +1,69 @@
+import warnings
+import pandas as pd
+import base_postgresql
+import datos_sinteticos
+from etl_avaluos import ETLAvaluos
+
+class ETLConIdsRegistrados(ETLAvaluos):
+    """Guarda el mapeo id_unico -> ID reservado de cada bloque"""
+    def __init__(self, **opciones):
+        super().__init__(**opciones)
+        self.reservados = {}
+
+    def asignar_ids_preasignados(self, df_transformado):
+        mapeo = super().asignar_ids_preasignados(df_transformado)
+        if mapeo:
+            self.reservados.update(mapeo)
+        return mapeo
+
+def test_ids_alineados_con_filas_filtradas():
+    etl = ETLAvaluos(directorio_reportes=None)
+    df_origen = datos_sinteticos.generar_mi_tabla(30)
+    # Un registro sin id_unico se descarta en la transformación
+    df_origen.loc[3, 'id_unico'] = None
+    etl.reservar_ids_vehicle_appraisal = lambda cantidad: list(range(501, 501 + cantidad))
+    # Las columnas se asignan sobre un DataFrame propio, no sobre una vista del filtrado
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', pd.errors.SettingWithCopyWarning)
+        df_transformado = etl.transformar_datos(df_origen)
+        mapeo = etl.asignar_ids_preasignados(df_transformado)
+    assert len(df_transformado) == 29
+    assert df_transformado['vehicle_appraisal_id'].tolist() == list(range(501, 530))
+    assert mapeo == dict(zip(df_transformado['referencia_original'].tolist(), range(501, 530)))
+    print('✅ IDs preasignados alineados con las filas transformadas')
+
+def test_ids_preasignados_solo_en_modo_append():
+    for modo_carga in ('upsert', 'cte'):
+        try:
+            ETLAvaluos(preasignar_ids=True, modo_carga=modo_carga, directorio_reportes=None)
+        except ValueError as error:
+            assert 'preasignar_ids' in str(error)
+        else:
+            raise AssertionError(f"preasignar_ids con modo_carga='{modo_carga}' debe rechazarse")
+    print('✅ preasignar_ids se rechaza con upsert y CTE')
+
+@base_postgresql.requerida
+def test_ids_preasignados_en_postgresql():
+    if not base_postgresql.habilitada('la prueba de IDs preasignados'):
+        return
+    base_postgresql.preparar(250)
+    etl = ETLConIdsRegistrados(preasignar_ids=True, tamano_bloque=100, directorio_reportes=None)
+    assert etl.ejecutar_etl()
+    cargados = dict(base_postgresql.consultar(
+        "SELECT referencia_original, vehicle_appraisal_id FROM public.vehicle_appraisal"))
+    huerfanas, deducciones = base_postgresql.consultar("""
+        SELECT count(*) FILTER (WHERE v.vehicle_appraisal_id IS NULL), count(*)
+        FROM public.appraisal_deductions d
+        LEFT JOIN public.vehicle_appraisal v ON v.vehicle_appraisal_id = d.vehicle_appraisal_id
+    """)[0]
+    # Deducciones esperadas: las mismas que produce procesar_deducciones sobre todo mi_tabla
+    df_origen = datos_sinteticos.generar_mi_tabla(250)
+    esperadas = etl.procesar_deducciones(df_origen, {i: i for i in df_origen['id_unico'].tolist()})
+    assert len(cargados) == 250 and cargados == etl.reservados
+    assert huerfanas == 0 and deducciones == len(esperadas)
+    print('✅ IDs preasignados iguales a los insertados y usados por las deducciones')
+
+if __name__ == "__main__":
+    test_ids_alineados_con_filas_filtradas()
+    test_ids_preasignados_solo_en_modo_append()
+    test_ids_preasignados_en_postgresql()
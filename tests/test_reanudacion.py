@@ -0,0 +1,183 @@
+import os
+import sys
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import datos_sinteticos
+from database_connection import DatabaseConnection
+from etl_avaluos import ETLAvaluos
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# El proceso muere al registrar el checkpoint de los avalúos del bloque 2, ya insertados
+EJECUCION_INTERRUMPIDA = """
+import os
+from etl_avaluos import ETLAvaluos
+
+class ETLInterrumpido(ETLAvaluos):
+    def _registrar_checkpoint(self, bloque, etapa, *args, **kwargs):
+        if bloque['bloque'] == 2 and etapa == 'avaluos':
+            os._exit(9)
+        return super()._registrar_checkpoint(bloque, etapa, *args, **kwargs)
+
+ETLInterrumpido(tamano_bloque=50, directorio_reportes=None).ejecutar_etl()
+"""
+
+def test_reanudar_tras_interrumpir_la_ejecucion():
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        # El ETL escribe etl_lotes.json en el directorio de trabajo
+        os.chdir(directorio)
+        try:
+            db = DatabaseConnection()
+            datos_sinteticos.cargar_mi_tabla(db, 200)
+            db.close_connection()
+            entorno = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [RAIZ, os.environ.get('PYTHONPATH')])))
+            interrumpida = subprocess.run([sys.executable, '-c', EJECUCION_INTERRUMPIDA], env=entorno,
+                                          capture_output=True).returncode
+            with sqlite3.connect(ruta) as conexion:
+                etapas = dict(conexion.execute("SELECT bloque, etapa FROM etl_checkpoints"))
+                cargados_antes = conexion.execute("SELECT COUNT(*) FROM vehicle_appraisal").fetchone()[0]
+            reanudada = ETLAvaluos(tamano_bloque=50, reanudar=True, directorio_reportes=None)
+            exito = reanudada.ejecutar_etl()
+            with sqlite3.connect(ruta) as conexion:
+                avaluos = conexion.execute("SELECT COUNT(*), COUNT(DISTINCT referencia_original) FROM vehicle_appraisal").fetchone()
+                deducciones = conexion.execute("SELECT COUNT(*) FROM appraisal_deductions").fetchone()[0]
+                ejecuciones = conexion.execute("SELECT run_id, estado, filas_cargadas FROM etl_runs").fetchall()
+            # Con la ejecución ya completa, --resume no la vuelve a tomar
+            siguiente = ETLAvaluos(reanudar=True, directorio_reportes=None)
+            assert siguiente.conectar_base_datos() and siguiente._asegurar_tabla_checkpoints()
+            assert siguiente._preparar_reanudacion()
+            siguiente.db_connection.close_connection()
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+    df_origen = datos_sinteticos.generar_mi_tabla(200)
+    esperadas = ETLAvaluos(directorio_reportes=None).procesar_deducciones(
+        df_origen, {i: i for i in df_origen['id_unico'].tolist()})
+    assert interrumpida == 9
+    # Los avalúos del bloque 2 no se confirman sin su checkpoint: se vuelven a cargar al reanudar
+    assert etapas == {1: 'completo'} and cargados_antes == 50
+    assert exito
+    assert avaluos == (200, 200) and deducciones == len(esperadas)
+    assert ejecuciones == [(reanudada.run_id, 'completo', 200)]
+    assert siguiente.run_id is None
+    print('✅ Una ejecución interrumpida se reanuda sin duplicar ni perder bloques')
+
+def test_reanudar_bloque_sin_deducciones_despues_de_un_hueco():
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        os.chdir(directorio)
+        try:
+            db = DatabaseConnection()
+            datos_sinteticos.cargar_mi_tabla(db, 200)
+            db.close_connection()
+            assert ETLAvaluos(tamano_bloque=50, directorio_reportes=None).ejecutar_etl()
+            # El bloque 2 falló sin confirmarse (como en la carga asíncrona) y el 4 quedó sin deducciones
+            with sqlite3.connect(ruta) as conexion:
+                rangos = {bloque: (desde, hasta) for bloque, desde, hasta in
+                          conexion.execute("SELECT bloque, id_desde, id_hasta FROM etl_checkpoints")}
+                for bloque in (2, 4):
+                    conexion.execute("""
+                        DELETE FROM appraisal_deductions WHERE vehicle_appraisal_id IN (
+                            SELECT vehicle_appraisal_id FROM vehicle_appraisal WHERE referencia_original BETWEEN ? AND ?)
+                    """, rangos[bloque])
+                conexion.execute("DELETE FROM vehicle_appraisal WHERE referencia_original BETWEEN ? AND ?", rangos[2])
+                conexion.execute("DELETE FROM etl_checkpoints WHERE bloque = 2")
+                conexion.execute("UPDATE etl_checkpoints SET etapa = 'avaluos', filas_deducciones = NULL WHERE bloque = 4")
+                conexion.execute("""
+                    UPDATE etl_runs SET estado = 'fallido',
+                        filas_cargadas = (SELECT SUM(filas_avaluos) FROM etl_checkpoints),
+                        deducciones_cargadas = (SELECT COALESCE(SUM(filas_deducciones), 0) FROM etl_checkpoints)
+                """)
+            exito = ETLAvaluos(tamano_bloque=50, reanudar=True, directorio_reportes=None).ejecutar_etl()
+            with sqlite3.connect(ruta) as conexion:
+                avaluos = conexion.execute("SELECT COUNT(*), COUNT(DISTINCT referencia_original) FROM vehicle_appraisal").fetchone()
+                deducciones = conexion.execute("SELECT COUNT(*) FROM appraisal_deductions").fetchone()[0]
+                etapas = {etapa for (etapa,) in conexion.execute("SELECT etapa FROM etl_checkpoints")}
+                ejecucion = conexion.execute("SELECT estado, filas_cargadas, deducciones_cargadas FROM etl_runs").fetchone()
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+    df_origen = datos_sinteticos.generar_mi_tabla(200)
+    esperadas = ETLAvaluos(directorio_reportes=None).procesar_deducciones(
+        df_origen, {i: i for i in df_origen['id_unico'].tolist()})
+    assert exito
+    # Las deducciones del bloque 4 se cargan aunque esté entre los bloques confirmados después del hueco
+    assert avaluos == (200, 200) and deducciones == len(esperadas)
+    assert etapas == {'completo'}
+    assert ejecucion == ('completo', 200, len(esperadas))
+    print('✅ --resume completa las deducciones de un bloque posterior al primer hueco')
+
+class ETLParticionFallida(ETLAvaluos):
+    """La segunda partición de avalúos del bloque 2 falla sin reintentos"""
+    def __init__(self, **opciones):
+        super().__init__(**opciones)
+        self._particiones_bloque_2 = []
+        self._candado = threading.Lock()
+
+    def _registrar_avance(self, conexion, bloque, filas_avaluos=None, filas_deducciones=None):
+        if bloque['bloque'] == 2 and filas_avaluos is not None:
+            with self._candado:
+                self._particiones_bloque_2.append(filas_avaluos)
+                if len(self._particiones_bloque_2) == 2:
+                    raise RuntimeError('partición fallida')
+        return super()._registrar_avance(conexion, bloque, filas_avaluos, filas_deducciones)
+
+def test_reanudar_no_duplica_particiones_sin_checkpoint():
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        os.chdir(directorio)
+        try:
+            db = DatabaseConnection()
+            datos_sinteticos.cargar_mi_tabla(db, 200)
+            db.close_connection()
+            fallida = ETLParticionFallida(tamano_bloque=50, workers=2, max_intentos=1,
+                                          directorio_reportes=None).ejecutar_etl()
+            with sqlite3.connect(ruta) as conexion:
+                antes = conexion.execute("SELECT COUNT(*) FROM vehicle_appraisal").fetchone()[0]
+            # Reanudar con particiones en paralelo se rechaza al crear el ETL
+            try:
+                ETLAvaluos(tamano_bloque=50, workers=2, reanudar=True, directorio_reportes=None)
+                rechazada = False
+            except ValueError:
+                rechazada = True
+            # Sin workers, la partición confirmada sin checkpoint impide reanudar en modo append
+            reanudada = ETLAvaluos(tamano_bloque=50, reanudar=True, directorio_reportes=None).ejecutar_etl()
+            with sqlite3.connect(ruta) as conexion:
+                despues = conexion.execute(
+                    "SELECT COUNT(*), COUNT(DISTINCT referencia_original) FROM vehicle_appraisal").fetchone()
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+    assert not fallida and antes == 75
+    assert rechazada
+    assert not reanudada and despues == (75, 75)
+    print('✅ --resume no vuelve a insertar particiones confirmadas sin checkpoint')
+
+if __name__ == "__main__":
+    test_reanudar_tras_interrumpir_la_ejecucion()
+    test_reanudar_bloque_sin_deducciones_despues_de_un_hueco()
+    test_reanudar_no_duplica_particiones_sin_checkpoint()
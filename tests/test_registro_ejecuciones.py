@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import tempfile
+import datos_sinteticos
+from database_connection import DatabaseConnection
+from etl_avaluos import ETLAvaluos
+
+def ejecutar(**opciones):
+    etl = ETLAvaluos(directorio_reportes=None, **opciones)
+    exito = etl.ejecutar_etl()
+    etapas = etl.instrumentacion.etapas()
+    return exito, etl.run_id, etapas.get('verificacion', {}).get('filas_salida')
+
+def test_etl_runs_registra_cada_ejecucion():
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        # El ETL escribe etl_lotes.json en el directorio de trabajo
+        os.chdir(directorio)
+        try:
+            db = DatabaseConnection()
+            datos_sinteticos.cargar_mi_tabla(db, 200)
+            db.close_connection()
+            por_bloques = ejecutar(tamano_bloque=80)
+            secuencial = ejecutar()
+            # Sin registros que extraer la ejecución falla y queda registrada como fallida
+            fallida = ejecutar(ids_origen=[])
+            # `verify` sin run_id toma la última iniciada aunque las tres caigan en el mismo segundo
+            consulta = ETLAvaluos(directorio_reportes=None)
+            assert consulta.conectar_base_datos()
+            ultima = consulta.consultar_ejecucion()
+            consulta.db_connection.close_connection()
+            with sqlite3.connect(ruta) as conexion:
+                conexion.row_factory = sqlite3.Row
+                filas = {fila['run_id']: dict(fila) for fila in conexion.execute("SELECT * FROM etl_runs")}
+                deducciones = conexion.execute("SELECT COUNT(*) FROM appraisal_deductions").fetchone()[0]
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+    # La verificación lee la fila de la ejecución: 200 en cada una, no el total de la tabla
+    assert por_bloques[0] and por_bloques[2] == 200
+    assert secuencial[0] and secuencial[2] == 200
+    assert not fallida[0]
+    assert ultima['run_id'] == fallida[1] and '.' in str(ultima['iniciado'])
+    primera, segunda = filas[por_bloques[1]], filas[secuencial[1]]
+    assert primera['estado'] == 'completo' and filas[fallida[1]]['estado'] == 'fallido'
+    assert (primera['id_desde'], primera['id_hasta']) == (1, 200)
+    assert (primera['filas_extraidas'], primera['filas_transformadas'], primera['filas_rechazadas']) == (200, 200, 0)
+    assert primera['filas_cargadas'] == 200
+    assert primera['deducciones_cargadas'] + segunda['deducciones_cargadas'] == deducciones
+    assert 'extraccion' in primera['duraciones'] and 'carga_avaluos' in primera['duraciones']
+    # El mismo origen da la misma huella con o sin bloques
+    assert primera['huella_origen'] and primera['huella_origen'] == segunda['huella_origen']
+    print('✅ etl_runs registra y verifica cada ejecución')
+
+class ETLSinCheckpointCompleto(ETLAvaluos):
+    """Falla al registrar la etapa 'completo' de cada bloque"""
+    def _registrar_checkpoint(self, bloque, etapa, *args, **kwargs):
+        if etapa == 'completo':
+            raise RuntimeError('checkpoint no disponible')
+        return super()._registrar_checkpoint(bloque, etapa, *args, **kwargs)
+
+def test_etl_runs_se_confirma_con_los_datos():
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    directorio_original = os.getcwd()
+    resultados = {}
+    try:
+        for workers in (1, 2):
+            with tempfile.TemporaryDirectory() as directorio:
+                ruta = os.path.join(directorio, 'etl.sqlite')
+                os.environ['DB_BACKEND'] = 'sqlite'
+                os.environ['DB_SQLITE_PATH'] = ruta
+                os.chdir(directorio)
+                db = DatabaseConnection()
+                datos_sinteticos.cargar_mi_tabla(db, 200)
+                db.close_connection()
+                etl = ETLSinCheckpointCompleto(directorio_reportes=None, tamano_bloque=100, workers=workers)
+                etl.ejecutar_etl()
+                with sqlite3.connect(ruta) as conexion:
+                    resultados[workers] = (
+                        conexion.execute("SELECT filas_cargadas, deducciones_cargadas FROM etl_runs").fetchone(),
+                        (conexion.execute("SELECT COUNT(*) FROM vehicle_appraisal").fetchone()[0],
+                         conexion.execute("SELECT COUNT(*) FROM appraisal_deductions").fetchone()[0]))
+                os.chdir(directorio_original)
+    finally:
+        os.chdir(directorio_original)
+        for variable, valor in anteriores.items():
+            os.environ.pop(variable, None)
+            if valor is not None:
+                os.environ[variable] = valor
+    # Las filas sumadas a etl_runs son las confirmadas, también con particiones en paralelo
+    for workers, (registrado, cargado) in resultados.items():
+        assert registrado == cargado, (workers, registrado, cargado)
+        assert registrado[0] == 200
+    # Sin workers las deducciones y su checkpoint se confirman o se descartan juntos
+    assert resultados[1][1][1] == 0 and resultados[2][1][1] > 0
+    print('✅ etl_runs se confirma en la misma transacción que los datos')
+
+if __name__ == "__main__":
+    test_etl_runs_registra_cada_ejecucion()
+    test_etl_runs_se_confirma_con_los_datos()
@@ -0,0 +1,71 @@
+import psycopg2
+from psycopg2.errors import DataError, IntegrityError, InFailedSqlTransaction, SerializationFailure, QueryCanceled
+from sqlalchemy.exc import OperationalError as SAOperationalError, IntegrityError as SAIntegrityError
+from reintentos import es_error_transitorio, Reintentador
+
+def test_clasificacion_errores():
+    # Transitorios: conexión caída, serialización, timeout
+    assert es_error_transitorio(psycopg2.OperationalError("server closed the connection unexpectedly"))
+    assert es_error_transitorio(SerializationFailure())
+    assert es_error_transitorio(QueryCanceled())
+    assert es_error_transitorio(SAOperationalError("INSERT", {}, psycopg2.OperationalError("connection reset")))
+    assert es_error_transitorio(ConnectionResetError())
+    # Fatales: datos inválidos, integridad, transacción abortada, errores de programación
+    assert not es_error_transitorio(DataError())
+    assert not es_error_transitorio(IntegrityError())
+    assert not es_error_transitorio(InFailedSqlTransaction())
+    assert not es_error_transitorio(SAIntegrityError("INSERT", {}, IntegrityError()))
+    assert not es_error_transitorio(ValueError("dato inválido"))
+    print('✅ Clasificación de errores correcta')
+
+def test_reintenta_solo_transitorios():
+    reintentador = Reintentador(max_intentos=4, espera_base=0)
+    intentos = []
+
+    def falla_dos_veces():
+        intentos.append(1)
+        if len(intentos) < 3:
+            raise psycopg2.OperationalError("connection reset by peer")
+        return 'ok'
+
+    assert reintentador.ejecutar("carga de prueba", falla_dos_veces) == 'ok'
+    assert len(intentos) == 3
+    resumen = reintentador.resumen()
+    assert resumen['total'] == 2
+    assert resumen['por_operacion'] == {'carga de prueba': 2}
+
+    # Un error fatal no se reintenta
+    intentos.clear()
+    def fatal():
+        intentos.append(1)
+        raise DataError("invalid input syntax")
+    try:
+        reintentador.ejecutar("carga fatal", fatal)
+        assert False, "Se esperaba DataError"
+    except DataError:
+        pass
+    assert len(intentos) == 1
+    print('✅ Reintentos con espera exponencial correctos')
+
+def test_agota_intentos():
+    reintentador = Reintentador(max_intentos=3, espera_base=0)
+    intentos = []
+    def siempre_falla():
+        intentos.append(1)
+        raise psycopg2.OperationalError("timeout expired")
+    try:
+        reintentador.ejecutar("carga", siempre_falla)
+        assert False, "Se esperaba OperationalError"
+    except psycopg2.OperationalError:
+        pass
+    assert len(intentos) == 3
+    assert reintentador.resumen()['total'] == 2
+    # La espera nunca supera el máximo configurado
+    reintentador = Reintentador(espera_base=10, espera_maxima=5)
+    assert all(0 <= reintentador.calcular_espera(i) <= 5 for i in range(1, 10))
+    print('✅ Límite de intentos respetado')
+
+if __name__ == "__main__":
+    test_clasificacion_errores()
+    test_reintenta_solo_transitorios()
+    test_agota_intentos()
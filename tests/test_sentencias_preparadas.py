@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+from sentencias_preparadas import RegistroSentencias
+
+class ConexionFalsa:
+    """Registra el SQL enviado; imita exec_driver_sql y connection.info de SQLAlchemy"""
+    def __init__(self, paramstyle='pyformat'):
+        self.connection = SimpleNamespace(info={})
+        self.dialect = SimpleNamespace(paramstyle=paramstyle)
+        self.enviadas = []
+
+    def exec_driver_sql(self, sql, parametros=None, execution_options=None):
+        self.enviadas.append((sql, parametros))
+        return sql
+
+def test_prepara_una_vez_por_conexion():
+    registro = RegistroSentencias(max_por_conexion=2)
+    conexion = ConexionFalsa()
+    for _ in range(3):
+        registro.ejecutar(conexion, 'resolver_ids', "SELECT 1 WHERE 1 = ANY($1)", ([1, 2],))
+    assert conexion.enviadas[0] == ("PREPARE etl_resolver_ids AS SELECT 1 WHERE 1 = ANY($1)", None)
+    assert conexion.enviadas[1:] == [("EXECUTE etl_resolver_ids (%s)", ([1, 2],))] * 3
+    # Otra conexión del pool prepara su propia copia
+    otra = ConexionFalsa()
+    registro.ejecutar(otra, 'resolver_ids', "SELECT 1 WHERE 1 = ANY($1)", ([3],))
+    assert otra.enviadas[0][0].startswith("PREPARE")
+    resumen = registro.resumen()['resolver_ids']
+    assert resumen['ejecuciones'] == 4 and resumen['preparaciones'] == 2 and resumen['aciertos'] == 2
+    print('✅ Sentencias preparadas reutilizadas')
+
+def test_limite_lru():
+    registro = RegistroSentencias(max_por_conexion=2)
+    conexion = ConexionFalsa()
+    registro.ejecutar(conexion, 'a', "SELECT 1")
+    registro.ejecutar(conexion, 'b', "SELECT 2")
+    registro.ejecutar(conexion, 'a', "SELECT 1")
+    # 'b' es la menos usada: se libera para preparar 'c'
+    registro.ejecutar(conexion, 'c', "SELECT 3")
+    assert ("DEALLOCATE etl_b", None) in conexion.enviadas
+    assert list(conexion.connection.info['sentencias_preparadas']) == ['etl_a', 'etl_c']
+    assert registro.resumen()['c']['desalojos'] == 1
+    try:
+        registro.ejecutar(conexion, 'x; DROP TABLE y', "SELECT 1")
+        assert False, "Se esperaba ValueError"
+    except ValueError:
+        pass
+    print('✅ Límite LRU respetado')
+
+def test_sin_preparar():
+    registro = RegistroSentencias(max_por_conexion=0)
+    conexion = ConexionFalsa()
+    registro.ejecutar(conexion, 'checkpoint', "SELECT $2, $1 LIKE 'a%'", ('x', 7))
+    assert conexion.enviadas == [("SELECT %(p2)s, %(p1)s LIKE 'a%%'", {'p1': 'x', 'p2': 7})]
+    assert registro.resumen()['checkpoint']['aciertos'] == 0
+    # SQLite (qmark): un ? por aparición en orden
+    conexion = ConexionFalsa('qmark')
+    registro.ejecutar(conexion, 'ids', "SELECT $2 WHERE a = $1 OR b = $2", ('x', 7))
+    assert conexion.enviadas == [("SELECT ? WHERE a = ? OR b = ?", (7, 'x', 7))]
+    print('✅ Ejecución directa sin preparar')
+
+if __name__ == "__main__":
+    test_prepara_una_vez_por_conexion()
+    test_limite_lru()
+    test_sin_preparar()
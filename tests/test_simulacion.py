@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+import datos_sinteticos
+from cache_etapas import motor_parquet
+from database_connection import DatabaseConnection
+from etl_avaluos import ETLAvaluos, COLUMNAS_VEHICLE_APPRAISAL, COLUMNAS_DEDUCCIONES
+
+def test_simulacion_escribe_parquet_sin_tocar_la_base():
+    if motor_parquet() is None:
+        print('⏭️ pyarrow no instalado: se omite la prueba de la salida de la simulación')
+        return
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        # El ETL escribe etl_lotes.json en el directorio de trabajo
+        os.chdir(directorio)
+        try:
+            db = DatabaseConnection()
+            datos_sinteticos.cargar_mi_tabla(db, 150)
+            db.close_connection()
+            simulada = ETLAvaluos(simulacion=True, tamano_bloque=60, directorio_reportes=None,
+                                  directorio_simulacion=os.path.join(directorio, 'salida'))
+            assert simulada.ejecutar_etl()
+            etapas = simulada.instrumentacion.etapas()
+            avaluos = pd.read_parquet(os.path.join(simulada._salida_simulacion, 'vehicle_appraisal'))
+            deducciones = pd.read_parquet(os.path.join(simulada._salida_simulacion, 'appraisal_deductions'))
+            with sqlite3.connect(ruta) as conexion:
+                en_base = conexion.execute("SELECT COUNT(*) FROM vehicle_appraisal").fetchone()[0]
+            # Una carga real del mismo origen produce las mismas filas
+            assert ETLAvaluos(tamano_bloque=60, directorio_reportes=None).ejecutar_etl()
+            with sqlite3.connect(ruta) as conexion:
+                deducciones_reales = conexion.execute("SELECT COUNT(*) FROM appraisal_deductions").fetchone()[0]
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+    assert en_base == 0
+    assert list(avaluos.columns) == ['vehicle_appraisal_id'] + COLUMNAS_VEHICLE_APPRAISAL
+    assert list(deducciones.columns) == ['appraisal_deduction_id'] + COLUMNAS_DEDUCCIONES
+    assert avaluos['vehicle_appraisal_id'].tolist() == list(range(1, 151))
+    assert deducciones['appraisal_deduction_id'].tolist() == list(range(1, len(deducciones) + 1))
+    assert deducciones['vehicle_appraisal_id'].isin(avaluos['vehicle_appraisal_id']).all()
+    assert len(deducciones) == deducciones_reales
+    # Las mismas etapas que una carga real, con la escritura de los Parquet como carga
+    for etapa in ('extraccion', 'transformacion', 'mapeo_ids', 'deducciones', 'carga_avaluos',
+                  'carga_deducciones', 'verificacion'):
+        assert etapa in etapas, f"falta la etapa {etapa}"
+    assert etapas['carga_avaluos']['llamadas'] == 3 and etapas['verificacion']['filas_salida'] == 150
+    print('✅ Simulación con salida en Parquet e IDs sintéticos')
+
+if __name__ == "__main__":
+    test_simulacion_escribe_parquet_sin_tocar_la_base()
@@ -0,0 +1,40 @@
+import glob
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRUEBAS = os.path.join(RAIZ, 'tests')
+# Scripts de diagnóstico que ejecutan los chequeos de salud del cron
+SCRIPTS_DIAGNOSTICO = sorted(os.path.splitext(os.path.basename(ruta))[0]
+                             for patron in ('verificar_*.py', 'agregar_*.py', 'diagnostico_*.py')
+                             for ruta in glob.glob(os.path.join(PRUEBAS, patron)))
+DEPENDENCIAS_PESADAS = ('pandas', 'numpy', 'sqlalchemy', 'asyncpg', 'dotenv', 'psycopg2')
+# Sin las dependencias pesadas el import ronda los 50 ms; con ellas pasa de 400 ms
+PRESUPUESTO_MS = 200
+
+def medir_importacion(modulo):
+    """Tiempos acumulados (µs) de `python -X importtime -c 'import modulo'` por módulo"""
+    entorno = dict(os.environ, PYTHONPATH=os.pathsep.join([RAIZ, PRUEBAS]))
+    salida = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+                            cwd=RAIZ, env=entorno, capture_output=True, text=True, check=True)
+    tiempos = {}
+    for linea in salida.stderr.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, nombre = linea[len('import time:'):].split('|')
+        tiempos[nombre.strip()] = int(acumulado)
+    return tiempos
+
+def test_importacion_liviana():
+    assert SCRIPTS_DIAGNOSTICO
+    for modulo in ('etl_avaluos', 'database_connection', 'reintentos', 'carga_asincrona', *SCRIPTS_DIAGNOSTICO):
+        tiempos = medir_importacion(modulo)
+        pesados = sorted(m for m in tiempos if m.split('.')[0] in DEPENDENCIAS_PESADAS)
+        assert not pesados, f"{modulo} importa al cargar: {pesados[:5]}"
+        milisegundos = tiempos[modulo] / 1000
+        assert milisegundos < PRESUPUESTO_MS, f"{modulo} tarda {milisegundos:.0f} ms en importarse"
+        print(f"✅ {modulo}: {milisegundos:.0f} ms")
+
+if __name__ == "__main__":
+    test_importacion_liviana()
@@ -0,0 +1,64 @@
+import base_postgresql
+from etl_avaluos import ETLAvaluos, ReferenciasDuplicadas
+
+COLUMNAS_DEDUCCIONES = ('MOTOR1', 'MOTOR_', 'TRANSMISIO', 'TRANSMICIO', 'SUSPENSION', 'CARROCERI2', 'DIRECCION',
+                        'DIRECCION2', 'FRENOS', 'FRENOS2', 'LLANTAS', 'RUEDAS', 'SIST_ELECT', 'SISTELEC2',
+                        'INTERIOR_Y', 'INTYACC2')
+
+def deducciones_de(id_unico):
+    return base_postgresql.consultar("""
+        SELECT count(*) FROM public.appraisal_deductions d
+        JOIN public.vehicle_appraisal v ON v.vehicle_appraisal_id = d.vehicle_appraisal_id
+        WHERE v.referencia_original = :id_unico
+    """, id_unico=id_unico)[0][0]
+
+@base_postgresql.requerida
+def test_upsert_reemplaza_deducciones_aunque_queden_vacias():
+    if not base_postgresql.habilitada('la prueba de upsert'):
+        return
+    base_postgresql.preparar(120)
+    assert ETLAvaluos(modo_carga='upsert', tamano_bloque=50, directorio_reportes=None).ejecutar_etl()
+    id_unico = base_postgresql.consultar("""
+        SELECT v.referencia_original FROM public.appraisal_deductions d
+        JOIN public.vehicle_appraisal v ON v.vehicle_appraisal_id = d.vehicle_appraisal_id
+        ORDER BY 1 LIMIT 1
+    """)[0][0]
+    assert deducciones_de(id_unico) > 0
+    # El registro pierde todas sus deducciones en el origen y se vuelve a cargar solo
+    columnas = ', '.join(f'"{columna}" = NULL' for columna in COLUMNAS_DEDUCCIONES)
+    base_postgresql.ejecutar(f"UPDATE public.mi_tabla SET {columnas} WHERE id_unico = :id_unico", id_unico=id_unico)
+    etl = ETLAvaluos(modo_carga='upsert', ids_origen=[id_unico], directorio_reportes=None)
+    assert etl.ejecutar_etl()
+    avaluos = base_postgresql.consultar("SELECT count(*), count(DISTINCT referencia_original) FROM public.vehicle_appraisal")[0]
+    assert deducciones_de(id_unico) == 0
+    assert avaluos == (120, 120)
+    print('✅ El upsert elimina las deducciones de un avalúo que ya no tiene')
+
+@base_postgresql.requerida
+def test_upsert_informa_referencias_duplicadas():
+    if not base_postgresql.habilitada('la prueba de referencias duplicadas'):
+        return
+    base_postgresql.preparar(40)
+    base_postgresql.ejecutar("DROP INDEX IF EXISTS public.ux_vehicle_appraisal_referencia_original")
+    # Dos cargas append dejan cada referencia_original repetida
+    assert ETLAvaluos(directorio_reportes=None).ejecutar_etl()
+    assert ETLAvaluos(directorio_reportes=None).ejecutar_etl()
+    etl = ETLAvaluos(modo_carga='upsert', directorio_reportes=None)
+    assert etl.conectar_base_datos()
+    with etl.db_connection.get_engine().begin() as conexion:
+        try:
+            etl.asegurar_indice_unico_referencia(conexion)
+        except ReferenciasDuplicadas as error:
+            mensaje = str(error)
+        else:
+            mensaje = None
+    etl.db_connection.close_connection()
+    assert mensaje and '40 referencia_original repetidas' in mensaje
+    # La ejecución upsert completa falla sin cargar nada nuevo
+    assert not ETLAvaluos(modo_carga='upsert', directorio_reportes=None).ejecutar_etl()
+    assert base_postgresql.consultar("SELECT count(*) FROM public.vehicle_appraisal")[0][0] == 80
+    print('✅ El upsert informa las referencia_original duplicadas de cargas anteriores')
+
+if __name__ == "__main__":
+    test_upsert_reemplaza_deducciones_aunque_queden_vacias()
+    test_upsert_informa_referencias_duplicadas()
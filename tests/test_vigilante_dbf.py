@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import struct
+import tempfile
+import datos_sinteticos
+from bloqueo_ejecucion import BloqueoEjecucion
+from vigilante_dbf import VigilanteDBF
+
+def contar(ruta, tabla):
+    with sqlite3.connect(ruta) as conexion:
+        return conexion.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+
+def modificar_registro(ruta_dbf, posicion, texto):
+    """Sobrescribir el inicio del primer campo de un registro, con el mismo tamaño de archivo"""
+    with open(ruta_dbf, 'r+b') as archivo:
+        largo_encabezado, largo_registro = struct.unpack('<HH', archivo.read(12)[8:12])
+        archivo.seek(largo_encabezado + (posicion - 1) * largo_registro + 1)
+        archivo.write(texto.encode('latin-1'))
+    estado = os.stat(ruta_dbf)
+    os.utime(ruta_dbf, ns=(estado.st_atime_ns, estado.st_mtime_ns + 1_000_000_000))
+
+def test_vigilante_carga_solo_registros_nuevos_o_modificados():
+    directorio_original = os.getcwd()
+    anteriores = {v: os.environ.get(v) for v in ('DB_BACKEND', 'DB_SQLITE_PATH')}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'etl.sqlite')
+        ruta_dbf = os.path.join(directorio, 'avaluos.dbf')
+        bloqueo = os.path.join(directorio, 'etl.lock')
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = ruta
+        # El ETL escribe etl_lotes.json en el directorio de trabajo
+        os.chdir(directorio)
+        try:
+            vigilante = VigilanteDBF(ruta_dbf, espera_estable=0, usar_inotify=False, archivo_bloqueo=bloqueo,
+                                     archivo_estado=os.path.join(directorio, 'estado.json'),
+                                     opciones_etl={'directorio_reportes': None})
+            assert vigilante.revisar() == 'sin_cambios'
+            # Una exportación a medio escribir (menos registros que los que declara el encabezado) espera
+            datos_sinteticos.escribir_dbf(ruta_dbf, 100, tamano_bloque=10)
+            with open(ruta_dbf, 'rb') as archivo:
+                completo = archivo.read()
+            with open(ruta_dbf, 'wb') as archivo:
+                archivo.write(completo[:len(completo) // 2])
+            assert vigilante.revisar() == 'esperando'
+            with open(ruta_dbf, 'wb') as archivo:
+                archivo.write(completo)
+            # Con otra ejecución en curso tampoco se procesa
+            with BloqueoEjecucion(bloqueo):
+                assert vigilante.revisar() == 'esperando'
+            assert vigilante.revisar() == 'procesado'
+            primera = (contar(ruta, 'mi_tabla'), contar(ruta, 'vehicle_appraisal'))
+            # Sin cambios el estado se toma de memoria, sin volver a leer etl_vigilante.json
+            lecturas = []
+            leer_estados = vigilante._leer_estados
+            vigilante._leer_estados = lambda: lecturas.append(1) or leer_estados()
+            assert vigilante.revisar() == 'sin_cambios' and vigilante.revisar() == 'sin_cambios'
+            assert lecturas == []
+            vigilante._leer_estados = leer_estados
+            # Nueva exportación: los primeros 100 registros son iguales, se agregan 30
+            datos_sinteticos.escribir_dbf(ruta_dbf, 130, tamano_bloque=10)
+            assert vigilante.revisar() == 'procesado'
+            segunda = (contar(ruta, 'mi_tabla'), contar(ruta, 'vehicle_appraisal'))
+            # Un registro modificado se reemplaza en mi_tabla; en SQLite su avalúo ya cargado no se
+            # recarga y el registro queda marcado como desactualizado
+            modificar_registro(ruta_dbf, 7, 'MODIFICADO')
+            assert vigilante.revisar() == 'procesado'
+            tercera = (contar(ruta, 'mi_tabla'), contar(ruta, 'vehicle_appraisal'))
+            estado = VigilanteDBF(ruta_dbf, archivo_estado=os.path.join(directorio, 'estado.json')).leer_estado()
+            with sqlite3.connect(ruta) as conexion:
+                columna = conexion.execute("SELECT * FROM mi_tabla LIMIT 0").description[0][0]
+                modificado = conexion.execute(f'SELECT "{columna}" FROM mi_tabla WHERE id_unico = 7').fetchone()[0]
+        finally:
+            os.chdir(directorio_original)
+            for variable, valor in anteriores.items():
+                os.environ.pop(variable, None)
+                if valor is not None:
+                    os.environ[variable] = valor
+    assert primera == (100, 100)
+    assert segunda == (130, 130)
+    assert tercera == (130, 130)
+    assert modificado.startswith('MODIFICADO')
+    assert len(estado['registros']) == 130 and estado['pendientes'] == []
+    assert estado['desactualizados'] == [7]
+    print('✅ Vigilante del DBF con carga incremental')
+
+if __name__ == "__main__":
+    test_vigilante_carga_solo_registros_nuevos_o_modificados()
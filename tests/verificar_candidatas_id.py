@@ -3,10 +3,12 @@
 Script para verificar si las columnas candidatas tienen valores únicos
 """
 
-import pandas as pd
 import logging
+from importacion_diferida import importar_diferido
 from database_connection import DatabaseConnection
 
+pd = importar_diferido('pandas')
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -3,11 +3,12 @@
 Script para verificar si hay alguna columna que contenga el NUMERO_CER en vehicle_appraisal
 """
 
-import pandas as pd
 import logging
-from sqlalchemy import text
+from importacion_diferida import importar_diferido
 from database_connection import DatabaseConnection
 
+pd = importar_diferido('pandas')
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -0,0 +1,304 @@
+"""
+Vigilante del DBF de Lotus: espera a que una nueva exportación termine de escribirse,
+detecta qué registros cambiaron y carga solo esos en mi_tabla y vehicle_appraisal.
+- Eventos de inotify (pip install inotify_simple, solo Linux) o, sin él, sondeo periódico
+- Un archivo se procesa cuando su tamaño y mtime no cambian durante `espera_estable`
+  segundos y alcanza el tamaño que declara el encabezado del DBF
+- Tamaño, mtime y SHA-256 del archivo, más un hash por registro, quedan en etl_vigilante.json:
+  un DBF copiado sin cambios no se procesa y uno modificado solo importa los registros
+  nuevos o distintos, que se cargan con un ETL restringido a sus id_unico
+- Cada procesamiento toma el bloqueo de ejecución, así nunca se solapa con otra carga
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from importacion_diferida import importar_diferido
+from bloqueo_ejecucion import ARCHIVO_BLOQUEO, BloqueoEjecucion, EjecucionEnCurso
+from database_connection import DatabaseConnection
+from CrearTablasDesdeLotus import RUTA_DBF, abrir_dbf, actualizar_registros, huella_registro, importar_dbf
+
+try:
+    inotify_simple = importar_diferido('inotify_simple')
+except ImportError:  # dependencia opcional: sin ella se sondea el directorio
+    inotify_simple = None
+
+logger = logging.getLogger(__name__)
+
+pd = importar_diferido('pandas')
+sqlalchemy = importar_diferido('sqlalchemy')
+
+ARCHIVO_ESTADO = 'etl_vigilante.json'
+ESPERA_ESTABLE = 30
+INTERVALO = 10
+ESPERA_REINTENTO = 300
+
+
+def dbf_completo(ruta):
+    """Si el archivo alcanza el tamaño que declara su encabezado (encabezado + registros × largo)"""
+    try:
+        with open(ruta, 'rb') as archivo:
+            encabezado = archivo.read(12)
+            tamano = os.fstat(archivo.fileno()).st_size
+    except OSError:
+        return False
+    if len(encabezado) < 12:
+        return False
+    registros, largo_encabezado, largo_registro = struct.unpack('<IHH', encabezado[4:12])
+    return tamano >= largo_encabezado + registros * largo_registro
+
+
+def sha256_archivo(ruta, tamano_lectura=1 << 20):
+    resumen = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(tamano_lectura), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+
+class VigilanteDBF:
+    """Vigila un DBF y ejecuta importación + ETL incremental cuando cambia"""
+
+    def __init__(self, ruta_dbf=None, espera_estable=ESPERA_ESTABLE, intervalo=INTERVALO,
+                 espera_reintento=ESPERA_REINTENTO, archivo_estado=ARCHIVO_ESTADO,
+                 archivo_bloqueo=ARCHIVO_BLOQUEO, usar_inotify=True, opciones_etl=None):
+        self.ruta_dbf = ruta_dbf or RUTA_DBF
+        self.espera_estable = espera_estable
+        self.intervalo = intervalo
+        self.espera_reintento = espera_reintento
+        self.archivo_estado = archivo_estado
+        self.archivo_bloqueo = archivo_bloqueo
+        self.usar_inotify = usar_inotify
+        # Opciones de ETLAvaluos para las cargas incrementales (tamano_bloque, workers, cargador...)
+        self.opciones_etl = dict(opciones_etl or {})
+        # ((tamaño, mtime), instante desde el que no cambia) de la última observación del archivo
+        self._observado = None
+        self._proximo_reintento = 0.0
+        # Estado del DBF en memoria: el JSON se lee una vez y después solo se escribe
+        self._estado = None
+
+    def _leer_estados(self):
+        try:
+            with open(self.archivo_estado, encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError):
+            return {}
+
+    def leer_estado(self):
+        """
+        Estado guardado del DBF vigilado: archivo procesado, hash por registro, registros pendientes
+        y registros desactualizados (modificados pero no recargados)
+        """
+        if self._estado is None:
+            self._estado = self._leer_estados().get(os.path.abspath(self.ruta_dbf), {})
+        return self._estado
+
+    def _guardar_estado(self, estado):
+        estados = self._leer_estados()
+        estados[os.path.abspath(self.ruta_dbf)] = estado
+        temporal = f"{self.archivo_estado}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(estados, archivo)
+        os.replace(temporal, self.archivo_estado)
+        self._estado = estado
+
+    def revisar(self):
+        """
+        Un ciclo del vigilante. Devuelve 'sin_cambios', 'esperando' (archivo en escritura,
+        otra ejecución en curso o reintento programado), 'procesado' o 'error'
+        """
+        try:
+            stat = os.stat(self.ruta_dbf)
+        except FileNotFoundError:
+            return 'sin_cambios'
+        actual = (stat.st_size, stat.st_mtime_ns)
+        if self._observado is None or self._observado[0] != actual:
+            # Al arrancar, la antigüedad del mtime cuenta como tiempo sin cambios
+            edad = max(0.0, time.time() - stat.st_mtime) if self._observado is None else 0.0
+            self._observado = (actual, time.monotonic() - edad)
+
+        estado = self.leer_estado()
+        procesado = estado.get('archivo', {})
+        cambiado = actual != (procesado.get('tamano'), procesado.get('mtime_ns'))
+        if not cambiado and not estado.get('pendientes'):
+            return 'sin_cambios'
+        if time.monotonic() < self._proximo_reintento:
+            return 'esperando'
+        if cambiado:
+            if time.monotonic() - self._observado[1] < self.espera_estable:
+                return 'esperando'
+            if not dbf_completo(self.ruta_dbf):
+                logger.info(f"⏳ {self.ruta_dbf} aún no tiene todos los registros que declara su encabezado")
+                return 'esperando'
+
+        try:
+            with BloqueoEjecucion(self.archivo_bloqueo):
+                exito = self._procesar(estado, stat)
+        except EjecucionEnCurso as e:
+            logger.info(f"⏳ {e}: se reintenta en el próximo ciclo")
+            return 'esperando'
+        except Exception as e:
+            logger.error(f"❌ Error procesando {self.ruta_dbf}: {e}")
+            exito = False
+        if not exito:
+            # El estado en memoria pudo quedar a medio actualizar: se vuelve a leer el guardado
+            self._estado = None
+            self._proximo_reintento = time.monotonic() + self.espera_reintento
+            logger.warning(f"⚠️ Los registros pendientes se reintentan en {self.espera_reintento} s")
+            return 'error'
+        self._proximo_reintento = 0.0
+        return 'procesado'
+
+    def _linea_base(self, db):
+        """Registros ya importados en mi_tabla y último id_unico cargado en vehicle_appraisal"""
+        with db.get_engine().connect() as conexion:
+            try:
+                importados = conexion.execute(sqlalchemy.text("SELECT count(*) FROM public.mi_tabla")).scalar()
+            except sqlalchemy.exc.SQLAlchemyError:
+                conexion.rollback()
+                importados = 0
+        return importados, self._ultimo_cargado(db)
+
+    def _ultimo_cargado(self, db):
+        with db.get_engine().connect() as conexion:
+            return conexion.execute(sqlalchemy.text(
+                "SELECT coalesce(max(referencia_original), 0) FROM public.vehicle_appraisal")).scalar()
+
+    def _procesar(self, estado, stat):
+        """Importar los registros nuevos o modificados del DBF y cargarlos con un ETL incremental"""
+        archivo = {'tamano': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256_archivo(self.ruta_dbf)}
+        pendientes = set(estado.get('pendientes', []))
+        desactualizados = set(estado.get('desactualizados', []))
+        db = DatabaseConnection()
+        try:
+            if 'registros' in estado and estado.get('archivo', {}).get('sha256') == archivo['sha256']:
+                # Archivo copiado o tocado sin cambios de contenido: solo se reintentan los pendientes
+                logger.info(f"📝 {self.ruta_dbf} cambió de fecha pero no de contenido")
+                estado['archivo'] = archivo
+                self._guardar_estado(estado)
+                return self._cargar_pendientes(estado, db)
+
+            previas = estado.get('registros')
+            if previas is None:
+                importados, cargados = self._linea_base(db)
+                # Sin estado se asume que mi_tabla tiene los primeros registros del DBF; los no cargados quedan pendientes
+                logger.info(f"📌 Sin estado previo de {self.ruta_dbf}: mi_tabla tiene {importados} registros, "
+                            f"vehicle_appraisal llega hasta id_unico {cargados}")
+                pendientes.update(range(cargados + 1, importados + 1))
+                conocidos = importados
+            else:
+                conocidos = len(previas)
+
+            if conocidos == 0:
+                importar_dbf(self.ruta_dbf, db, cargador=self.opciones_etl.get('cargador', 'to_sql'),
+                             tamano_bloque=self.opciones_etl.get('tamano_bloque'))
+                huellas = [huella_registro(registro) for registro in abrir_dbf(self.ruta_dbf)]
+                cambiados = range(1, len(huellas) + 1)
+            else:
+                huellas, filas = [], []
+                for posicion, registro in enumerate(abrir_dbf(self.ruta_dbf), start=1):
+                    huella = huella_registro(registro)
+                    huellas.append(huella)
+                    if posicion > conocidos or (previas is not None and previas[posicion - 1] != huella):
+                        filas.append(dict(registro, id_unico=posicion))
+                eliminar_desde = len(huellas) + 1 if len(huellas) < conocidos else None
+                if eliminar_desde:
+                    logger.warning(f"⚠️ El DBF tiene {conocidos - len(huellas)} registros menos: se quitan de mi_tabla, "
+                                   f"pero sus avalúos quedan en vehicle_appraisal")
+                    pendientes = {i for i in pendientes if i < eliminar_desde}
+                    desactualizados = {i for i in desactualizados if i < eliminar_desde}
+                if filas or eliminar_desde:
+                    actualizar_registros(pd.DataFrame(filas), db, eliminar_desde)
+                cambiados = [fila['id_unico'] for fila in filas]
+
+            logger.info(f"🔎 {self.ruta_dbf}: {len(huellas)} registros, {len(cambiados)} nuevos o modificados")
+            estado = {'archivo': archivo, 'registros': huellas, 'pendientes': sorted(pendientes.union(cambiados)),
+                      'desactualizados': sorted(desactualizados)}
+            self._guardar_estado(estado)
+            return self._cargar_pendientes(estado, db)
+        finally:
+            db.close_connection()
+
+    def _cargar_pendientes(self, estado, db):
+        """
+        ETL de los id_unico pendientes; si termina bien, se vacían los pendientes del estado.
+        En SQLite los ya cargados no se recargan y quedan en `desactualizados`
+        """
+        pendientes = estado.get('pendientes', [])
+        if not pendientes:
+            return True
+        opciones = dict(self.opciones_etl)
+        omitidos = []
+        if db.es_postgresql:
+            # upsert actualiza los avalúos de registros modificados en lugar de duplicarlos
+            opciones.setdefault('modo_carga', 'upsert')
+            ids = pendientes
+        else:
+            cargados = self._ultimo_cargado(db)
+            ids = [i for i in pendientes if i > cargados]
+            omitidos = [i for i in pendientes if i <= cargados]
+            if omitidos:
+                logger.error(f"❌ {len(omitidos)} registros modificados ya estaban cargados y sin upsert (solo "
+                             f"PostgreSQL) no se recargan: vehicle_appraisal queda desactualizado para id_unico "
+                             f"{omitidos[:10]}{'...' if len(omitidos) > 10 else ''} (ver 'desactualizados' en "
+                             f"{self.archivo_estado})")
+        if ids:
+            # Importación diferida: etl_avaluos importa este módulo para el subcomando watch
+            from etl_avaluos import ETLAvaluos
+            logger.info(f"🚚 ETL incremental de {len(ids)} registros")
+            if not ETLAvaluos(ids_origen=ids, **opciones).ejecutar_etl():
+                return False
+        estado['pendientes'] = []
+        estado['desactualizados'] = sorted(set(estado.get('desactualizados', [])).union(omitidos))
+        self._guardar_estado(estado)
+        logger.info(f"✅ {self.ruta_dbf} al día: {len(ids)} registros cargados")
+        return True
+
+    def _abrir_inotify(self):
+        if inotify_simple is None:
+            logger.info("ℹ️ inotify_simple no está instalado: se sondea el archivo (pip install inotify_simple)")
+            return None
+        try:
+            inotify = inotify_simple.INotify()
+            banderas = inotify_simple.flags
+            # Se vigila el directorio para ver también las exportaciones que reemplazan el archivo
+            inotify.add_watch(os.path.dirname(os.path.abspath(self.ruta_dbf)),
+                              banderas.CLOSE_WRITE | banderas.MOVED_TO | banderas.CREATE | banderas.MODIFY)
+            return inotify
+        except OSError as e:
+            logger.warning(f"⚠️ inotify no disponible ({e}): se sondea el archivo")
+            return None
+
+    def _esperar(self, inotify, detener, segundos):
+        if inotify is None:
+            detener.wait(segundos)
+            return
+        # Un evento solo adelanta la revisión; la estabilidad se sigue midiendo por tiempo
+        inotify.read(timeout=int(segundos * 1000), read_delay=500)
+
+    def ejecutar(self, detener=None, una_vez=False):
+        """
+        Vigilar hasta que se active `detener`. Con una_vez termina cuando no queda nada por
+        procesar o tras un error. Devuelve False si el último ciclo terminó con error
+        """
+        detener = detener or threading.Event()
+        inotify = self._abrir_inotify() if self.usar_inotify else None
+        logger.info(f"👀 Vigilando {self.ruta_dbf} ({'inotify' if inotify else f'sondeo cada {self.intervalo} s'}, "
+                    f"estable tras {self.espera_estable} s)")
+        resultado = 'sin_cambios'
+        try:
+            while not detener.is_set():
+                resultado = self.revisar()
+                if una_vez and resultado != 'esperando':
+                    break
+                # Un archivo en escritura se vuelve a revisar al cumplirse la espera de estabilidad
+                espera = min(self.intervalo, max(self.espera_estable, 1)) if resultado == 'esperando' else self.intervalo
+                self._esperar(inotify, detener, espera)
+        finally:
+            if inotify is not None:
+                inotify.close()
+        return resultado != 'error'